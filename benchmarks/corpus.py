@@ -0,0 +1,262 @@
+"""Synthetic specs of different sizes that the benchmarks are run against.
+
+The specs are generated deterministically from a seed, so that the benchmarks
+are reproducible without network access. Write the corpus to disk via::
+
+    python -m benchmarks.corpus --output-dir corpus/
+
+"""
+
+import argparse
+import datetime
+import os
+import random
+from dataclasses import dataclass
+
+from tests.data import NOTMUCH_SPEC
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+
+_WORDS = (
+    "build",
+    "fix",
+    "update",
+    "drop",
+    "patch",
+    "upstream",
+    "regression",
+    "crash",
+    "memory",
+    "leak",
+    "parser",
+    "plugin",
+    "tests",
+    "documentation",
+    "dependency",
+    "license",
+)
+
+_SCRIPTLETS = ("%post", "%postun", "%pre", "%preun", "%posttrans")
+
+
+@dataclass(frozen=True)
+class SpecShape:
+    """How many of each construct a generated spec contains."""
+
+    subpackages: int = 2
+    #: scriptlets per (sub)package
+    scriptlets: int = 1
+    globals: int = 5
+    #: number of conditional blocks in the preamble and their nesting depth
+    conditionals: int = 2
+    conditional_depth: int = 1
+    #: entries in the %files section of every (sub)package
+    files: int = 5
+    changelog_entries: int = 10
+
+
+def _changelog_date(date: datetime.date) -> str:
+    # do not use strftime, its output depends on the locale
+    return (
+        f"{_WEEKDAYS[date.weekday()]} {_MONTHS[date.month - 1]} "
+        f"{date.day:02d} {date.year}"
+    )
+
+
+class _SpecWriter:
+    def __init__(self, shape: SpecShape, seed: int) -> None:
+        self.shape = shape
+        self.rng = random.Random(seed)
+        self.lines: list[str] = []
+
+    def sentence(self, words: int = 6) -> str:
+        return " ".join(self.rng.choice(_WORDS) for _ in range(words)).capitalize()
+
+    def global_name(self) -> str:
+        return f"%{{g_{self.rng.randrange(max(self.shape.globals, 1))}}}"
+
+    def conditional(self, index: int, depth: int) -> None:
+        self.lines.append(f"%if 0%{{?with_feature{index}_{depth}}}")
+        self.lines.append(f"BuildRequires:  pkgconfig(feature{index}-{depth})")
+        if depth < self.shape.conditional_depth:
+            self.conditional(index, depth + 1)
+        self.lines.append("%else")
+        self.lines.append(f"BuildRequires:  feature{index}-{depth}-devel")
+        self.lines.append("%endif")
+
+    def preamble(self) -> None:
+        self.lines.extend(
+            f"%global g_{i} {self.rng.randrange(1000)}.{i}"
+            for i in range(self.shape.globals)
+        )
+        self.lines.extend(
+            [
+                "Name:           synthetic",
+                "Version:        1.0",
+                "Release:        0",
+                f"Summary:        {self.sentence()}",
+                "License:        MIT",
+                "URL:            https://example.com/synthetic",
+                "Source0:        %{name}-%{version}.tar.gz",
+                "BuildRequires:  gcc",
+            ]
+        )
+        for i in range(self.shape.conditionals):
+            self.conditional(i, 1)
+
+        self.lines.extend(["", "%description", self.sentence(12), ""])
+
+        for i in range(self.shape.subpackages):
+            self.lines.extend(
+                [
+                    f"%package        sub{i}",
+                    f"Summary:        {self.sentence()}",
+                    "Requires:       %{name} = %{version}",
+                    "",
+                    f"%description    sub{i}",
+                    f"{self.sentence(12)} {self.global_name()}",
+                    "",
+                ]
+            )
+
+    def build_sections(self) -> None:
+        self.lines.extend(
+            [
+                "%prep",
+                "%autosetup -p1",
+                "",
+                "%build",
+                "%configure",
+                "%make_build",
+                "",
+                "%install",
+                "%make_install",
+                "",
+            ]
+        )
+
+    def scriptlets(self, package_suffix: str) -> None:
+        for i in range(self.shape.scriptlets):
+            self.lines.extend(
+                [
+                    f"{_SCRIPTLETS[i % len(_SCRIPTLETS)]}{package_suffix}",
+                    f"echo {self.global_name()} >/dev/null",
+                    "",
+                ]
+            )
+
+    def files(self, package_suffix: str, package_name: str) -> None:
+        self.lines.append(f"%files{package_suffix}")
+        self.lines.extend(
+            f"%{{_datadir}}/{package_name}/file{i}" for i in range(self.shape.files)
+        )
+        self.lines.append("")
+
+    def changelog(self) -> None:
+        self.lines.append("%changelog")
+        date = datetime.date(2024, 1, 1)
+        for i in range(self.shape.changelog_entries, 0, -1):
+            self.lines.extend(
+                [
+                    f"* {_changelog_date(date)} Packager <packager@example.com>"
+                    f" - 1.{i}-0",
+                    f"- {self.sentence()}",
+                    "",
+                ]
+            )
+            # entries have to be in descending chronological order
+            date -= datetime.timedelta(days=self.rng.randint(0, 3))
+
+    def write(self) -> str:
+        self.preamble()
+        self.build_sections()
+
+        packages = [("", "synthetic")] + [
+            (f" sub{i}", f"synthetic-sub{i}") for i in range(self.shape.subpackages)
+        ]
+        for suffix, _ in packages:
+            self.scriptlets(suffix)
+        for suffix, name in packages:
+            self.files(suffix, name)
+
+        self.changelog()
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_spec(shape: SpecShape, seed: int = 0) -> str:
+    """Generate a spec containing the constructs in ``shape``, the same
+    ``shape`` and ``seed`` always result in the same spec.
+
+    """
+    return _SpecWriter(shape, seed).write()
+
+
+#: name → shape of the generated specs that are benchmarked
+SHAPES: dict[str, SpecShape] = {
+    "medium": SpecShape(
+        subpackages=10,
+        scriptlets=2,
+        globals=20,
+        conditionals=5,
+        conditional_depth=2,
+        files=20,
+        changelog_entries=100,
+    ),
+    "large": SpecShape(
+        subpackages=100,
+        scriptlets=2,
+        globals=100,
+        conditionals=20,
+        conditional_depth=3,
+        files=50,
+        changelog_entries=1_000,
+    ),
+    # ~100k lines
+    "huge": SpecShape(
+        subpackages=300,
+        scriptlets=3,
+        globals=500,
+        conditionals=50,
+        conditional_depth=5,
+        files=200,
+        changelog_entries=10_000,
+    ),
+}
+
+#: name → contents of the specs that are benchmarked
+CORPUS: dict[str, str] = {
+    "small": NOTMUCH_SPEC,
+    **{name: generate_spec(shape) for name, shape in SHAPES.items()},
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write the benchmark corpus")
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for the generated specs"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, shape in SHAPES.items():
+        with open(os.path.join(args.output_dir, f"{name}.spec"), "w") as spec:
+            spec.write(generate_spec(shape, args.seed))
+
+
+if __name__ == "__main__":
+    main()
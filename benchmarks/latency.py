@@ -0,0 +1,353 @@
+"""Measure the latency and the allocations of the LSP requests over specs of
+different sizes.
+
+Run the benchmarks and store the results as JSON::
+
+    python -m benchmarks.latency run --output results.json
+
+and compare them against a stored baseline::
+
+    python -m benchmarks.latency compare baseline.json results.json
+
+The client and the server run in the same process (connected via pipes), so
+the measured latencies include the (de)serialization of the messages. The
+notifications (``didOpen`` & ``didChange``) are timed until the server has
+processed them and rpm has analyzed the new contents, which is waited for via a
+request that only the benchmarks register (``didChange`` then does not wait
+for the delay before the analysis).
+
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from lsprotocol.types import (
+    TEXT_DOCUMENT_COMPLETION,
+    TEXT_DOCUMENT_DEFINITION,
+    TEXT_DOCUMENT_DID_CHANGE,
+    TEXT_DOCUMENT_DID_CLOSE,
+    TEXT_DOCUMENT_DID_OPEN,
+    TEXT_DOCUMENT_DOCUMENT_SYMBOL,
+    TEXT_DOCUMENT_HOVER,
+    CompletionParams,
+    DefinitionParams,
+    DidChangeTextDocumentParams,
+    DidCloseTextDocumentParams,
+    DidOpenTextDocumentParams,
+    DocumentSymbolParams,
+    HoverParams,
+    Position,
+    TextDocumentContentChangeWholeDocument,
+    TextDocumentIdentifier,
+    TextDocumentItem,
+    VersionedTextDocumentIdentifier,
+)
+from pygls.lsp.server import LanguageServer
+from rpm_spec_language_server.macros import macro_occurrences_in_line
+from rpm_spec_language_server.server import RpmSpecLanguageServer
+from tests.client_server import ClientServer
+
+from benchmarks.corpus import CORPUS
+
+#: timeout for a single request in seconds
+_TIMEOUT = 60
+
+#: relative slowdown of the median that is reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+
+#: request that is answered once rpm analyzed all open documents
+_ANALYZED_REQUEST = "benchmarks/analyzed"
+
+
+def _register_analyzed_request(server: RpmSpecLanguageServer) -> None:
+    @server.feature(_ANALYZED_REQUEST)
+    async def wait_for_analysis(server: RpmSpecLanguageServer, params: Any) -> None:
+        for uri in list(server.open_documents):
+            await server.ensure_semantic_analysis(uri)
+
+
+def _wait_until_processed(client: LanguageServer) -> None:
+    # messages are processed in order, so once this request has been answered,
+    # all previously sent notifications have been handled and the analyses that
+    # they started are done
+    client.protocol.send_request(_ANALYZED_REQUEST, None).result(timeout=_TIMEOUT)
+
+
+def _request(client: LanguageServer, method: str, params: Any) -> None:
+    client.protocol.send_request(method, params).result(timeout=_TIMEOUT)
+
+
+def request_positions(spec: str) -> dict[str, Position]:
+    """Find the positions in ``spec`` at which the requests are sent."""
+    lines = spec.splitlines()
+    package = next(i for i, line in enumerate(lines) if line.startswith("%package"))
+    prep = next(i for i, line in enumerate(lines) if line.startswith("%prep"))
+    macro = next(
+        occurrence
+        for i, line in enumerate(lines)
+        if not line.startswith("#")
+        for occurrence in macro_occurrences_in_line(line, i)
+        if not occurrence.is_definition and occurrence.name not in ("global", "define")
+    )
+
+    return {
+        "in_package": Position(line=package + 1, character=0),
+        "outside_package": Position(line=prep + 1, character=0),
+        "macro": Position(line=macro.line, character=macro.start),
+    }
+
+
+class SpecBenchmark:
+    """Runs all operations against a single spec."""
+
+    def __init__(self, client: LanguageServer, name: str, spec: str) -> None:
+        self.client = client
+        self.spec = spec
+        self.uri = f"file:///benchmarks/{name}.spec"
+        self.positions = request_positions(spec)
+        self._version = 0
+
+    def _unique_text(self) -> str:
+        # every open/change gets different contents so that they are not served
+        # from the parse cache
+        self._version += 1
+        return f"{self.spec}\n# revision {self._version}\n"
+
+    def did_open(self) -> None:
+        self.client.protocol.notify(
+            TEXT_DOCUMENT_DID_CLOSE,
+            DidCloseTextDocumentParams(
+                text_document=TextDocumentIdentifier(uri=self.uri)
+            ),
+        )
+        self.client.protocol.notify(
+            TEXT_DOCUMENT_DID_OPEN,
+            DidOpenTextDocumentParams(
+                text_document=TextDocumentItem(
+                    uri=self.uri,
+                    language_id="rpmspec",
+                    version=self._version,
+                    text=self._unique_text(),
+                )
+            ),
+        )
+        _wait_until_processed(self.client)
+
+    def did_change(self) -> None:
+        self.client.protocol.notify(
+            TEXT_DOCUMENT_DID_CHANGE,
+            DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(
+                    uri=self.uri, version=self._version + 1
+                ),
+                content_changes=[
+                    TextDocumentContentChangeWholeDocument(text=self._unique_text())
+                ],
+            ),
+        )
+        _wait_until_processed(self.client)
+
+    def completion(self, position: str) -> None:
+        _request(
+            self.client,
+            TEXT_DOCUMENT_COMPLETION,
+            CompletionParams(
+                text_document=TextDocumentIdentifier(uri=self.uri),
+                position=self.positions[position],
+            ),
+        )
+
+    def hover(self) -> None:
+        _request(
+            self.client,
+            TEXT_DOCUMENT_HOVER,
+            HoverParams(
+                text_document=TextDocumentIdentifier(uri=self.uri),
+                position=self.positions["macro"],
+            ),
+        )
+
+    def definition(self) -> None:
+        _request(
+            self.client,
+            TEXT_DOCUMENT_DEFINITION,
+            DefinitionParams(
+                text_document=TextDocumentIdentifier(uri=self.uri),
+                position=self.positions["macro"],
+            ),
+        )
+
+    def document_symbol(self) -> None:
+        _request(
+            self.client,
+            TEXT_DOCUMENT_DOCUMENT_SYMBOL,
+            DocumentSymbolParams(text_document=TextDocumentIdentifier(uri=self.uri)),
+        )
+
+    def operations(self) -> dict[str, Callable[[], None]]:
+        return {
+            "didOpen": self.did_open,
+            "didChange": self.did_change,
+            "completion (%package)": lambda: self.completion("in_package"),
+            "completion (outside %package)": lambda: self.completion("outside_package"),
+            "hover": self.hover,
+            "definition": self.definition,
+            "documentSymbol": self.document_symbol,
+        }
+
+
+def summarize(durations: list[float], peak_allocated: int) -> dict[str, Any]:
+    durations = sorted(durations)
+    return {
+        "samples": len(durations),
+        "min": durations[0],
+        "median": statistics.median(durations),
+        "mean": statistics.fmean(durations),
+        "p95": durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+        "peakAllocatedBytes": peak_allocated,
+    }
+
+
+def run_benchmarks(
+    iterations: int, spec_names: Optional[list[str]] = None
+) -> dict[str, Any]:
+    """Run every operation ``iterations`` times against the specs
+    ``spec_names`` (defaults to the whole corpus).
+
+    The allocations are measured in a separate run of every operation, as
+    tracing them slows everything down considerably.
+
+    """
+    client_server = ClientServer()
+    _register_analyzed_request(client_server.server)
+    client_server.start()
+    client, _ = client_server
+
+    results: dict[str, dict[str, Any]] = {}
+    try:
+        for name in spec_names or list(CORPUS):
+            benchmark = SpecBenchmark(client, name, CORPUS[name])
+            benchmark.did_open()
+            results[name] = {}
+
+            for op_name, operation in benchmark.operations().items():
+                durations = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    operation()
+                    durations.append(time.perf_counter() - start)
+
+                tracemalloc.start()
+                try:
+                    operation()
+                    _, peak_allocated = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+
+                results[name][op_name] = summarize(durations, peak_allocated)
+                print(
+                    f"{name:>8} {op_name:<30} "
+                    f"median: {results[name][op_name]['median'] * 1000:9.2f} ms",
+                    file=sys.stderr,
+                )
+    finally:
+        client_server.stop()
+
+    return {
+        "metadata": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare_results(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    threshold: float = REGRESSION_THRESHOLD,
+) -> list[tuple[str, str, float]]:
+    """Return the spec, the operation and the relative change of the median of
+    every benchmark that got slower than ``threshold``.
+
+    Benchmarks that are only in one of the results are ignored.
+
+    """
+    regressions = []
+
+    for spec, operations in current["benchmarks"].items():
+        for op_name, result in operations.items():
+            if (
+                base := baseline["benchmarks"].get(spec, {}).get(op_name)
+            ) is None or not base["median"]:
+                continue
+
+            if (change := result["median"] / base["median"] - 1) > threshold:
+                regressions.append((spec, op_name, change))
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument(
+        "--iterations", type=int, default=20, help="Repetitions of every request"
+    )
+    run_parser.add_argument(
+        "--spec",
+        action="append",
+        choices=list(CORPUS),
+        help="Only benchmark this spec, can be passed multiple times",
+    )
+    run_parser.add_argument(
+        "--output", type=str, help="Write the results into this file"
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare results against a baseline"
+    )
+    compare_parser.add_argument("baseline", type=str)
+    compare_parser.add_argument("current", type=str)
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Relative slowdown of the median that is reported as a regression",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.iterations, args.spec)
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(results, output, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+        return
+
+    with open(args.baseline) as baseline, open(args.current) as current:
+        regressions = compare_results(
+            json.load(baseline), json.load(current), args.threshold
+        )
+
+    for spec, op_name, change in regressions:
+        print(f"{spec}: {op_name} is {change:.0%} slower")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""Put a server in TCP mode under load from many concurrent clients.
+
+Launch a server with ``--multi-session`` and run 20 concurrent sessions for a
+minute::
+
+    python -m benchmarks.load --sessions 20 --duration 60
+
+or put an already running server under load::
+
+    python -m benchmarks.load --connect 127.0.0.1:2087 --server-pid 1234
+
+Every session opens a spec of the benchmark corpus and then runs a scripted
+workload of edits, hovers and completions in a loop. The throughput, the
+latency percentiles per request and the resident memory of the server over
+time are reported, slow hovers and completions while other sessions edit
+their specs point to head-of-line blocking in the event loop.
+
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from itertools import count
+from typing import Any, Optional
+
+from lsprotocol.types import (
+    EXIT,
+    INITIALIZE,
+    INITIALIZED,
+    SHUTDOWN,
+    TEXT_DOCUMENT_COMPLETION,
+    TEXT_DOCUMENT_DID_CHANGE,
+    TEXT_DOCUMENT_DID_OPEN,
+    TEXT_DOCUMENT_HOVER,
+)
+
+from benchmarks.corpus import CORPUS
+from benchmarks.latency import request_positions, summarize
+
+#: the steps that every session runs in a loop
+WORKLOADS: dict[str, tuple[str, ...]] = {
+    "mixed": ("edit", "hover", "completion", "hover", "completion"),
+    "edit": ("edit",),
+    "hover": ("hover",),
+    "completion": ("completion",),
+}
+
+#: interval in which the memory usage of the server is sampled in seconds
+_RSS_INTERVAL = 1.0
+
+#: how long to wait for the server to accept connections in seconds
+_STARTUP_TIMEOUT = 60
+
+
+def rss_of(pid: int) -> Optional[int]:
+    """Resident memory of the process ``pid`` in bytes (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Session:
+    """A minimal LSP client that talks JSON-RPC over a TCP connection."""
+
+    def __init__(
+        self,
+        index: int,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        spec: str,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.spec = spec
+        self.uri = f"file:///load/session{index}.spec"
+        self.positions = request_positions(spec)
+        self.version = 0
+        self._ids = count()
+        self._responses: dict[int, asyncio.Future[Any]] = {}
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def _receive(self) -> None:
+        while True:
+            content_length = 0
+            while (header := await self.reader.readline()).strip():
+                name, _, value = header.decode().partition(":")
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            if not header or not content_length:
+                return
+
+            message = json.loads(await self.reader.readexactly(content_length))
+            if "method" in message:
+                # answer requests of the server (e.g. capability registrations)
+                if "id" in message:
+                    await self._write(
+                        {"jsonrpc": "2.0", "id": message["id"], "result": None}
+                    )
+            elif (future := self._responses.pop(message.get("id"), None)) is not None:
+                future.set_result(message)
+
+    async def _write(self, message: Any) -> None:
+        body = json.dumps(message).encode()
+        self.writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+
+    async def request(self, method: str, params: Any = None) -> Any:
+        msg_id = next(self._ids)
+        self._responses[msg_id] = future = asyncio.get_running_loop().create_future()
+        await self._write(
+            {"jsonrpc": "2.0", "id": msg_id, "method": method, "params": params}
+        )
+        return await future
+
+    async def notify(self, method: str, params: Any = None) -> None:
+        await self._write({"jsonrpc": "2.0", "method": method, "params": params})
+
+    async def initialize(self) -> None:
+        await self.request(
+            INITIALIZE,
+            {"processId": os.getpid(), "rootUri": None, "capabilities": {}},
+        )
+        await self.notify(INITIALIZED, {})
+        await self.notify(
+            TEXT_DOCUMENT_DID_OPEN,
+            {
+                "textDocument": {
+                    "uri": self.uri,
+                    "languageId": "rpmspec",
+                    "version": self.version,
+                    "text": self.spec,
+                }
+            },
+        )
+
+    def _position(self, name: str) -> dict[str, int]:
+        position = self.positions[name]
+        return {"line": position.line, "character": position.character}
+
+    async def step(self, name: str) -> None:
+        document = {"uri": self.uri}
+
+        if name == "edit":
+            self.version += 1
+            await self.notify(
+                TEXT_DOCUMENT_DID_CHANGE,
+                {
+                    "textDocument": {**document, "version": self.version},
+                    "contentChanges": [
+                        {"text": f"{self.spec}\n# revision {self.version}\n"}
+                    ],
+                },
+            )
+        elif name == "hover":
+            await self.request(
+                TEXT_DOCUMENT_HOVER,
+                {"textDocument": document, "position": self._position("macro")},
+            )
+        elif name == "completion":
+            await self.request(
+                TEXT_DOCUMENT_COMPLETION,
+                {"textDocument": document, "position": self._position("in_package")},
+            )
+        else:
+            raise ValueError(f"Unknown workload step {name}")
+
+    async def close(self) -> None:
+        await self.request(SHUTDOWN)
+        await self.notify(EXIT)
+        self._receiver.cancel()
+        self.writer.close()
+
+
+class LoadTest:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        sessions: int,
+        duration: float,
+        workload: tuple[str, ...],
+        spec: str,
+        think_time: float,
+        server_pid: Optional[int],
+    ) -> None:
+        self.host, self.port = host, port
+        self.sessions = sessions
+        self.duration = duration
+        self.workload = workload
+        self.spec = spec
+        self.think_time = think_time
+        self.server_pid = server_pid
+        #: step name → latencies in seconds
+        self.durations: dict[str, list[float]] = {}
+        #: seconds since the start of the load test & resident memory in bytes
+        self.rss: list[tuple[float, int]] = []
+
+    async def _run_session(self, index: int, deadline: float) -> None:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        session = Session(index, reader, writer, self.spec)
+        await session.initialize()
+
+        while time.monotonic() < deadline:
+            for step in self.workload:
+                start = time.perf_counter()
+                await session.step(step)
+                # edits are notifications that are not answered
+                if step != "edit":
+                    self.durations.setdefault(step, []).append(
+                        time.perf_counter() - start
+                    )
+                if self.think_time:
+                    await asyncio.sleep(self.think_time)
+
+        await session.close()
+
+    async def _sample_rss(self, start: float) -> None:
+        if self.server_pid is None:
+            return
+        while True:
+            if (rss := rss_of(self.server_pid)) is not None:
+                self.rss.append((time.monotonic() - start, rss))
+            await asyncio.sleep(_RSS_INTERVAL)
+
+    async def run(self) -> float:
+        """Run the load test and return how long it took in seconds."""
+        start = time.monotonic()
+        sampler = asyncio.create_task(self._sample_rss(start))
+        try:
+            await asyncio.gather(
+                *(
+                    self._run_session(index, start + self.duration)
+                    for index in range(self.sessions)
+                )
+            )
+        finally:
+            sampler.cancel()
+        return time.monotonic() - start
+
+    def results(self, elapsed: float) -> dict[str, Any]:
+        return {
+            "metadata": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "sessions": self.sessions,
+                "workload": list(self.workload),
+                "duration": elapsed,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "throughput": sum(map(len, self.durations.values())) / elapsed,
+            "benchmarks": {
+                "load": {
+                    step: summarize(durations, 0)
+                    for step, durations in sorted(self.durations.items())
+                }
+            },
+            "rss": self.rss,
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def _wait_for_server(host: str, port: int, server: subprocess.Popen[bytes]) -> None:
+    deadline = time.monotonic() + _STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with {server.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"The server did not listen on {host}:{port}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument(
+        "--duration", type=float, default=30, help="Duration in seconds"
+    )
+    parser.add_argument("--workload", choices=list(WORKLOADS), default="mixed")
+    parser.add_argument("--spec", choices=list(CORPUS), default="medium")
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0.0,
+        help="Pause of every session between two steps in seconds",
+    )
+    parser.add_argument(
+        "--connect",
+        type=str,
+        metavar="HOST:PORT",
+        help="Connect to a running server instead of launching one, the server "
+        "has to run with --multi-session",
+    )
+    parser.add_argument(
+        "--server-pid", type=int, help="Sample the memory usage of this process"
+    )
+    parser.add_argument("--output", type=str, help="Write the results into this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(":")
+        server_pid = args.server_pid
+    else:
+        host, port = "127.0.0.1", str(_free_port())
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "rpm_spec_language_server",
+                "--multi-session",
+                "--host",
+                host,
+                "--port",
+                port,
+            ]
+        )
+        server_pid = server.pid
+        _wait_for_server(host, int(port), server)
+
+    load_test = LoadTest(
+        host,
+        int(port),
+        args.sessions,
+        args.duration,
+        WORKLOADS[args.workload],
+        CORPUS[args.spec],
+        args.think_time,
+        server_pid,
+    )
+    try:
+        elapsed = asyncio.run(load_test.run())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = load_test.results(elapsed)
+    print(f"{results['throughput']:.1f} requests/s", file=sys.stderr)
+    for step, summary in results["benchmarks"]["load"].items():
+        print(
+            f"{step:<12} median: {summary['median'] * 1000:8.2f} ms, "
+            f"p95: {summary['p95'] * 1000:8.2f} ms",
+            file=sys.stderr,
+        )
+    if load_test.rss:
+        print(
+            f"server RSS: {max(rss for _, rss in load_test.rss) / 2**20:.1f} MiB max",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
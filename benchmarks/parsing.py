@@ -0,0 +1,99 @@
+"""Measure how long it takes to parse the specs of the benchmark corpus
+without going through the LSP.
+
+Run the benchmarks and store the results as JSON::
+
+    python -m benchmarks.parsing --output results.json
+
+The results can be compared with ``python -m benchmarks.latency compare``.
+
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.util import spec_from_text
+
+from benchmarks.corpus import CORPUS
+from benchmarks.latency import summarize
+
+
+def _operations(name: str, contents: str) -> dict[str, Callable[[], Any]]:
+    if (spec := spec_from_text(contents, f"{name}.spec")) is None:
+        raise ValueError(f"The spec {name} cannot be parsed")
+
+    return {
+        "spec_from_text": lambda: spec_from_text(contents, f"{name}.spec"),
+        "SpecSections.parse": lambda: SpecSections.parse(spec),
+    }
+
+
+def run_benchmarks(
+    iterations: int, spec_names: Optional[list[str]] = None
+) -> dict[str, Any]:
+    results: dict[str, dict[str, Any]] = {}
+
+    for name in spec_names or list(CORPUS):
+        results[name] = {}
+        for op_name, operation in _operations(name, CORPUS[name]).items():
+            durations = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                operation()
+                durations.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            try:
+                operation()
+                _, peak_allocated = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            results[name][op_name] = summarize(durations, peak_allocated)
+            print(
+                f"{name:>8} {op_name:<20} "
+                f"median: {results[name][op_name]['median'] * 1000:9.2f} ms",
+                file=sys.stderr,
+            )
+
+    return {
+        "metadata": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "benchmarks": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--iterations", type=int, default=10, help="Repetitions of every operation"
+    )
+    parser.add_argument(
+        "--spec",
+        action="append",
+        choices=list(CORPUS),
+        help="Only benchmark this spec, can be passed multiple times",
+    )
+    parser.add_argument("--output", type=str, help="Write the results into this file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.iterations, args.spec)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Replay a session that was recorded with ``rpm_lsp_server --record FILE``
+and report the latency of the requests.
+
+Replay a recording at the original speed::
+
+    python -m benchmarks.replay session.jsonl
+
+or ten times faster (``--speed 0`` sends the messages without any delay)::
+
+    python -m benchmarks.replay --speed 10 session.jsonl
+
+The requests of the server to the client are answered with ``null``, the
+answers that were recorded from the client are not replayed. The results
+have the same format as the ones of the latency benchmarks and can thus be
+compared with ``python -m benchmarks.latency compare``.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from typing import IO, Any, Optional
+
+from lsprotocol.types import EXIT, SHUTDOWN
+from rpm_spec_language_server.recording import FROM_CLIENT, read_recording
+from rpm_spec_language_server.server import create_rpm_lang_server
+
+from benchmarks.latency import summarize
+
+#: how long to wait for the outstanding responses after the replay in seconds
+_TIMEOUT = 60
+
+#: JSON-RPC error code of cancelled requests
+_REQUEST_CANCELLED = -32800
+
+
+def _write_message(writer: IO[bytes], lock: threading.Lock, message: Any) -> None:
+    body = json.dumps(message).encode()
+    with lock:
+        writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        writer.flush()
+
+
+def _read_messages(reader: IO[bytes]) -> Iterator[Any]:
+    while True:
+        content_length = 0
+        while (header := reader.readline()).strip():
+            name, _, value = header.decode().partition(":")
+            if name.lower() == "content-length":
+                content_length = int(value)
+
+        if not header or not content_length:
+            return
+
+        yield json.loads(reader.read(content_length))
+
+
+class Replay:
+    """Replays the client messages of a recording against a fresh server."""
+
+    def __init__(self, speed: float = 1.0) -> None:
+        self.speed = speed
+        #: request id → method & time at which it was sent
+        self.pending: dict[Any, tuple[str, float]] = {}
+        self.durations: dict[str, list[float]] = {}
+        self.cancelled = 0
+        self._all_answered = threading.Event()
+        self._lock = threading.Lock()
+
+        client_to_server, self._server_in = os.pipe()
+        self._server_out, server_to_client = os.pipe()
+        self._writer = os.fdopen(self._server_in, "wb")
+
+        self.server = create_rpm_lang_server()
+        self.server_thread = threading.Thread(
+            target=self.server.start_io,
+            args=(os.fdopen(client_to_server, "rb"), os.fdopen(server_to_client, "wb")),
+            daemon=True,
+        )
+        self.reader_thread = threading.Thread(
+            target=self._read_server_messages, daemon=True
+        )
+
+    def _send(self, message: Any) -> None:
+        if "id" in message and "method" in message:
+            with self._lock:
+                self.pending[message["id"]] = (message["method"], time.perf_counter())
+                self._all_answered.clear()
+        _write_message(self._writer, self._lock, message)
+
+    def _read_server_messages(self) -> None:
+        for message in _read_messages(os.fdopen(self._server_out, "rb")):
+            if "method" in message:
+                if "id" in message:
+                    _write_message(
+                        self._writer,
+                        self._lock,
+                        {"jsonrpc": "2.0", "id": message["id"], "result": None},
+                    )
+                continue
+
+            received = time.perf_counter()
+            with self._lock:
+                if (request := self.pending.pop(message.get("id"), None)) is None:
+                    continue
+                if not self.pending:
+                    self._all_answered.set()
+
+            method, sent = request
+            if message.get("error", {}).get("code") == _REQUEST_CANCELLED:
+                self.cancelled += 1
+            else:
+                self.durations.setdefault(method, []).append(received - sent)
+
+    def run(self, recording: IO[str]) -> None:
+        self.server_thread.start()
+        self.reader_thread.start()
+
+        start = time.perf_counter()
+        for timestamp, direction, message in read_recording(recording):
+            # the answers to requests of the server are sent by the reader, the
+            # session is ended below once everything has been answered
+            if direction != FROM_CLIENT or "method" not in message:
+                continue
+            if message["method"] in (SHUTDOWN, EXIT):
+                continue
+
+            if (
+                self.speed
+                and (delay := start + timestamp / self.speed - time.perf_counter()) > 0
+            ):
+                time.sleep(delay)
+            self._send(message)
+
+        with self._lock:
+            if not self.pending:
+                self._all_answered.set()
+        if not self._all_answered.wait(_TIMEOUT):
+            print(f"{len(self.pending)} requests were not answered", file=sys.stderr)
+
+        self._send({"jsonrpc": "2.0", "id": "replay-shutdown", "method": SHUTDOWN})
+        self._all_answered.wait(_TIMEOUT)
+        self.durations.pop(SHUTDOWN, None)
+        self._send({"jsonrpc": "2.0", "method": EXIT})
+        self.server_thread.join(_TIMEOUT)
+
+    def results(self) -> dict[str, Any]:
+        return {
+            "metadata": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "speed": self.speed,
+                "cancelled": self.cancelled,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "benchmarks": {
+                "replay": {
+                    method: summarize(durations, 0)
+                    for method, durations in sorted(self.durations.items())
+                }
+            },
+        }
+
+
+def _percentile(durations: list[float], percentile: float) -> float:
+    durations = sorted(durations)
+    return durations[min(len(durations) - 1, int(percentile * len(durations)))]
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", type=str)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay this many times faster than recorded, 0 for no delays",
+    )
+    parser.add_argument("--output", type=str, help="Write the results into this file")
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.speed)
+    with open(args.recording) as recording:
+        replay.run(recording)
+
+    print(f"{'method':<40} {'count':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for method, durations in sorted(replay.durations.items()):
+        print(
+            f"{method:<40} {len(durations):>6} "
+            + " ".join(
+                f"{_percentile(durations, p) * 1000:7.2f}ms" for p in (0.5, 0.9, 0.99)
+            )
+            + f" {max(durations) * 1000:7.2f}ms"
+        )
+    if replay.cancelled:
+        print(f"{replay.cancelled} requests were cancelled")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(replay.results(), output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Check specs without an editor, e.g. in the CI of a distribution::
+
+    rpm_lsp_server check --jobs 8 packages/
+
+Every spec is parsed in a pool of worker processes and one JSON record per spec
+is written to stdout as soon as it has been checked, with the keys ``path``,
+``ok``, ``parsed``, ``duration`` (in seconds), ``sections``, ``tags`` and
+``diagnostics`` (in the format of the Language Server Protocol). A summary of
+the timings is written to stderr.
+
+The exit code is ``0`` if all specs are fine, ``1`` if at least one spec failed
+to parse or has errors and ``2`` if no spec was found.
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Optional
+
+from lsprotocol import converters
+from lsprotocol.types import DiagnosticSeverity
+
+from rpm_spec_language_server.diagnostics import spec_diagnostics
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.logging import LOGGER
+from rpm_spec_language_server.util import parse_spec_text
+
+#: the specs could be checked and all are fine
+EXIT_OK = 0
+
+#: at least one spec failed to parse or has errors
+EXIT_FAILED = 1
+
+#: no spec was found
+EXIT_NO_SPECS = 2
+
+
+def spec_paths(paths: Iterable[str]) -> Iterator[str]:
+    """Yield the specs in ``paths``, directories are searched recursively for
+    files ending in ``.spec``.
+
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                if file_name.endswith(".spec"):
+                    yield os.path.join(root, file_name)
+
+
+def check_spec(path: str, fail_on_warnings: bool = False) -> dict[str, Any]:
+    """Parse the spec at ``path`` like the language server does and return the
+    record describing the outcome.
+
+    """
+    start = time.perf_counter()
+    record: dict[str, Any] = {"path": path}
+
+    try:
+        with open(path) as spec_f:
+            text = spec_f.read()
+    except (OSError, UnicodeDecodeError) as err:
+        return {
+            **record,
+            "ok": False,
+            "parsed": False,
+            "duration": time.perf_counter() - start,
+            "error": str(err),
+        }
+
+    sourcedir = os.path.dirname(os.path.abspath(path))
+    spec, rpm_exc = parse_spec_text(text, os.path.basename(path), sourcedir)
+    sections = SpecSections.parse(spec, text, sourcedir) if spec else None
+    diagnostics = spec_diagnostics(text, rpm_exc)
+
+    failing_severities = {DiagnosticSeverity.Error}
+    if fail_on_warnings:
+        failing_severities.add(DiagnosticSeverity.Warning)
+
+    converter = converters.get_converter()
+    return {
+        **record,
+        "ok": spec is not None
+        and not any(diag.severity in failing_severities for diag in diagnostics),
+        "parsed": spec is not None,
+        "duration": time.perf_counter() - start,
+        "sections": [
+            {
+                "name": section.name,
+                "start": section.starting_line,
+                "end": section.ending_line,
+            }
+            for section in (sections.sections if sections else ())
+        ],
+        "tags": [
+            {"name": tag.name, "line": tag.line}
+            for tag in (sections.tags if sections else ())
+        ],
+        "diagnostics": converter.unstructure(diagnostics),
+    }
+
+
+def _quiet_worker() -> None:
+    # rpm's complaints end up in the diagnostics, don't repeat them on stderr
+    LOGGER.setLevel(logging.ERROR)
+
+
+def check_specs(
+    paths: Iterable[str], jobs: Optional[int] = None, fail_on_warnings: bool = False
+) -> Iterator[dict[str, Any]]:
+    """Check the specs ``paths`` in ``jobs`` worker processes (defaults to the
+    number of CPUs) and yield the records in the order in which the checks
+    finish.
+
+    """
+    if jobs == 1:
+        for path in paths:
+            yield check_spec(path, fail_on_warnings)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_quiet_worker) as pool:
+        futures = {
+            pool.submit(check_spec, path, fail_on_warnings): path for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as exc:
+                # e.g. a worker crashed in librpm
+                yield {
+                    "path": futures[future],
+                    "ok": False,
+                    "parsed": False,
+                    "duration": 0.0,
+                    "error": f"{type(exc).__name__}: {exc}",
+                }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="rpm_lsp_server check",
+        description="Parse specs and report their sections and diagnostics as "
+        "one JSON record per line",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="Spec or directory that is searched for specs",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--fail-on-warnings",
+        action="store_true",
+        help="Treat specs with warnings as failing",
+    )
+    args = parser.parse_args(argv)
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if not (paths := list(spec_paths(args.paths))):
+        print("No specs found", file=sys.stderr)
+        return EXIT_NO_SPECS
+
+    start = time.perf_counter()
+    failed: list[str] = []
+    durations: list[tuple[float, str]] = []
+
+    for record in check_specs(paths, args.jobs, args.fail_on_warnings):
+        print(json.dumps(record), flush=True)
+        durations.append((record["duration"], record["path"]))
+        if not record["ok"]:
+            failed.append(record["path"])
+
+    elapsed = time.perf_counter() - start
+    slowest, slowest_path = max(durations)
+    print(
+        f"Checked {len(paths)} specs in {elapsed:.2f} s "
+        f"({sum(d for d, _ in durations):.2f} s of parsing, "
+        f"slowest: {slowest_path} with {slowest:.2f} s), {len(failed)} failed",
+        file=sys.stderr,
+    )
+    for path in sorted(failed):
+        print(f"FAILED {path}", file=sys.stderr)
+
+    return EXIT_FAILED if failed else EXIT_OK
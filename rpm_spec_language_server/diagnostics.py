@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import re
+from collections.abc import Iterable
+from typing import Callable, Optional
+
+from lsprotocol.types import (
+    Diagnostic,
+    DiagnosticSeverity,
+    Position,
+    PublishDiagnosticsParams,
+    Range,
+)
+from specfile.exceptions import RPMException
+
+from rpm_spec_language_server.macros import CONDITIONAL_RE
+
+#: delay in seconds after the last change before diagnostics are published
+DIAGNOSTICS_DEBOUNCE = 0.3
+
+_SOURCE = "rpm"
+
+_RPM_MESSAGE_RE = re.compile(r"^(error|warning): (?:.*?\bline (\d+): )?(.*)$")
+
+
+def _line_range(lines: list[str], line_number: int) -> Range:
+    line_number = max(0, min(line_number, len(lines) - 1))
+    return Range(
+        start=Position(line=line_number, character=0),
+        end=Position(
+            line=line_number, character=len(lines[line_number]) if lines else 0
+        ),
+    )
+
+
+def diagnostics_from_rpm_exception(
+    rpm_exc: RPMException, lines: list[str]
+) -> list[Diagnostic]:
+    """Convert the errors and warnings that rpm printed while parsing the spec
+    with the contents ``lines`` into diagnostics.
+
+    Messages without a line number are attached to the first line.
+
+    """
+    diagnostics = []
+
+    for raw_line in rpm_exc.stderr:
+        if (m := _RPM_MESSAGE_RE.match(raw_line.decode(errors="replace"))) is None:
+            continue
+
+        level, line_number, message = m.groups()
+        diagnostics.append(
+            Diagnostic(
+                range=_line_range(lines, int(line_number) - 1 if line_number else 0),
+                message=message,
+                severity=(
+                    DiagnosticSeverity.Error
+                    if level == "error"
+                    else DiagnosticSeverity.Warning
+                ),
+                source=_SOURCE,
+            )
+        )
+
+    # rpm did not tell us anything useful, so show the whole exception
+    if not diagnostics:
+        diagnostics.append(
+            Diagnostic(
+                range=_line_range(lines, 0),
+                message=str(rpm_exc).strip(),
+                severity=DiagnosticSeverity.Error,
+                source=_SOURCE,
+            )
+        )
+
+    return diagnostics
+
+
+def unbalanced_conditionals(lines: Iterable[str]) -> list[Diagnostic]:
+    """Report ``%else``/``%elif``/``%endif`` without a matching ``%if`` and
+    ``%if`` that are never closed.
+
+    """
+    diagnostics = []
+    open_blocks: list[tuple[int, str]] = []
+    lines = list(lines)
+
+    for line_number, line in enumerate(lines):
+        if (m := CONDITIONAL_RE.match(line)) is None:
+            continue
+
+        if (keyword := m.group(1)).startswith("if"):
+            open_blocks.append((line_number, line))
+        elif not open_blocks:
+            diagnostics.append(
+                Diagnostic(
+                    range=_line_range(lines, line_number),
+                    message=f"%{keyword} without a matching %if",
+                    severity=DiagnosticSeverity.Error,
+                    source=_SOURCE,
+                )
+            )
+        elif keyword == "endif":
+            open_blocks.pop()
+
+    for line_number, line in open_blocks:
+        diagnostics.append(
+            Diagnostic(
+                range=_line_range(lines, line_number),
+                message=f"Unclosed {line.strip()}",
+                severity=DiagnosticSeverity.Error,
+                source=_SOURCE,
+            )
+        )
+
+    return diagnostics
+
+
+def spec_diagnostics(
+    spec_contents: str, rpm_exc: Optional[RPMException] = None
+) -> list[Diagnostic]:
+    """Collect all diagnostics for a spec with the contents ``spec_contents``
+    that failed to parse with ``rpm_exc`` (if it failed to parse at all).
+
+    """
+    lines = spec_contents.splitlines()
+    diagnostics = unbalanced_conditionals(lines)
+
+    if rpm_exc is not None:
+        diagnostics.extend(diagnostics_from_rpm_exception(rpm_exc, lines))
+
+    return diagnostics
+
+
+class DiagnosticsPublisher:
+    """Publishes diagnostics to the client once no new diagnostics have been
+    scheduled for the same document for ``delay`` seconds and only if they
+    differ from the last published ones.
+
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[PublishDiagnosticsParams], None],
+        delay: float = DIAGNOSTICS_DEBOUNCE,
+    ) -> None:
+        self._publish = publish
+        self._delay = delay
+        self._pending: dict[str, asyncio.TimerHandle] = {}
+        self._published: dict[str, list[Diagnostic]] = {}
+
+    def schedule(
+        self, uri: str, diagnostics: list[Diagnostic], version: Optional[int] = None
+    ) -> None:
+        if (pending := self._pending.pop(uri, None)) is not None:
+            pending.cancel()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # not running inside the server (e.g. in a plain function call)
+            self.publish(uri, diagnostics, version)
+            return
+
+        self._pending[uri] = loop.call_later(
+            self._delay, self.publish, uri, diagnostics, version
+        )
+
+    def publish(
+        self, uri: str, diagnostics: list[Diagnostic], version: Optional[int] = None
+    ) -> None:
+        """Send the diagnostics immediately if they changed."""
+        if (pending := self._pending.pop(uri, None)) is not None:
+            pending.cancel()
+
+        if self._published.get(uri) == diagnostics:
+            return
+
+        self._published[uri] = diagnostics
+        self._publish(
+            PublishDiagnosticsParams(uri=uri, diagnostics=diagnostics, version=version)
+        )
+
+    def clear(self, uri: str) -> None:
+        """Remove all diagnostics of the document ``uri`` from the client."""
+        if (pending := self._pending.pop(uri, None)) is not None:
+            pending.cancel()
+
+        if self._published.pop(uri, None):
+            self._publish(PublishDiagnosticsParams(uri=uri, diagnostics=[]))
@@ -1,51 +1,275 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import re
+from bisect import bisect_right
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Optional
 
-from lsprotocol.types import DocumentSymbol, Position, Range, SymbolKind
-from specfile.sections import Section
+from lsprotocol.types import (
+    DocumentSymbol,
+    FoldingRange,
+    FoldingRangeKind,
+    Position,
+    Range,
+    SymbolKind,
+)
+from specfile.constants import SECTION_NAMES
 from specfile.specfile import Specfile
 
+from rpm_spec_language_server.macros import CONDITIONAL_RE
+from rpm_spec_language_server.util import parse_spec_text
 
-@dataclass
+
+def conditional_folding_ranges(lines: Iterable[str]) -> list[FoldingRange]:
+    """Create folding ranges for all ``%if``/``%else``/``%endif`` blocks in
+    ``lines``, taking their nesting into account.
+
+    Each branch of a conditional gets its own folding range, the last one
+    includes the ``%endif``.
+
+    """
+    ranges: list[FoldingRange] = []
+    open_blocks: list[int] = []
+
+    for line_number, line in enumerate(lines):
+        if (m := CONDITIONAL_RE.match(line)) is None:
+            continue
+
+        keyword = m.group(1)
+        if keyword.startswith("if"):
+            open_blocks.append(line_number)
+            continue
+
+        # unbalanced %else or %endif
+        if not open_blocks:
+            continue
+
+        start = open_blocks.pop()
+        if keyword == "endif":
+            end = line_number
+        else:
+            end = line_number - 1
+            open_blocks.append(line_number)
+
+        if end > start:
+            ranges.append(
+                FoldingRange(
+                    start_line=start, end_line=end, kind=FoldingRangeKind.Region
+                )
+            )
+
+    return sorted(ranges, key=lambda r: r.start_line)
+
+
+#: a preamble tag, the match ends after the first word of its value
+TAG_RE = re.compile(r"^[\t \f]*([A-Za-z][\w()]*):[\t \f]+\S*")
+
+#: a section header like rpm detects it: the name of the section at the start of
+#: the line, followed by its options (that must not end in a line continuation)
+_SECTION_RE = re.compile(
+    r"^%("
+    + "|".join(sorted(map(re.escape, SECTION_NAMES), key=len, reverse=True))
+    + r")(?:[\t \f]+(.*?)|)[\t \f]*(?<!\\)$",
+    re.IGNORECASE,
+)
+
+#: the start of a ``%global`` or ``%define``, whose body may span multiple lines
+_MACRO_DEFINITION_RE = re.compile(r"^[\t \f]*%(?:global|define)\b")
+
+_NAME_TAG_RE = re.compile(r"^[\t \f]*Name:[\t \f]*(\S+)", re.IGNORECASE)
+
+
+def section_name(name: str, options: str, spec_name: str) -> str:
+    """The name of the section ``name`` with the options ``options`` in the
+    spec of the package ``spec_name`` as shown in the outline, e.g.
+    ``files foo-devel`` for ``%files devel``.
+
+    """
+    if opt := options.strip():
+        if not opt.startswith("-"):
+            name = f"{name} {spec_name}-{opt.split()[0]}"
+
+        if "-n" in (o := opt.split()) and (index := o.index("-n")) + 1 < len(o):
+            name = f"{name} {o[index + 1]}"
+
+    return name
+
+
+def _name_tag(lines: Iterable[str]) -> str:
+    """The value of the ``Name:`` tag in the preamble of the spec as it is
+    written, i.e. without expanding the macros in it.
+
+    """
+    in_definition = False
+    for line in lines:
+        # neither tags nor section headers in the body of a macro count
+        if in_definition or _MACRO_DEFINITION_RE.match(line):
+            in_definition = line.endswith("\\")
+            continue
+        if _SECTION_RE.match(line):
+            break
+        if m := _NAME_TAG_RE.match(line):
+            return m.group(1)
+    return ""
+
+
+def _preamble_tags(
+    sections: Iterable[SpecSection], lines: list[str]
+) -> tuple[SpecTag, ...]:
+    return tuple(
+        SpecTag(m.group(1), line_number, m.end())
+        for section in sections
+        if section.name.startswith("package")
+        for line_number in range(
+            section.starting_line, min(section.ending_line, len(lines))
+        )
+        if (m := TAG_RE.match(lines[line_number]))
+    )
+
+
+@dataclass(frozen=True)
 class SpecSection:
+    __slots__ = ("name", "starting_line", "ending_line")
+
     name: str
     starting_line: int
     ending_line: int
-    _section: Section
+
+    def __reduce__(self) -> tuple[type[SpecSection], tuple[str, int, int]]:
+        # frozen instances cannot restore their slots via setattr when unpickled
+        return SpecSection, (self.name, self.starting_line, self.ending_line)
+
+
+@dataclass(frozen=True)
+class SpecTag:
+    """A tag in the preamble of the spec or of a subpackage."""
+
+    __slots__ = ("name", "line", "end")
+
+    name: str
+    line: int
+    #: column after the first word of the tag's value
+    end: int
+
+    def __reduce__(self) -> tuple[type[SpecTag], tuple[str, int, int]]:
+        return SpecTag, (self.name, self.line, self.end)
 
     @property
-    def contents(self) -> str:
-        return str(self._section)
+    def range(self) -> Range:
+        return Range(
+            start=Position(line=self.line, character=0),
+            end=Position(line=self.line, character=self.end),
+        )
 
 
-@dataclass
+@dataclass(frozen=True)
 class SpecSections:
-    sections: list[SpecSection]
-    spec: Specfile
+    """The sections and tags of a parsed spec.
+
+    Instances are immutable and only keep the text of the spec, so that they
+    can be pickled and do not keep rpm's parser state alive while they are
+    cached. The ``Specfile`` that is needed for expanding macros is parsed
+    again from the text via :py:meth:`parse_spec`.
+
+    """
+
+    sections: tuple[SpecSection, ...]
+
+    #: the contents of the spec
+    text: str
+
+    #: the file name that the spec was parsed with
+    file_name: str = "unnamed.spec"
+
+    tags: tuple[SpecTag, ...] = ()
+
+    #: the directory in which the files included by the spec are looked up
+    sourcedir: Optional[str] = None
+
+    #: the name of the package that the sections of the subpackages are named
+    #: after, its macros are expanded if rpm parsed the spec
+    name: str = ""
+
+    #: the value of the ``Name:`` tag as it is written
+    name_tag: str = ""
+
+    #: start line of every section
+    _starts: tuple[int, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self, "_starts", tuple(section.starting_line for section in self.sections)
+        )
+
+    @cached_property
+    def _folds(self) -> tuple[tuple[int, int], ...]:
+        """First and last line of every section and conditional that can be
+        folded, only computed once folding ranges are requested.
+
+        """
+        return tuple(
+            sorted(
+                [
+                    (section.starting_line, section.ending_line - 1)
+                    for section in self.sections
+                    if section.ending_line - 1 > section.starting_line
+                ]
+                + [
+                    (folding_range.start_line, folding_range.end_line)
+                    for folding_range in conditional_folding_ranges(
+                        self.text.splitlines()
+                    )
+                ],
+                key=lambda fold: fold[0],
+            )
+        )
+
+    def parse_spec(self) -> Optional[Specfile]:
+        """Parse the ``Specfile`` for the text of the spec (blocks on rpm).
+
+        Returns ``None`` if the spec can no longer be parsed (e.g. because the
+        macro environment changed).
+
+        """
+        return parse_spec_text(self.text, self.file_name, self.sourcedir)[0]
 
     def section_under_cursor(self, position: Position) -> SpecSection | None:
-        for sect in self.sections:
-            if position.line >= sect.starting_line and position.line < sect.ending_line:
-                return sect
+        if (index := bisect_right(self._starts, position.line) - 1) < 0:
+            return None
+
+        sect = self.sections[index]
+        return sect if position.line < sect.ending_line else None
+
+    def tag(self, name: str) -> SpecTag | None:
+        """Return the first tag ``name`` (case insensitive) of the spec."""
+        name = name.lower()
+        for tag in self.tags:
+            if tag.name.lower() == name:
+                return tag
         return None
 
     @staticmethod
-    def parse(spec: Specfile) -> SpecSections:
+    def parse(
+        spec: Specfile, text: Optional[str] = None, sourcedir: Optional[str] = None
+    ) -> SpecSections:
+        """Extract the sections and the tags from ``spec``, whose contents are
+        ``text`` (defaults to the contents of the spec) and which was parsed
+        with the ``sourcedir``.
+
+        """
+        if text is None:
+            text = str(spec)
+
+        lines = text.splitlines()
         sections = []
 
         with spec.sections() as sects:
             current_line = 0
 
             for section in sects:
-                name = section.name
-
-                if opt := str(section.options).strip():
-                    if not opt.startswith("-"):
-                        name = f"{name} {spec.name}-{opt.split()[0]}"
-
-                    if "-n" in opt:
-                        name = f"{name} {(o := opt.split())[o.index('-n') + 1]}"
+                name = section_name(section.name, str(section.options), spec.name)
 
                 section_length = len(section.data)
 
@@ -57,13 +281,88 @@ class SpecSections:
                         name,
                         starting_line=current_line,
                         ending_line=current_line + section_length,
-                        _section=section,
                     )
                 )
 
                 current_line += section_length
 
-        return SpecSections(sections, spec)
+        return SpecSections(
+            tuple(sections),
+            text,
+            spec.path.name if spec.path else "unnamed.spec",
+            _preamble_tags(sections, lines),
+            sourcedir,
+            spec.name,
+            _name_tag(lines),
+        )
+
+    @staticmethod
+    def scan(
+        text: str,
+        file_name: str = "unnamed.spec",
+        sourcedir: Optional[str] = None,
+        parsed: Optional[SpecSections] = None,
+    ) -> SpecSections:
+        """Find the sections and the tags of the spec with the contents ``text``
+        without rpm, e.g. for specs that rpm fails to parse while they are
+        edited.
+
+        Section headers are detected like rpm does it, but macros are not
+        expanded, so sections that are only created via macros are not found.
+        The subpackages are named after the expanded name of the last sections
+        that rpm ``parsed`` as long as the ``Name:`` tag is unchanged, otherwise
+        after the tag as it is written.
+
+        """
+        lines = text.splitlines()
+        sections: list[SpecSection] = []
+        name_tag = _name_tag(lines)
+        spec_name = (
+            parsed.name
+            if parsed is not None and parsed.name_tag == name_tag
+            else name_tag
+        )
+        # name, options and first line of the section that is being scanned
+        current = ("package", "", 0)
+        in_definition = False
+
+        for line_number, line in enumerate(lines):
+            # section headers inside of the body of a macro are no headers
+            if in_definition or _MACRO_DEFINITION_RE.match(line):
+                in_definition = line.endswith("\\")
+                continue
+
+            if (m := _SECTION_RE.match(line)) is None:
+                continue
+
+            name, options, start = current
+            sections.append(
+                SpecSection(section_name(name, options, spec_name), start, line_number)
+            )
+            current = (m.group(1).lower(), m.group(2) or "", line_number)
+
+        name, options, start = current
+        sections.append(
+            SpecSection(section_name(name, options, spec_name), start, len(lines))
+        )
+
+        return SpecSections(
+            tuple(sections),
+            text,
+            file_name,
+            _preamble_tags(sections, lines),
+            sourcedir,
+            spec_name,
+            name_tag,
+        )
+
+    @property
+    def folding_ranges(self) -> list[FoldingRange]:
+        """Folding ranges for all sections and conditionals of the spec."""
+        return [
+            FoldingRange(start_line=start, end_line=end, kind=FoldingRangeKind.Region)
+            for start, end in self._folds
+        ]
 
     def to_document_symbols(self) -> list[DocumentSymbol]:
         return [
@@ -0,0 +1,118 @@
+"""Files that are pulled into a spec via ``%include``."""
+
+import os
+import re
+from collections.abc import Iterable
+
+#: the argument of an ``%include`` directive
+INCLUDE_RE = re.compile(r"^[\t \f]*%include[\t \f]+(\S+)", re.MULTILINE)
+
+#: macros pointing to the directory of the spec in an unpacked source package
+_SPEC_DIR_MACRO_RE = re.compile(r"%(?:\{_sourcedir\}|_sourcedir\b|\{_specdir\})")
+
+
+def included_files(text: str, spec_dir: str) -> list[str]:
+    """Return the absolute paths of all files that the spec with the contents
+    ``text`` includes.
+
+    Relative paths and paths in ``%_sourcedir`` are resolved against the
+    directory of the spec ``spec_dir``. Paths depending on other macros (e.g.
+    ``%{SOURCE1}``) are skipped, as they cannot be resolved without rpm.
+
+    """
+    paths = []
+    for m in INCLUDE_RE.finditer(text):
+        if "%" in (target := _SPEC_DIR_MACRO_RE.sub(lambda _: spec_dir, m.group(1))):
+            continue
+
+        path = os.path.normpath(os.path.join(spec_dir, target))
+        if path not in paths:
+            paths.append(path)
+
+    return paths
+
+
+def include_stamp(paths: Iterable[str]) -> str:
+    """Summarize the modification times and sizes of the included files
+    ``paths``, so that results depending on them can be invalidated once one of
+    them changes.
+
+    """
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}")
+        except OSError:
+            stamps.append(f"{path}\0missing")
+    return "\0".join(stamps)
+
+
+class IncludeGraph:
+    """Records which documents and files include which files, so that the
+    dependents of a changed file can be found.
+
+    Documents are identified by their uri and included files by their path.
+
+    """
+
+    def __init__(self) -> None:
+        #: document or file → the files that it includes directly
+        self._includes: dict[str, tuple[str, ...]] = {}
+        #: file → the documents and files that include it directly
+        self._included_by: dict[str, set[str]] = {}
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._includes
+
+    def includes(self, node: str) -> tuple[str, ...]:
+        return self._includes.get(node, ())
+
+    def set_includes(self, node: str, includes: Iterable[str]) -> None:
+        """Replace the files that ``node`` includes directly with ``includes``."""
+        self.remove(node)
+        self._includes[node] = (includes := tuple(includes))
+        for path in includes:
+            self._included_by.setdefault(path, set()).add(node)
+
+    def remove(self, node: str) -> None:
+        """Forget the files that ``node`` includes."""
+        for path in self._includes.pop(node, ()):
+            if (including := self._included_by.get(path)) is not None:
+                including.discard(node)
+                if not including:
+                    del self._included_by[path]
+
+    def transitive_includes(self, node: str) -> list[str]:
+        """All files that ``node`` includes directly or indirectly."""
+        seen: list[str] = []
+        pending = list(reversed(self.includes(node)))
+        while pending:
+            if (path := pending.pop()) in seen or path == node:
+                continue
+            seen.append(path)
+            pending.extend(reversed(self.includes(path)))
+        return seen
+
+    def dependents(self, path: str) -> list[str]:
+        """All documents and files that include ``path`` directly or indirectly
+        in dependency order, i.e. every entry comes after all the entries that it
+        includes.
+
+        """
+        visited = {path}
+        finished: list[str] = []
+        # iterative depth first search, every node is finished after everything
+        # including it
+        stack = [(path, iter(sorted(self._included_by.get(path, ()))))]
+        while stack:
+            node, including = stack[-1]
+            if (parent := next(including, None)) is None:
+                stack.pop()
+                finished.append(node)
+            elif parent not in visited:
+                visited.add(parent)
+                stack.append((parent, iter(sorted(self._included_by.get(parent, ())))))
+
+        # the reversed post-order is a topological order, path itself comes first
+        return finished[::-1][1:]
@@ -1,45 +1,403 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections.abc import Iterable
+from dataclasses import dataclass, replace
+from enum import Enum, auto
+from functools import cached_property, lru_cache
 from typing import Optional
 
+from lsprotocol.types import Position, Range
 
-def get_macro_string_at_position(line: str, character: int) -> Optional[str]:
-    """Return the macro at the character position ``character`` from the line
-    ``line`` and return it.
+CONDITION_KEYWORDS = [
+    # from https://github.com/rpm-software-management/rpm/blob/7d3d9041af2d75c4709cf7a721daf5d1787cce14/build/rpmbuild_internal.h#L58
+    "%endif",
+    "%else",
+    "%if",
+    "%ifarch",
+    "%ifnarch",
+    "%ifos",
+    "%ifnos",
+    "%include",
+    "%elifarch",
+    "%elifos",
+    "%elif",
+]
+
+#: the builtin macros that define or undefine the macro named after them, they
+#: are keywords rather than uses of a macro
+MACRO_DEFINING_MACROS = ("global", "define", "undefine")
+
+#: the builtin macros that test whether the macro named in their argument is
+#: defined, e.g. ``%{defined foo}``
+_MACRO_TESTING_MACROS = ("defined", "undefined")
+
+#: number of distinct lines whose macro tokens are kept, so that unchanged lines
+#: are not tokenized again when a new version of a document is indexed
+LINE_TOKENS_CACHE_SIZE = 64 * 1024
+
+#: matches a line starting with a conditional keyword (except ``%include``),
+#: the keyword without the ``%`` is the first group
+CONDITIONAL_RE = re.compile(
+    r"[\t ]*%("
+    + "|".join(keyword[1:] for keyword in CONDITION_KEYWORDS if keyword != "%include")
+    + r")\b"
+)
+
+
+def _is_macro_name_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def is_valid_macro_name(name: str) -> bool:
+    """Check whether ``name`` can be used as the name of a ``%global`` or
+    ``%define``.
+
+    """
+    return (
+        bool(name)
+        and not name[0].isdigit()
+        and all(_is_macro_name_char(char) for char in name)
+    )
+
+
+@dataclass(frozen=True)
+class MacroOccurrence:
+    """The name of a macro found on line ``line`` of a document, spanning the
+    columns ``start`` (inclusive) to ``end`` (exclusive).
+
+    """
+
+    name: str
+    line: int
+    start: int
+    end: int
+
+    #: ``True`` if this is the name in a ``%global name`` or ``%define name``
+    is_definition: bool = False
+
+    @property
+    def range(self) -> Range:
+        return Range(
+            start=Position(line=self.line, character=self.start),
+            end=Position(line=self.line, character=self.end),
+        )
+
+
+class MacroTokenKind(Enum):
+    #: a macro (``%name``, ``%{name}``, ``%{?name:…}``) or the name in
+    #: ``%global name``/``%define name``/``%undefine name``
+    MACRO = auto()
+    #: ``%%``
+    ESCAPE = auto()
+    #: ``%dnl`` and everything after it on the line
+    COMMENT = auto()
+
+
+@dataclass(frozen=True)
+class MacroToken:
+    """A token spanning the columns ``start`` (inclusive) to ``end``
+    (exclusive) of a line, braced macros span up to their closing brace.
 
     """
-    start_of_macro = 0
-    end_of_macro = len(line)
-    for i in range(character):
+
+    kind: MacroTokenKind
+    start: int
+    end: int
+
+    #: the name of the macro for tokens of the kind ``MACRO``
+    occurrence: Optional[MacroOccurrence] = None
+
+
+def _closing_brace(line: str, opening: int) -> int:
+    """Return the column after the brace closing the one at ``opening`` or the
+    length of the line if it is never closed.
+
+    """
+    depth = 0
+    for i in range(opening, len(line)):
+        if line[i] == "{":
+            depth += 1
+        elif line[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(line)
+
+
+def tokenize_macros(line: str, line_number: int) -> list[MacroToken]:
+    """Tokenize the line ``line`` into macros, ``%%`` escapes and ``%dnl``
+    comments sorted by their start column.
+
+    This understands the ``%name``, ``%{name}``, ``%{?name}``, ``%{!?name:…}``
+    forms. Macros nested in conditional expansions, ``%(shell)`` and
+    ``%[expression]`` are reported as well. The name following ``%global`` or
+    ``%define`` is reported as a definition, the names following
+    ``%undefine``, ``%{defined …}`` and ``%{undefined …}`` as uses.
+
+    """
+    tokens: list[MacroToken] = []
+    i, line_length = 0, len(line)
+
+    while (i := line.find("%", i)) >= 0:
         # two %% indicate a "deactivated" macro
-        if (
-            line[i] == "%"
-            and (i == 0 or line[i - 1] != "%")
-            and (i == len(line) - 1 or line[i + 1] != "%")
-        ):
-            start_of_macro = i
+        if i + 1 < line_length and line[i + 1] == "%":
+            tokens.append(MacroToken(MacroTokenKind.ESCAPE, i, i + 2))
+            i += 2
+            continue
+
+        start = i + 1
+        braced = start < line_length and line[start] == "{"
+        if braced:
+            start += 1
+        while start < line_length and line[start] in ("?", "!"):
+            start += 1
+
+        end = start
+        while end < line_length and _is_macro_name_char(line[end]):
+            end += 1
+
+        # %(shell), %[expression] or a lone %: look for macros inside of it
+        if end == start:
+            i = start
+            continue
+
+        name = line[start:end]
+
+        # macro is commented out => nothing after it counts
+        if name == "dnl" and not braced:
+            tokens.append(MacroToken(MacroTokenKind.COMMENT, i, line_length))
+            break
+
+        tokens.append(
+            MacroToken(
+                MacroTokenKind.MACRO,
+                i,
+                _closing_brace(line, i + 1) if braced else end,
+                MacroOccurrence(name, line_number, start, end),
+            )
+        )
+        i = end
+
+        # the name of the macro that is (un)defined or tested for, e.g. foo in
+        # %global foo, %undefine foo, %{defined foo} or %{undefined:foo}
+        if braced and name in _MACRO_TESTING_MACROS:
+            separators = " \t\f:"
+        elif not braced and name in MACRO_DEFINING_MACROS:
+            separators = " \t\f"
+        else:
+            continue
+
+        arg_start = end
+        while arg_start < line_length and line[arg_start] in separators:
+            arg_start += 1
+        arg_end = arg_start
+        while arg_end < line_length and _is_macro_name_char(line[arg_end]):
+            arg_end += 1
+
+        if arg_end > arg_start > end:
+            tokens.append(
+                MacroToken(
+                    MacroTokenKind.MACRO,
+                    arg_start,
+                    arg_end,
+                    MacroOccurrence(
+                        line[arg_start:arg_end],
+                        line_number,
+                        arg_start,
+                        arg_end,
+                        is_definition=name in ("global", "define"),
+                    ),
+                )
+            )
+            i = arg_end
+
+    return tokens
+
+
+def macro_occurrences_in_line(line: str, line_number: int) -> list[MacroOccurrence]:
+    """Return all macro occurrences on the line ``line``, see
+    :py:func:`tokenize_macros`.
+
+    """
+    return [
+        token.occurrence
+        for token in tokenize_macros(line, line_number)
+        if token.occurrence is not None
+    ]
+
+
+@dataclass(frozen=True)
+class LineMacroTokens:
+    """The macro tokens of a single line, allowing to find the token under the
+    cursor via bisection.
+
+    """
+
+    tokens: tuple[MacroToken, ...] = ()
+
+    #: start column of every token
+    starts: tuple[int, ...] = ()
+
+    #: index of the innermost token that contains each token (or -1)
+    parents: tuple[int, ...] = ()
+
+    @staticmethod
+    def from_tokens(tokens: list[MacroToken]) -> LineMacroTokens:
+        if not tokens:
+            return _NO_TOKENS
+
+        parents = []
+        enclosing: list[int] = []
+        for index, token in enumerate(tokens):
+            while enclosing and tokens[enclosing[-1]].end < token.end:
+                enclosing.pop()
+            parents.append(enclosing[-1] if enclosing else -1)
+            enclosing.append(index)
+
+        return LineMacroTokens(
+            tuple(tokens), tuple(token.start for token in tokens), tuple(parents)
+        )
+
+    @staticmethod
+    def from_line(line: str, line_number: int = 0) -> LineMacroTokens:
+        return LineMacroTokens.from_tokens(tokenize_macros(line, line_number))
+
+    def token_at(self, character: int) -> Optional[MacroToken]:
+        """Return the innermost token containing the column ``character`` (the
+        column directly after a token counts as well).
+
+        """
+        index = bisect_right(self.starts, character) - 1
+
+        # tokens are nested, so only the ones enclosing the last token that
+        # starts before the cursor can contain it
+        while index >= 0:
+            if character <= (token := self.tokens[index]).end:
+                return token
+            index = self.parents[index]
 
-    # not a macro, just a word
-    # or a macro prefixed with another % and thus being commented out
-    if line[start_of_macro] != "%" or (
-        line[start_of_macro] == "%" and line[start_of_macro + 1] == "%"
-    ):
         return None
 
-    # macro is commented out => nothing
-    if "%dnl" in line[:start_of_macro]:
+
+_NO_TOKENS = LineMacroTokens()
+
+
+@lru_cache(maxsize=LINE_TOKENS_CACHE_SIZE)
+def _line_macro_tokens(line: str) -> LineMacroTokens:
+    # shared by all lines with the same contents, hence on line 0
+    return LineMacroTokens.from_line(line)
+
+
+def get_macro_string_at_position(line: str, character: int) -> Optional[str]:
+    """Return the name of the macro at the character position ``character`` of
+    the line ``line`` or ``None`` if there is no macro (or it is escaped or
+    commented out).
+
+    """
+    if (
+        token := LineMacroTokens.from_line(line).token_at(character)
+    ) is None or token.occurrence is None:
         return None
+    return token.occurrence.name
 
-    start_of_macro += 1
-    if line[start_of_macro] == "{":
-        start_of_macro += 1
 
-    for i in range(start_of_macro, len(line)):
-        if line[i] not in ("?", "!"):
-            break
-        start_of_macro += 1
+@dataclass(frozen=True)
+class MacroIndex:
+    """Inverted index mapping macro names to all their occurrences in one
+    document.
 
-    for i in range(max(character, start_of_macro), len(line)):
-        if line[i] in ("}", "%", ",", ";") or line[i].isspace():
-            end_of_macro = i
-            break
+    """
+
+    #: version of the document from which this index was built
+    version: Optional[int] = None
+
+    #: the macro tokens of every line, they are shared by all lines with the
+    #: same contents, so their occurrences are all on line 0
+    lines: tuple[LineMacroTokens, ...] = ()
+
+    @staticmethod
+    def from_text(text: str, version: Optional[int] = None) -> MacroIndex:
+        return MacroIndex.from_lines(text.splitlines(), version)
+
+    @staticmethod
+    def from_lines(lines: Iterable[str], version: Optional[int] = None) -> MacroIndex:
+        return MacroIndex(version, tuple(map(_line_macro_tokens, lines)))
+
+    def replace_lines(
+        self, start: int, end: int, lines: Iterable[str], version: Optional[int]
+    ) -> MacroIndex:
+        """Return the index of the version ``version`` of the document, in which
+        the lines ``start`` up to ``end`` (exclusive) were replaced with
+        ``lines``.
+
+        """
+        return MacroIndex(
+            version,
+            self.lines[:start]
+            + tuple(map(_line_macro_tokens, lines))
+            + self.lines[end:],
+        )
+
+    @cached_property
+    def occurrences(self) -> dict[str, list[MacroOccurrence]]:
+        """Macro name -> occurrences sorted by line and column, this is only
+        built once it is needed.
+
+        """
+        occurrences: dict[str, list[MacroOccurrence]] = {}
+        for line_number, line in enumerate(self.lines):
+            for token in line.tokens:
+                if (occurrence := token.occurrence) is not None and (
+                    occurrence.is_definition
+                    or occurrence.name not in MACRO_DEFINING_MACROS
+                ):
+                    occurrences.setdefault(occurrence.name, []).append(
+                        replace(occurrence, line=line_number)
+                    )
+        return occurrences
+
+    def token_at(self, line: int, character: int) -> Optional[MacroToken]:
+        """Return the innermost token under the cursor at ``line`` and
+        ``character``.
+
+        """
+        if (
+            not 0 <= line < len(self.lines)
+            or (token := self.lines[line].token_at(character)) is None
+        ):
+            return None
+        if token.occurrence is None:
+            return token
+        return replace(token, occurrence=replace(token.occurrence, line=line))
+
+    def references(
+        self, name: str, include_definitions: bool = True
+    ) -> list[MacroOccurrence]:
+        """Return all occurrences of the macro ``name``, optionally without its
+        ``%global``/``%define`` definitions.
+
+        """
+        return [
+            occurrence
+            for occurrence in self.occurrences.get(name, [])
+            if include_definitions or not occurrence.is_definition
+        ]
+
+    def definitions(self, name: str) -> list[MacroOccurrence]:
+        """Return all ``%global``/``%define`` definitions of the macro ``name``."""
+        return [
+            occurrence
+            for occurrence in self.occurrences.get(name, [])
+            if occurrence.is_definition
+        ]
+
+    def occurrence_at(self, line: int, character: int) -> Optional[MacroOccurrence]:
+        """Return the occurrence that contains the cursor at ``line`` and
+        ``character`` (the position directly after a macro counts as well).
 
-    return line[start_of_macro:end_of_macro]
+        """
+        if (token := self.token_at(line, character)) is None:
+            return None
+        return token.occurrence
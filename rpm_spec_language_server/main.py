@@ -1,10 +1,19 @@
 import logging
+import os.path
+import sys
 
 
 def main() -> None:
     import argparse
 
-    parser = argparse.ArgumentParser()
+    if sys.argv[1:2] == ["check"]:
+        from rpm_spec_language_server.check import main as check_main
+
+        sys.exit(check_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(
+        epilog="Run '%(prog)s check PATH...' to check specs without an editor"
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -19,6 +28,11 @@ def main() -> None:
         "--host", type=str, default="127.0.0.1", help="Bind to this address"
     )
     parser.add_argument("--port", type=int, default=2087, help="Bind to this port")
+    parser.add_argument(
+        "--multi-session",
+        action="store_true",
+        help="Serve every TCP connection as its own session with shared caches",
+    )
     parser.add_argument(
         "--runtime-type-checks",
         action="store_true",
@@ -31,16 +45,87 @@ def main() -> None:
         help="Directory that is mounted ",
         default=[""],
     )
+    parser.add_argument(
+        "--path-map",
+        type=str,
+        action="append",
+        default=[],
+        metavar="HOST_DIR=CONTAINER_DIR",
+        help="Directory on the host that is available under a different path "
+        "in the container, can be passed multiple times",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Record the latency of all requests, see the rpmspec/stats request",
+    )
+    parser.add_argument(
+        "--stats-file",
+        type=str,
+        help="Periodically write the statistics into this file in the Prometheus "
+        "text format (implies --stats)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=15.0,
+        help="Write the statistics file every this many seconds",
+    )
+    parser.add_argument(
+        "--profile-requests",
+        type=int,
+        metavar="N",
+        help="Profile the first N requests (of every session with "
+        "--multi-session), the profiles are written next to the log file (or "
+        "into the temporary directory)",
+    )
+    parser.add_argument(
+        "--profile-seconds",
+        type=float,
+        metavar="T",
+        help="Profile all requests in the first T seconds",
+    )
+    parser.add_argument(
+        "--parse-cache",
+        type=str,
+        metavar="FILE",
+        help="Keep the parse results in this file between runs, defaults to "
+        "$XDG_CACHE_HOME/rpm-spec-language-server/parse-cache.sqlite",
+    )
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="Do not keep the parse results on disk",
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        metavar="FILE",
+        help="Record all messages of the session into this file for replaying "
+        "them later (not supported with --multi-session)",
+    )
 
     args = parser.parse_args()
 
+    if args.multi_session and args.stdio:
+        parser.error("--multi-session serves TCP connections and cannot use --stdio")
+    if args.multi_session and args.record:
+        parser.error("--record is not supported with --multi-session")
+
     if args.runtime_type_checks:
         from typeguard import install_import_hook
 
         install_import_hook("rpm_spec_language_server")
 
     from rpm_spec_language_server.logging import LOG_LEVELS, LOGGER
+    from rpm_spec_language_server.paths import PathMapping
     from rpm_spec_language_server.server import create_rpm_lang_server
+    from rpm_spec_language_server.shared import SharedCaches
+
+    try:
+        path_mappings = [PathMapping.parse(mapping) for mapping in args.path_map]
+    except ValueError as val_err:
+        parser.error(str(val_err))
 
     log_level = LOG_LEVELS[min(args.verbose or 0, len(LOG_LEVELS) - 1)]
 
@@ -50,9 +135,85 @@ def main() -> None:
 
     LOGGER.setLevel(log_level)
 
-    server = create_rpm_lang_server(args.ctr_mount_path[0])
+    stats = None
+    stop_stats_writer = None
+    if args.stats or args.stats_file:
+        from rpm_spec_language_server.stats import ServerStats
+
+        stats = ServerStats()
+        if args.stats_file:
+            stop_stats_writer = stats.start_prometheus_writer(
+                args.stats_file, args.stats_interval
+            )
+
+    persistent_cache = None
+    if not args.no_parse_cache:
+        import sqlite3
+
+        from rpm_spec_language_server.persistent_cache import (
+            PersistentParseCache,
+            default_cache_path,
+        )
+
+        try:
+            persistent_cache = PersistentParseCache(
+                args.parse_cache or default_cache_path()
+            )
+        except (OSError, sqlite3.Error) as err:
+            LOGGER.warning("Not using the persistent parse cache: %s", err)
+
+    shared = SharedCaches(persistent_cache=persistent_cache)
+
+    recorder = None
+    try:
+        profile_dir = (
+            os.path.dirname(os.path.abspath(args.log_file[0]))
+            if args.log_file
+            else None
+        )
+
+        if args.multi_session:
+            from rpm_spec_language_server.sessions import start_multi_session_tcp
+
+            start_multi_session_tcp(
+                args.host,
+                args.port,
+                args.ctr_mount_path[0],
+                path_mappings,
+                stats,
+                shared,
+                profile_dir,
+                args.profile_requests,
+                args.profile_seconds,
+            )
+            return
+
+        server = create_rpm_lang_server(
+            args.ctr_mount_path[0],
+            shared=shared,
+            path_mappings=path_mappings,
+            stats=stats,
+            profile_dir=profile_dir,
+        )
+
+        if args.record:
+            from rpm_spec_language_server.recording import SessionRecorder
+
+            recorder = SessionRecorder(open(args.record, "w"))
+            recorder.attach(server.protocol)
+
+        if args.profile_requests or args.profile_seconds:
+            server.profiler.start(args.profile_requests, args.profile_seconds)
 
-    if args.stdio:
-        server.start_io()
-    else:
-        server.start_tcp(args.host, args.port)
+        if args.stdio:
+            server.start_io()
+        else:
+            server.start_tcp(args.host, args.port)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if stop_stats_writer is not None:
+            stop_stats_writer.set()
+        if persistent_cache is not None:
+            # writes the entries that are still pending
+            persistent_cache.close()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import os.path
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import quote, unquote, urlparse
+
+#: number of uris whose resolved path is remembered
+RESOLVED_URIS_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class PathMapping:
+    """A directory on the host that is available in the container under a
+    different path.
+
+    """
+
+    host_prefix: str
+    container_prefix: str
+
+    @staticmethod
+    def parse(mapping: str) -> PathMapping:
+        """Create a mapping from a string in the form ``HOST_DIR=CONTAINER_DIR``."""
+        host, sep, container = mapping.partition("=")
+        if not sep or not host or not container:
+            raise ValueError(
+                f"Invalid path mapping '{mapping}', expected HOST=CONTAINER"
+            )
+        return PathMapping(os.path.normpath(host), os.path.normpath(container))
+
+
+def _replace_prefix(path: str, old_prefix: str, new_prefix: str) -> Optional[str]:
+    if path == old_prefix:
+        return new_prefix
+    if path.startswith(old_prefix.rstrip("/") + "/"):
+        return os.path.join(new_prefix, os.path.relpath(path, old_prefix))
+    return None
+
+
+class PathMapper:
+    """Translates paths between the host (where the editor runs) and the
+    container (where the server runs).
+
+    The mappings are matched by the longest prefix. Paths that are not covered
+    by any mapping are put into ``legacy_mount_path`` (if set), which is where
+    the package directory is mounted in the single package container mode.
+
+    """
+
+    def __init__(
+        self,
+        mappings: Iterable[PathMapping] = (),
+        legacy_mount_path: str = "",
+        cache_size: int = RESOLVED_URIS_CACHE_SIZE,
+    ) -> None:
+        self._mappings = sorted(
+            mappings, key=lambda m: len(m.host_prefix), reverse=True
+        )
+        self._legacy_mount_path = legacy_mount_path
+        self._cache_size = cache_size
+        #: uri -> resolved path of the spec in the container, the least
+        #: recently used uris are dropped
+        self._resolved: OrderedDict[str, Optional[str]] = OrderedDict()
+
+    @property
+    def is_identity(self) -> bool:
+        return not self._mappings and not self._legacy_mount_path
+
+    def to_container(self, host_path: str) -> str:
+        host_path = os.path.normpath(host_path)
+        for mapping in self._mappings:
+            if (
+                path := _replace_prefix(
+                    host_path, mapping.host_prefix, mapping.container_prefix
+                )
+            ) is not None:
+                return path
+
+        if self._legacy_mount_path:
+            return os.path.join(self._legacy_mount_path, os.path.basename(host_path))
+
+        return host_path
+
+    def container_directory(self, host_dir: str) -> str:
+        """Return where the directory ``host_dir`` is available in the container
+        (in the single package container mode: the mount point).
+
+        """
+        if self._mappings or not self._legacy_mount_path:
+            return self.to_container(host_dir)
+        return self._legacy_mount_path
+
+    def to_host(self, container_path: str) -> str:
+        """Map a path in the container back to the host, paths that only exist in
+        the container are returned unchanged.
+
+        """
+        container_path = os.path.normpath(container_path)
+        for mapping in sorted(
+            self._mappings, key=lambda m: len(m.container_prefix), reverse=True
+        ):
+            if (
+                path := _replace_prefix(
+                    container_path, mapping.container_prefix, mapping.host_prefix
+                )
+            ) is not None:
+                return path
+        return container_path
+
+    def uri_from_path(self, container_path: str) -> str:
+        """Create the uri that the client knows for the file ``container_path``."""
+        return f"file://{quote(self.to_host(container_path))}"
+
+    def spec_path_from_uri(self, uri: str) -> Optional[str]:
+        """Return the path under which the spec with the ``uri`` can be read by
+        the server or ``None`` if ``uri`` is not a spec on the local file system.
+
+        """
+        if uri in self._resolved:
+            self._resolved.move_to_end(uri)
+            return self._resolved[uri]
+
+        url = urlparse(uri)
+        path = unquote(url.path)
+
+        self._resolved[uri] = resolved = (
+            self.to_container(path)
+            if url.scheme == "file" and path.endswith(".spec")
+            else None
+        )
+        if len(self._resolved) > self._cache_size:
+            self._resolved.popitem(last=False)
+        return resolved
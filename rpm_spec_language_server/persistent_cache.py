@@ -0,0 +1,217 @@
+"""Parse results that are kept on disk between runs of the server, so that a
+freshly started server does not have to parse every spec again.
+
+The results are stored in a single SQLite database (by default in
+``$XDG_CACHE_HOME/rpm-spec-language-server/``), which can be shared by
+multiple server processes. The entries are keyed by the result id of the
+analysis, i.e. by the contents of the spec and the macro environment.
+
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
+from typing import Any, Optional
+
+from rpm_spec_language_server.logging import LOGGER
+
+#: entries that were not used for this many seconds are removed
+PERSISTENT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+#: the least recently used entries are removed once the cache is larger
+PERSISTENT_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+#: the cache is pruned after this many insertions
+_PRUNE_INTERVAL = 1000
+
+#: the last use of an entry is only updated if it is older than this (in
+#: seconds), so that reading the cache rarely writes to it
+_TOUCH_INTERVAL = 60 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def default_cache_path() -> str:
+    """The location of the persistent parse cache following the XDG base
+    directory specification.
+
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "rpm-spec-language-server", "parse-cache.sqlite")
+
+
+def _cache_version() -> str:
+    # the pickled results are only valid for the version that created them
+    return metadata.version("rpm_spec_language_server")
+
+
+class PersistentParseCache:
+    """Pickled parse results in a SQLite database at ``path``.
+
+    Entries that were not used for ``max_age`` seconds are pruned, as well as
+    the least recently used entries once the cache exceeds ``max_size`` bytes.
+    All errors of the database are logged and then treated as cache misses.
+
+    The server reads entries in a thread (see
+    :py:meth:`~rpm_spec_language_server.shared.ParseCache.get_async`) and
+    :py:meth:`put_in_background` stores them in a writer thread, so that neither
+    the database nor the (un)pickling block the event loop.
+
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = PERSISTENT_CACHE_MAX_SIZE,
+        max_age: float = PERSISTENT_CACHE_MAX_AGE,
+    ) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._insertions = 0
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="parse-cache"
+        )
+
+        if (directory := os.path.dirname(path)) and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        # the entries are read and written from different threads, the lock
+        # serializes the use of the connection
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+            version = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            if version is None or version[0] != _cache_version():
+                self._db.execute("DELETE FROM results")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                    (_cache_version(),),
+                )
+
+        self.prune()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0])
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        try:
+            with self._lock, self._db:
+                if (
+                    row := self._db.execute(
+                        "SELECT value FROM results WHERE key = ?", (key,)
+                    ).fetchone()
+                ) is None:
+                    return None
+
+                self._db.execute(
+                    "UPDATE results SET accessed = ? WHERE key = ? AND accessed < ?",
+                    (now, key, now - _TOUCH_INTERVAL),
+                )
+        except sqlite3.Error as db_err:
+            LOGGER.debug("Failed to read %s from the parse cache: %s", key, db_err)
+            return None
+
+        try:
+            return pickle.loads(zlib.decompress(row[0]))
+        except Exception as exc:
+            LOGGER.debug("Dropping unreadable parse cache entry %s: %s", key, exc)
+            self.discard(key)
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), time.time()),
+                )
+        except sqlite3.Error as db_err:
+            LOGGER.debug("Failed to write %s into the parse cache: %s", key, db_err)
+            return
+
+        self._insertions += 1
+        if self._insertions % _PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def put_in_background(self, key: str, value: Any) -> None:
+        """Store ``value`` under ``key`` in the writer thread, ``value`` must not
+        be modified afterwards.
+
+        """
+        try:
+            self._writer.submit(self.put, key, value)
+        except RuntimeError:
+            # the cache was closed
+            LOGGER.debug("Not writing %s into the closed parse cache", key)
+
+    def flush(self) -> None:
+        """Wait until all entries that are stored in the background are written."""
+        self._writer.submit(lambda: None).result()
+
+    def discard(self, key: str) -> None:
+        try:
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+        except sqlite3.Error as db_err:
+            LOGGER.debug("Failed to remove %s from the parse cache: %s", key, db_err)
+
+    def prune(self) -> None:
+        """Remove the expired entries and then the least recently used ones
+        until the cache is no larger than ``max_size``.
+
+        """
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "DELETE FROM results WHERE accessed < ?",
+                    (time.time() - self.max_age,),
+                )
+
+                size = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM results"
+                ).fetchone()[0]
+                if size <= self.max_size:
+                    return
+
+                removed = []
+                for key, entry_size in self._db.execute(
+                    "SELECT key, size FROM results ORDER BY accessed"
+                ):
+                    if size <= self.max_size:
+                        break
+                    removed.append((key,))
+                    size -= entry_size
+
+                self._db.executemany("DELETE FROM results WHERE key = ?", removed)
+        except sqlite3.Error as db_err:
+            LOGGER.debug("Failed to prune the parse cache: %s", db_err)
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
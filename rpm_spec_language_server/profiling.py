@@ -0,0 +1,224 @@
+"""Profile the LSP handlers of a running server on demand.
+
+While profiling, the handlers in the feature table of the server are replaced
+by wrappers that run them under :py:mod:`cProfile`. Once the requested number
+of requests have been handled or the time is up, the original handlers are
+put back and a profile per handler is written into the output directory.
+
+The blocking calls that a handler runs in another thread (e.g. into rpm in the
+rpm executor) are profiled in that thread and merged into the profile of the
+handler.
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Optional, TypeVar
+
+from lsprotocol.types import EXIT, SHUTDOWN
+
+from rpm_spec_language_server.logging import LOGGER
+
+#: handlers that end the profiling session and are thus not profiled
+_UNPROFILED = (SHUTDOWN, EXIT)
+
+#: the method of the handler that is being profiled in the current context
+_PROFILED_METHOD: ContextVar[Optional[str]] = ContextVar(
+    "_PROFILED_METHOD", default=None
+)
+
+_T = TypeVar("_T")
+
+
+class HandlerProfiler:
+    """Profiles the handlers in ``handlers`` (the live feature table of the
+    server, i.e. method name → handler) and writes the profiles into
+    ``output_dir``.
+
+    """
+
+    def __init__(
+        self, handlers: dict[str, Callable[..., Any]], output_dir: str
+    ) -> None:
+        self.output_dir = output_dir
+        self._handlers = handlers
+        self._originals: dict[str, Callable[..., Any]] = {}
+        self._profiles: dict[str, cProfile.Profile] = {}
+        self._remaining_requests: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        #: a profile is currently enabled (there can only be one at a time)
+        self._profiling = False
+        #: profiles of the calls in other threads per method, guarded by _lock
+        self._thread_stats: dict[str, pstats.Stats] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return bool(self._originals)
+
+    def start(
+        self, requests: Optional[int] = None, seconds: Optional[float] = None
+    ) -> None:
+        """Profile the next ``requests`` requests or all requests in the next
+        ``seconds`` seconds, whichever happens first. Profiling continues until
+        :py:meth:`stop` is called if neither is set.
+
+        A running profiling session is stopped first.
+
+        """
+        if self.active:
+            self.stop()
+
+        self._remaining_requests = requests
+        self._deadline = time.monotonic() + seconds if seconds else None
+        with self._lock:
+            self._thread_stats.clear()
+
+        for method, handler in list(self._handlers.items()):
+            if method in _UNPROFILED:
+                continue
+            self._originals[method] = handler
+            self._handlers[method] = self._wrap(method, handler)
+
+        if seconds:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+            except RuntimeError:
+                # not started from within the server, the deadline is checked
+                # on every request instead
+                pass
+
+        LOGGER.info("Profiling handlers (requests: %s, seconds: %s)", requests, seconds)
+
+    def stop(self) -> list[str]:
+        """Put back the original handlers and write the collected profiles.
+
+        Returns the paths of the written profiles.
+
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._handlers.update(self._originals)
+        self._originals.clear()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        with self._lock:
+            thread_stats, self._thread_stats = self._thread_stats, {}
+
+        paths = []
+        for method, profile in self._profiles.items():
+            path = os.path.join(
+                self.output_dir,
+                f"rpm_lsp_profile-{timestamp}-{method.replace('/', '_')}.prof",
+            )
+            stats = pstats.Stats(profile)
+            if (in_threads := thread_stats.get(method)) is not None:
+                stats.add(in_threads)
+            stats.dump_stats(path)
+            paths.append(path)
+
+        self._profiles.clear()
+        if paths:
+            LOGGER.info("Wrote profiles to %s", ", ".join(paths))
+        return paths
+
+    def in_thread(self, func: Callable[..., _T]) -> Callable[..., _T]:
+        """Wrap ``func``, which the current handler runs in another thread, so
+        that it is profiled there if the handler is profiled.
+
+        """
+        if (method := _PROFILED_METHOD.get()) is None or method not in self._profiles:
+            return func
+
+        @functools.wraps(func)
+        def profiled(*args: Any) -> _T:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # since Python 3.12 there is only a single active profile, which
+                # covers all threads
+                return func(*args)
+
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+                self._add_thread_profile(method, profile)
+
+        return profiled
+
+    def _add_thread_profile(self, method: str, profile: cProfile.Profile) -> None:
+        with self._lock:
+            if (stats := self._thread_stats.get(method)) is None:
+                self._thread_stats[method] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+    def _profile(self, method: str) -> Optional[cProfile.Profile]:
+        if self._profiling:
+            return None
+
+        if (profile := self._profiles.get(method)) is None:
+            profile = self._profiles[method] = cProfile.Profile()
+        return profile
+
+    def _request_done(self) -> None:
+        if self._remaining_requests is not None:
+            self._remaining_requests -= 1
+
+        if (self._remaining_requests is not None and self._remaining_requests <= 0) or (
+            self._deadline is not None and time.monotonic() >= self._deadline
+        ):
+            self.stop()
+
+    def _wrap(self, method: str, handler: Callable[..., Any]) -> Callable[..., Any]:
+        if asyncio.iscoroutinefunction(handler):
+
+            @functools.wraps(handler)
+            async def profiled_coroutine(*args: Any, **kwargs: Any) -> Any:
+                if (profile := self._profile(method)) is None:
+                    return await handler(*args, **kwargs)
+
+                # everything that runs on the event loop while the coroutine
+                # is suspended ends up in this profile too
+                self._profiling = True
+                token = _PROFILED_METHOD.set(method)
+                profile.enable()
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    profile.disable()
+                    _PROFILED_METHOD.reset(token)
+                    self._profiling = False
+                    self._request_done()
+
+            return profiled_coroutine
+
+        @functools.wraps(handler)
+        def profiled(*args: Any, **kwargs: Any) -> Any:
+            if (profile := self._profile(method)) is None:
+                return handler(*args, **kwargs)
+
+            self._profiling = True
+            token = _PROFILED_METHOD.set(method)
+            try:
+                return profile.runcall(handler, *args, **kwargs)
+            finally:
+                _PROFILED_METHOD.reset(token)
+                self._profiling = False
+                self._request_done()
+
+        return profiled
@@ -0,0 +1,87 @@
+"""Record the JSON-RPC messages of a session so that it can be replayed later,
+e.g. to reproduce a slowdown that was reported together with a recording.
+
+Every line of a recording is a JSON object with the keys ``time`` (seconds
+since the start of the recording), ``direction`` (``client`` for messages
+received from the client, ``server`` for messages sent by the server) and
+``message`` (the JSON-RPC message).
+
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections.abc import Iterator
+from typing import IO, Any
+
+from pygls.protocol import JsonRPCProtocol
+
+#: the message was received from the client
+FROM_CLIENT = "client"
+
+#: the message was sent by the server
+FROM_SERVER = "server"
+
+
+class SessionRecorder:
+    """Appends the messages of a session to ``output``."""
+
+    def __init__(self, output: IO[str]) -> None:
+        self._output = output
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, direction: str, message: Any) -> None:
+        line = json.dumps(
+            {
+                "time": time.monotonic() - self._start,
+                "direction": direction,
+                "message": message,
+            }
+        )
+        with self._lock:
+            if self._output.closed:
+                return
+            self._output.write(line + "\n")
+            self._output.flush()
+
+    def close(self) -> None:
+        """Stop recording and close the output."""
+        with self._lock:
+            self._output.close()
+
+    def attach(self, protocol: JsonRPCProtocol) -> None:
+        """Record all messages that ``protocol`` receives and sends."""
+        structure_message = protocol.structure_message
+        send_data = protocol._send_data
+
+        def recording_structure_message(data: dict[str, Any]) -> Any:
+            # nested objects are passed in as well, only the messages have the
+            # jsonrpc key
+            if "jsonrpc" in data:
+                self.record(FROM_CLIENT, data)
+            return structure_message(data)
+
+        def recording_send_data(data: Any) -> None:
+            if data:
+                self.record(
+                    FROM_SERVER,
+                    json.loads(json.dumps(data, default=protocol._serialize_message)),
+                )
+            send_data(data)
+
+        protocol.structure_message = recording_structure_message  # type: ignore[method-assign]
+        protocol._send_data = recording_send_data  # type: ignore[method-assign]
+
+
+def read_recording(recording: IO[str]) -> Iterator[tuple[float, str, dict[str, Any]]]:
+    """Yield the time, the direction and the message of every recorded
+    message.
+
+    """
+    for line in recording:
+        if line.strip():
+            entry = json.loads(line)
+            yield entry["time"], entry["direction"], entry["message"]
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Optional
+
+from lsprotocol.types import (
+    SemanticTokenModifiers,
+    SemanticTokensEdit,
+    SemanticTokensLegend,
+    SemanticTokenTypes,
+)
+from specfile.constants import SECTION_NAMES, TAG_NAMES
+
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.macros import (
+    CONDITION_KEYWORDS,
+    MACRO_DEFINING_MACROS,
+    LineMacroTokens,
+    MacroToken,
+    MacroTokenKind,
+    tokenize_macros,
+)
+
+
+class TokenType(IntEnum):
+    """Index of the token type in :py:const:`LEGEND`."""
+
+    MACRO = 0
+    KEYWORD = 1
+    SECTION = 2
+    TAG = 3
+    COMMENT = 4
+
+
+class TokenModifier(IntEnum):
+    """Bit of the token modifier in :py:const:`LEGEND`."""
+
+    DEFINITION = 1 << 0
+
+
+LEGEND = SemanticTokensLegend(
+    token_types=[
+        SemanticTokenTypes.Macro,
+        SemanticTokenTypes.Keyword,
+        SemanticTokenTypes.Namespace,
+        SemanticTokenTypes.Property,
+        SemanticTokenTypes.Comment,
+    ],
+    token_modifiers=[SemanticTokenModifiers.Definition],
+)
+
+#: number of integers that encode a single token
+_TOKEN_LENGTH = 5
+
+_LEADING_MACRO_RE = re.compile(r"%(\w+)")
+
+# Name(qualifier):, the digits allow for SourceN & PatchN
+_TAG_RE = re.compile(r"([A-Za-z]+)\d*(?:\([^)]*\))?[\t ]*:")
+
+
+@dataclass(frozen=True)
+class SemanticToken:
+    line: int
+    start: int
+    length: int
+    token_type: TokenType
+    modifiers: int = 0
+
+
+def tokenize_line(
+    line: str,
+    line_number: int,
+    macro_tokens: Optional[Iterable[MacroToken]] = None,
+    tags: bool = True,
+) -> list[SemanticToken]:
+    """Split the line ``line`` into semantic tokens sorted by their column.
+
+    The line is only tokenized for macros if its ``macro_tokens`` are not
+    passed. Tags are only highlighted if the line can contain ``tags``, i.e.
+    if it is in the preamble or in a ``%package`` section.
+
+    """
+    stripped = line.lstrip()
+    indent = len(line) - len(stripped)
+
+    if stripped.startswith("#"):
+        return [SemanticToken(line_number, indent, len(stripped), TokenType.COMMENT)]
+
+    tokens: list[SemanticToken] = []
+    # end of the column range that is already covered by a keyword/section
+    covered = -1
+
+    if (m := _LEADING_MACRO_RE.match(stripped)) is not None:
+        token_type: Optional[TokenType]
+        if m.group(0) in CONDITION_KEYWORDS:
+            token_type = TokenType.KEYWORD
+        elif indent == 0 and m.group(1) in SECTION_NAMES:
+            token_type = TokenType.SECTION
+        else:
+            token_type = None
+
+        if token_type is not None:
+            tokens.append(SemanticToken(line_number, indent, m.end(), token_type))
+            covered = indent + m.end()
+
+    elif (
+        tags
+        and (m := _TAG_RE.match(line)) is not None
+        and m.group(1).lower() in TAG_NAMES
+    ):
+        tokens.append(SemanticToken(line_number, 0, m.end(1), TokenType.TAG))
+
+    if macro_tokens is None:
+        macro_tokens = tokenize_macros(line, line_number)
+
+    for macro_token in macro_tokens:
+        if macro_token.start < covered or macro_token.kind == MacroTokenKind.ESCAPE:
+            continue
+
+        if (occurrence := macro_token.occurrence) is None:
+            tokens.append(
+                SemanticToken(
+                    line_number,
+                    macro_token.start,
+                    macro_token.end - macro_token.start,
+                    TokenType.COMMENT,
+                )
+            )
+            continue
+
+        start, modifiers = occurrence.start, 0
+        if occurrence.is_definition:
+            token_type, modifiers = TokenType.MACRO, TokenModifier.DEFINITION
+        elif occurrence.name in MACRO_DEFINING_MACROS:
+            # highlight %global like the other keywords including the %
+            token_type = TokenType.KEYWORD
+            if line[start - 1] == "%":
+                start -= 1
+        else:
+            token_type = TokenType.MACRO
+
+        tokens.append(
+            SemanticToken(
+                line_number, start, occurrence.end - start, token_type, modifiers
+            )
+        )
+
+    return tokens
+
+
+def tokenize(
+    lines: Iterable[str],
+    first_line: int = 0,
+    macro_lines: Optional[Sequence[LineMacroTokens]] = None,
+    sections: Optional[SpecSections] = None,
+) -> Iterator[SemanticToken]:
+    """Tokenize all ``lines`` in a single pass, the first line has the line
+    number ``first_line``.
+
+    ``macro_lines`` are the macro tokens of all lines of the document (see
+    :py:attr:`~rpm_spec_language_server.macros.MacroIndex.lines`), which are
+    reused instead of tokenizing the lines for macros again. If the
+    ``sections`` of the document are passed, tags are only highlighted in the
+    preamble and in the ``%package`` sections.
+
+    """
+    # start and end of the sections that contain tags
+    packages = (
+        None
+        if sections is None
+        else [
+            (section.starting_line, section.ending_line)
+            for section in sections.sections
+            if section.name.startswith("package")
+        ]
+    )
+    package = 0
+
+    for line_number, line in enumerate(lines, start=first_line):
+        if packages is None:
+            tags = True
+        else:
+            while package < len(packages) and packages[package][1] <= line_number:
+                package += 1
+            tags = package < len(packages) and packages[package][0] <= line_number
+
+        yield from tokenize_line(
+            line,
+            line_number,
+            None if macro_lines is None else macro_lines[line_number].tokens,
+            tags,
+        )
+
+
+def encode_tokens(tokens: Iterable[SemanticToken]) -> list[int]:
+    """Encode the ``tokens`` into the relative integer representation of the
+    LSP.
+
+    """
+    data: list[int] = []
+    prev_line, prev_start = 0, 0
+
+    for token in tokens:
+        delta_line = token.line - prev_line
+        data.extend(
+            (
+                delta_line,
+                token.start - prev_start if delta_line == 0 else token.start,
+                token.length,
+                int(token.token_type),
+                int(token.modifiers),
+            )
+        )
+        prev_line, prev_start = token.line, token.start
+
+    return data
+
+
+def semantic_tokens_edits(
+    old: Sequence[int], new: Sequence[int]
+) -> list[SemanticTokensEdit]:
+    """Compute the edits that transform the encoded tokens ``old`` into
+    ``new``.
+
+    Only the span between the common prefix and the common suffix (aligned
+    to whole tokens) is sent.
+
+    """
+    max_common = min(len(old), len(new))
+
+    prefix = 0
+    while prefix < max_common and old[prefix] == new[prefix]:
+        prefix += 1
+    prefix -= prefix % _TOKEN_LENGTH
+
+    if prefix == len(old) == len(new):
+        return []
+
+    suffix = 0
+    while suffix < max_common - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    suffix -= suffix % _TOKEN_LENGTH
+
+    return [
+        SemanticTokensEdit(
+            start=prefix,
+            delete_count=len(old) - prefix - suffix,
+            data=new[prefix : len(new) - suffix],
+        )
+    ]
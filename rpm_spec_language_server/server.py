@@ -1,93 +1,389 @@
+import asyncio
+import functools
 import os.path
 import re
+import tempfile
+import uuid
+from collections.abc import Iterable, Sequence
+from dataclasses import replace
+from enum import Enum, auto
+from fnmatch import fnmatch
 from importlib import metadata
-from typing import Optional, Union, overload
-from urllib.parse import unquote, urlparse
+from itertools import count
+from typing import Any, Callable, Optional, TypeVar, Union
+from urllib.parse import quote, unquote, urlparse
 
 import rpm
 from lsprotocol.types import (
+    EXIT,
     INITIALIZE,
+    INITIALIZED,
+    PROGRESS,
+    SHUTDOWN,
     TEXT_DOCUMENT_COMPLETION,
     TEXT_DOCUMENT_DEFINITION,
+    TEXT_DOCUMENT_DIAGNOSTIC,
     TEXT_DOCUMENT_DID_CHANGE,
     TEXT_DOCUMENT_DID_CLOSE,
     TEXT_DOCUMENT_DID_OPEN,
     TEXT_DOCUMENT_DID_SAVE,
+    TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT,
     TEXT_DOCUMENT_DOCUMENT_SYMBOL,
+    TEXT_DOCUMENT_FOLDING_RANGE,
     TEXT_DOCUMENT_HOVER,
+    TEXT_DOCUMENT_PREPARE_RENAME,
+    TEXT_DOCUMENT_REFERENCES,
+    TEXT_DOCUMENT_RENAME,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_RANGE,
+    WORKSPACE_DIAGNOSTIC,
+    WORKSPACE_DID_CHANGE_WATCHED_FILES,
     ClientInfo,
     CompletionItem,
     CompletionList,
     CompletionOptions,
     CompletionParams,
     DefinitionParams,
+    DiagnosticOptions,
     DidChangeTextDocumentParams,
+    DidChangeWatchedFilesParams,
+    DidChangeWatchedFilesRegistrationOptions,
     DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
     DidSaveTextDocumentParams,
+    DocumentDiagnosticParams,
+    DocumentDiagnosticReport,
+    DocumentHighlight,
+    DocumentHighlightKind,
+    DocumentHighlightParams,
     DocumentSymbol,
     DocumentSymbolParams,
+    FileChangeType,
+    FileEvent,
+    FileSystemWatcher,
+    FoldingRange,
+    FoldingRangeParams,
     Hover,
     HoverParams,
+    InitializedParams,
     InitializeParams,
     Location,
     LocationLink,
     MarkupContent,
     MarkupKind,
     Position,
+    PrepareRenameParams,
+    ProgressParams,
     Range,
+    ReferenceParams,
+    Registration,
+    RegistrationParams,
+    RelatedFullDocumentDiagnosticReport,
+    RelatedUnchangedDocumentDiagnosticReport,
+    RelativePattern,
+    RenameParams,
+    SemanticTokens,
+    SemanticTokensDelta,
+    SemanticTokensDeltaParams,
+    SemanticTokensParams,
+    SemanticTokensRangeParams,
     SymbolInformation,
+    TextDocumentContentChangeEvent,
+    TextDocumentContentChangePartial,
     TextDocumentIdentifier,
     TextDocumentItem,
+    TextEdit,
+    WorkspaceDiagnosticParams,
+    WorkspaceDiagnosticReport,
+    WorkspaceDiagnosticReportPartialResult,
+    WorkspaceDocumentDiagnosticReport,
+    WorkspaceEdit,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
 )
+from pygls.exceptions import JsonRpcInvalidParams
 from pygls.lsp.server import LanguageServer
+from pygls.protocol import LanguageServerProtocol
+from pygls.workspace import TextDocument
 from specfile.exceptions import RPMException
 from specfile.macros import Macro, MacroLevel, Macros
 from specfile.specfile import Specfile
 
+from rpm_spec_language_server.check import spec_paths
+from rpm_spec_language_server.diagnostics import (
+    DIAGNOSTICS_DEBOUNCE,
+    DiagnosticsPublisher,
+    spec_diagnostics,
+)
 from rpm_spec_language_server.document_symbols import SpecSections
-from rpm_spec_language_server.extract_docs import (
-    create_autocompletion_documentation_from_spec_md,
-    retrieve_spec_md,
+from rpm_spec_language_server.extract_docs import AutoCompleteDoc
+from rpm_spec_language_server.includes import (
+    IncludeGraph,
+    include_stamp,
+    included_files,
 )
 from rpm_spec_language_server.logging import LOGGER
 from rpm_spec_language_server.macros import (
-    get_macro_string_at_position,
+    CONDITION_KEYWORDS,
+    MacroIndex,
+    MacroOccurrence,
+    is_valid_macro_name,
+)
+from rpm_spec_language_server.paths import PathMapper, PathMapping
+from rpm_spec_language_server.profiling import HandlerProfiler
+from rpm_spec_language_server.semantic_tokens import (
+    LEGEND,
+    encode_tokens,
+    semantic_tokens_edits,
+    tokenize,
 )
+from rpm_spec_language_server.shared import ParseResult, SharedCaches, deep_sizeof
+from rpm_spec_language_server.snapshots import SpecSnapshot
+from rpm_spec_language_server.stats import ServerStats, instrument
 from rpm_spec_language_server.util import (
+    content_hash,
+    parse_spec_text,
     position_from_match,
-    spec_from_text,
 )
 
+#: custom request reporting the approximate memory usage of the session
+MEMORY_REQUEST = "rpmspec/memory"
 
-class RpmSpecLanguageServer(LanguageServer):
-    _CONDITION_KEYWORDS = [
-        # from https://github.com/rpm-software-management/rpm/blob/7d3d9041af2d75c4709cf7a721daf5d1787cce14/build/rpmbuild_internal.h#L58
-        "%endif",
-        "%else",
-        "%if",
-        "%ifarch",
-        "%ifnarch",
-        "%ifos",
-        "%ifnos",
-        "%include",
-        "%elifarch",
-        "%elifos",
-        "%elif",
+#: custom request reporting the latencies of the handlers and cache hit rates
+STATS_REQUEST = "rpmspec/stats"
+
+#: command that profiles the next requests, takes the number of requests and
+#: the number of seconds (both optional) as arguments
+PROFILE_COMMAND = "rpmspec.profile"
+
+#: command that stops profiling and writes the profiles
+STOP_PROFILING_COMMAND = "rpmspec.stopProfiling"
+
+#: name under which the analyses of open documents by rpm are recorded in the
+#: statistics, as the didChange handler only schedules them
+SEMANTIC_ANALYSIS_STATS = "rpmspec/semanticAnalysis"
+
+
+def macro_file_patterns() -> list[tuple[str, str]]:
+    """The directories and the file name patterns of the files from which rpm
+    loads macros.
+
+    """
+    return [
+        (rpm.expandMacro("%{_rpmconfigdir}"), "macros"),
+        (rpm.expandMacro("%{_rpmmacrodir}"), "macros.*"),
+        (os.path.join(rpm.expandMacro("%{_sysconfdir}"), "rpm"), "macros*"),
+        (os.path.expanduser("~"), ".rpmmacros"),
     ]
 
-    def __init__(self, container_mount_path: Optional[str] = None) -> None:
+
+def read_macro_indexes(
+    specs: Iterable[tuple[str, str]],
+) -> list[tuple[str, MacroIndex]]:
+    """Build the macro indexes of the specs ``specs`` (pairs of the uri and the
+    path of a spec) from their contents on disk, unreadable specs are skipped.
+
+    """
+    indexes = []
+    for uri, path in specs:
+        try:
+            with open(path) as spec_f:
+                indexes.append((uri, MacroIndex.from_text(spec_f.read())))
+        except (OSError, UnicodeDecodeError) as err:
+            LOGGER.debug("Failed to read spec %s, got %s", path, err)
+    return indexes
+
+
+_T = TypeVar("_T")
+
+#: number of specs that are indexed in one go while indexing the workspace
+WORKSPACE_INDEX_CHUNK_SIZE = 64
+
+#: delay in seconds after the last change of a document before it is analyzed
+#: by rpm
+SEMANTIC_ANALYSIS_DELAY = DIAGNOSTICS_DEBOUNCE
+
+
+class AnalysisTier(Enum):
+    """The analysis of a document that a feature needs."""
+
+    #: the structure of the spec (sections, tags, macro occurrences and
+    #: tokens), found in the text of the current version of the document
+    SYNTACTIC = auto()
+
+    #: the spec as parsed by rpm (macro expansion, evaluated conditionals and
+    #: parse errors), updated once no change arrived for
+    #: ``SEMANTIC_ANALYSIS_DELAY`` seconds or when the document is saved
+    SEMANTIC = auto()
+
+
+def analyze_spec(
+    text: str, file_name: str, sourcedir: Optional[str] = None
+) -> ParseResult:
+    """Parse the spec with the contents ``text`` and collect its diagnostics
+    (blocks on rpm).
+
+    The sections of specs that rpm fails to parse (e.g. while they are being
+    edited) are found by scanning the text, so that they match the document.
+
+    """
+    spec, rpm_exc = parse_spec_text(text, file_name, sourcedir)
+    return ParseResult(
+        sections=(
+            SpecSections.parse(spec, text, sourcedir)
+            if spec
+            else SpecSections.scan(text, file_name, sourcedir)
+        ),
+        diagnostics=spec_diagnostics(text, rpm_exc),
+        parsed=spec is not None,
+    )
+
+
+class RpmSpecLanguageServer(LanguageServer):
+    _CONDITION_KEYWORDS = CONDITION_KEYWORDS
+
+    def __init__(
+        self,
+        container_mount_path: Optional[str] = None,
+        shared: Optional[SharedCaches] = None,
+        protocol_cls: type[LanguageServerProtocol] = LanguageServerProtocol,
+        path_mappings: Iterable[PathMapping] = (),
+        stats: Optional[ServerStats] = None,
+        profile_dir: Optional[str] = None,
+    ) -> None:
         super().__init__(
             name := "rpm_spec_language_server",
             metadata.version(name),
+            protocol_cls=protocol_cls,
         )
         self._client_info: Optional[ClientInfo] = None
-        self.spec_files: dict[str, SpecSections] = {}
-        self.macros = Macros.dump()
-        self.auto_complete_data = create_autocompletion_documentation_from_spec_md(
-            retrieve_spec_md() or ""
+        #: the latest parsed contents per document uri
+        self.snapshots: dict[str, SpecSnapshot] = {}
+        #: the ``Specfile`` in which the macros of a document are expanded and
+        #: the sections from which it was parsed, per document uri
+        self._expansion_specs: dict[str, tuple[SpecSections, Optional[Specfile]]] = {}
+        #: the sections of the latest version of each open document that rpm
+        #: could parse, their macros are expanded while rpm fails to parse it
+        self._parsed_sections: dict[str, SpecSections] = {}
+        #: caches that can be shared with other sessions in the same process
+        self.shared = shared or SharedCaches()
+        self.path_mapper = PathMapper(path_mappings, container_mount_path or "")
+
+        #: inverted macro usage index per document uri
+        self.macro_indexes: dict[str, MacroIndex] = {}
+        #: index all spec files in the workspace and not only open documents
+        self.index_workspace: bool = False
+        self._workspace_indexed: bool = False
+        self._workspace_index_task: Optional[asyncio.Task[None]] = None
+
+        #: files included by the documents (paths in the container)
+        self.include_graph = IncludeGraph()
+        self._watched_files: set[str] = set()
+        #: documents that are analyzed again in the background
+        self._reparse_queue: list[str] = []
+        self._reparse_task: Optional[asyncio.Task[None]] = None
+
+        #: the analysis tier that every registered feature needs
+        self.feature_tiers: dict[str, AnalysisTier] = {}
+        #: pending and running analyses by rpm per document uri
+        self._semantic_timers: dict[str, asyncio.TimerHandle] = {}
+        self._semantic_tasks: dict[str, asyncio.Task[Optional[SpecSections]]] = {}
+        #: running scans of the open documents per uri and the scanned version
+        self._syntactic_scans: dict[
+            str, tuple[Optional[int], asyncio.Future[SpecSections]]
+        ] = {}
+
+        #: the last semantic tokens that were sent per document uri
+        self.semantic_tokens: dict[str, SemanticTokens] = {}
+        self._semantic_tokens_ids = count()
+
+        self.diagnostics = DiagnosticsPublisher(self.text_document_publish_diagnostics)
+
+        #: handler statistics, ``None`` if they are not collected
+        self.stats = stats
+        if stats is not None:
+            stats.track_cache("parse", self.shared.parse_cache)
+            stats.measure_responses(self.protocol)
+
+        self.profiler = HandlerProfiler(
+            self.protocol.fm.features, profile_dir or tempfile.gettempdir()
+        )
+
+    def feature(
+        self,
+        feature_name: str,
+        options: Optional[Any] = None,
+        tier: AnalysisTier = AnalysisTier.SYNTACTIC,
+    ) -> Callable:
+        """Register a handler for ``feature_name`` that needs the analysis
+        ``tier`` of the document and that records its latency if statistics are
+        collected.
+
+        Handlers of the semantic tier wait for the pending analysis of the
+        document by rpm before they run.
+
+        """
+        register = super().feature(feature_name, options)
+        self.feature_tiers[feature_name] = tier
+
+        def register_with_tier(f: Callable) -> Callable:
+            handler = f
+            if tier == AnalysisTier.SEMANTIC:
+                handler = self._after_semantic_analysis(f)
+            if (stats := self.stats) is not None:
+                handler = instrument(handler, feature_name, stats)
+            register(handler)
+            return f
+
+        return register_with_tier
+
+    @staticmethod
+    def _after_semantic_analysis(f: Callable) -> Callable:
+        @functools.wraps(f)
+        async def semantic_handler(
+            server: RpmSpecLanguageServer, params: Any, *args: Any, **kwargs: Any
+        ) -> Any:
+            if (text_document := getattr(params, "text_document", None)) is not None:
+                await server.ensure_semantic_analysis(text_document.uri)
+
+            result = f(server, params, *args, **kwargs)
+            return await result if asyncio.iscoroutine(result) else result
+
+        return semantic_handler
+
+    @property
+    def macros(self) -> list[Macro]:
+        return self.shared.macros
+
+    @property
+    def macro_fingerprint(self) -> str:
+        return self.shared.macro_fingerprint
+
+    @property
+    def auto_complete_data(self) -> AutoCompleteDoc:
+        return self.shared.auto_complete_data
+
+    def memory_usage(self) -> int:
+        """Approximate the memory in bytes that is used by this session alone,
+        i.e. without the shared caches.
+
+        """
+        return deep_sizeof(
+            [
+                self.snapshots,
+                self._parsed_sections,
+                self.macro_indexes,
+                self.semantic_tokens,
+                self.workspace.text_documents,
+            ],
+            exclude=[self.shared]
+            + [
+                result.sections
+                for result in self.shared.parse_cache.values()
+                if result.sections
+            ],
         )
-        self._container_path: str = container_mount_path or ""
 
     @property
     def is_vscode_connected(self) -> bool:
@@ -129,29 +425,797 @@ class RpmSpecLanguageServer(LanguageServer):
     def trigger_characters(self) -> list[str]:
         return list(set(tag[0] for tag in self.auto_complete_data.tags).union({"%"}))
 
-    def spec_sections_from_cache_or_file(
+    @property
+    def uses_pull_diagnostics(self) -> bool:
+        """Whether the client requests diagnostics itself, so that they must not
+        be pushed.
+
+        """
+        return (
+            text_document := self.client_capabilities.text_document
+        ) is not None and text_document.diagnostic is not None
+
+    def diagnostics_result_id(
+        self,
+        text: str,
+        includes: Sequence[str] = (),
+        file_name: str = "unnamed.spec",
+        sourcedir: Optional[str] = None,
+    ) -> str:
+        """The result id of the diagnostics of a spec with the contents
+        ``text``, it changes with the content, the macro environment, the
+        included files ``includes``, the file name of the spec and the
+        ``sourcedir`` in which it is parsed (they are part of the analysis).
+
+        """
+        return content_hash(
+            f"{self.macro_fingerprint}\0{text}\0{include_stamp(includes)}"
+            f"\0{file_name}\0{sourcedir or ''}"
+        )
+
+    def update_includes(self, uri: str, text: str) -> list[str]:
+        """Record the files that the spec ``uri`` with the contents ``text``
+        includes in the include graph and return all files that it includes
+        directly or indirectly.
+
+        Included files that are not yet in the graph are read from disk to
+        find the files that they include in turn.
+
+        """
+        if not (path := self._spec_path_from_uri(uri)):
+            self.include_graph.remove(uri)
+            return []
+
+        spec_dir = os.path.dirname(path)
+        self.include_graph.set_includes(uri, included_files(text, spec_dir))
+
+        for included in self.include_graph.transitive_includes(uri):
+            if included not in self.include_graph:
+                self._read_includes_of(included, spec_dir)
+
+        return self.include_graph.transitive_includes(uri)
+
+    def _read_includes_of(self, path: str, spec_dir: str) -> None:
+        try:
+            with open(path) as included_f:
+                contents = included_f.read()
+        except OSError as os_err:
+            LOGGER.debug("Failed to read included file %s, got %s", path, os_err)
+            contents = ""
+
+        # rpm resolves relative paths relative to the including spec
+        self.include_graph.set_includes(path, included_files(contents, spec_dir))
+
+    @property
+    def open_documents(self) -> dict[str, TextDocument]:
+        """The documents that are open in the editor, there are none if the
+        server was not started (e.g. when it is used as a library).
+
+        """
+        try:
+            return self.workspace.text_documents
+        except RuntimeError:
+            return {}
+
+    def document_text(self, uri: str) -> Optional[str]:
+        """Return the contents of the document ``uri`` from the editor buffer if
+        it is open or from disk.
+
+        """
+        if (document := self.open_documents.get(uri)) is not None:
+            return document.source
+
+        if not (path := self._spec_path_from_uri(uri)):
+            return None
+
+        try:
+            with open(path) as spec_f:
+                return spec_f.read()
+        except OSError as os_err:
+            LOGGER.debug("Failed to read spec %s, got %s", path, os_err)
+            return None
+
+    async def analyze_text(
+        self,
+        text: str,
+        file_name: str,
+        includes: Sequence[str] = (),
+        sourcedir: Optional[str] = None,
+    ) -> tuple[str, ParseResult]:
+        """Parse the spec with the contents ``text`` and collect its diagnostics.
+
+        The spec is parsed in the rpm executor, so that the event loop keeps
+        handling messages in the meantime. The result is taken from the shared
+        parse cache if the same contents (including the files ``includes``) were
+        already analyzed in the same macro environment (by any session).
+        Relative paths of ``%include`` directives are resolved in ``sourcedir``.
+        Returns the result id of the analysis and the result.
+
+        """
+        result_id = self.diagnostics_result_id(text, includes, file_name, sourcedir)
+
+        if (result := await self.shared.parse_cache.get_async(result_id)) is None:
+            result = await self.run_blocking(analyze_spec, text, file_name, sourcedir)
+            self.shared.parse_cache.put(result_id, result)
+
+        return result_id, result
+
+    async def run_blocking(self, func: Callable[..., _T], *args: Any) -> _T:
+        """Run the blocking call ``func(*args)`` (e.g. into rpm) in the shared
+        rpm executor, it is profiled as part of the handler that is currently
+        profiled.
+
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.shared.rpm_executor, self.profiler.in_thread(func), *args
+        )
+
+    async def parse_open_document(
+        self, uri: str, debounce: bool = True
+    ) -> Optional[SpecSections]:
+        """Parse the open document ``uri`` from the editor buffer in the rpm
+        executor, store the result in the cache and publish the diagnostics of
+        the document.
+
+        The sections of a spec that rpm cannot parse are found by scanning its
+        text. The result is dropped and ``None`` is returned if the document was
+        changed or closed in the meantime or if a newer version of the document
+        was parsed already. The diagnostics are published right away unless
+        ``debounce`` is set.
+
+        """
+        document = self.workspace.get_text_document(uri)
+        text, version = document.source, document.version
+        self.watch_files(includes := self.update_includes(uri, text))
+
+        _, result = await self.analyze_text(
+            text, os.path.basename(uri), includes, self.spec_directory(uri)
+        )
+
+        if (
+            not result.parsed
+            and result.sections is not None
+            and (parsed := self._parsed_sections.get(uri)) is not None
+            and parsed.name_tag == result.sections.name_tag
+            and parsed.name != result.sections.name
+        ):
+            # keep naming the subpackages after the expanded name in the outline
+            result = replace(
+                result,
+                sections=await asyncio.to_thread(
+                    SpecSections.scan,
+                    text,
+                    os.path.basename(uri),
+                    self.spec_directory(uri),
+                    parsed,
+                ),
+            )
+
+        if (
+            current := self.workspace.text_documents.get(uri)
+        ) is None or current.version != version:
+            LOGGER.debug("Dropping the outdated parse of %s", uri)
+            return None
+
+        return self._store_parse_result(uri, version, result, debounce)
+
+    def _store_parse_result(
+        self,
+        uri: str,
+        version: Optional[int],
+        result: ParseResult,
+        debounce: bool = True,
+    ) -> Optional[SpecSections]:
+        if not self.uses_pull_diagnostics:
+            if debounce:
+                self.diagnostics.schedule(uri, result.diagnostics, version)
+            else:
+                self.diagnostics.publish(uri, result.diagnostics, version)
+
+        if not result.sections or not self.store_snapshot(
+            SpecSnapshot.parse(uri, version, result.sections)
+        ):
+            return None
+
+        if result.parsed:
+            self._parsed_sections[uri] = result.sections
+        return result.sections
+
+    async def update_syntactic_layer(self, uri: str) -> SpecSnapshot:
+        """Scan the open document ``uri`` for its sections and tags unless its
+        current version was scanned or parsed already.
+
+        Documents are only scanned once a request needs their sections, so a
+        burst of changes is scanned once, and the scan runs in a thread.
+
+        """
+        document = self.workspace.get_text_document(uri)
+        if (
+            snapshot := self.snapshots.get(uri)
+        ) is not None and snapshot.version == document.version:
+            return snapshot
+
+        if (scan := self._syntactic_scans.get(uri)) is None or (
+            scan[0] != document.version
+        ):
+            self._syntactic_scans[uri] = scan = (
+                document.version,
+                asyncio.ensure_future(
+                    asyncio.to_thread(
+                        SpecSections.scan,
+                        document.source,
+                        os.path.basename(uri),
+                        self.spec_directory(uri),
+                        self._parsed_sections.get(uri),
+                    )
+                ),
+            )
+
+        # a cancelled request must not cancel the scan for the other ones
+        version, scanning = scan
+        sections = await asyncio.shield(scanning)
+        if self._syntactic_scans.get(uri) is scan:
+            del self._syntactic_scans[uri]
+
+        # rpm may have parsed the same version in the meantime
+        if (current := self.snapshots.get(uri)) is not None and (
+            current.version == version
+        ):
+            return current
+
+        snapshot = SpecSnapshot.parse(uri, version, sections)
+        self.store_snapshot(snapshot)
+        return snapshot
+
+    def schedule_semantic_analysis(self, uri: str) -> None:
+        """Let rpm analyze the open document ``uri`` once it was not changed
+        for ``SEMANTIC_ANALYSIS_DELAY`` seconds.
+
+        """
+        self.cancel_semantic_analysis(uri)
+        self._semantic_timers[uri] = asyncio.get_running_loop().call_later(
+            SEMANTIC_ANALYSIS_DELAY, self.start_semantic_analysis, uri, False
+        )
+
+    def cancel_semantic_analysis(self, uri: str) -> None:
+        if (timer := self._semantic_timers.pop(uri, None)) is not None:
+            timer.cancel()
+
+    def start_semantic_analysis(
+        self, uri: str, debounce: bool = True
+    ) -> Optional[asyncio.Task[Optional[SpecSections]]]:
+        """Let rpm analyze the open document ``uri`` right away, handlers of the
+        semantic tier wait for the returned task.
+
+        """
+        self._semantic_timers.pop(uri, None)
+        if uri not in self.workspace.text_documents:
+            return None
+
+        parse = self.parse_open_document
+        if self.stats is not None:
+            parse = instrument(parse, SEMANTIC_ANALYSIS_STATS, self.stats)
+        self._semantic_tasks[uri] = task = asyncio.ensure_future(parse(uri, debounce))
+
+        def forget_task(done: asyncio.Task[Optional[SpecSections]]) -> None:
+            if self._semantic_tasks.get(uri) is done:
+                del self._semantic_tasks[uri]
+
+        task.add_done_callback(forget_task)
+        return task
+
+    def cancel_pending_work(self) -> None:
+        """Cancel the pending analyses, reparses and the workspace indexing of
+        this session, e.g. once the client exits.
+
+        """
+        for timer in self._semantic_timers.values():
+            timer.cancel()
+        self._semantic_timers.clear()
+
+        for task in [
+            *self._semantic_tasks.values(),
+            *(scan for _, scan in self._syntactic_scans.values()),
+            self._reparse_task,
+            self._workspace_index_task,
+        ]:
+            if task is not None:
+                task.cancel()
+        self._semantic_tasks.clear()
+        self._syntactic_scans.clear()
+        self._reparse_queue.clear()
+
+    async def ensure_semantic_analysis(self, uri: str) -> None:
+        """Wait until rpm analyzed the latest changes of the document ``uri``,
+        a pending analysis is started right away.
+
+        """
+        if uri in self._semantic_timers:
+            self.cancel_semantic_analysis(uri)
+            # the delay is skipped, so publish the diagnostics right away
+            self.start_semantic_analysis(uri, debounce=False)
+
+        if (task := self._semantic_tasks.get(uri)) is not None:
+            # a cancelled request must not cancel the analysis
+            await asyncio.shield(task)
+
+    def store_snapshot(self, snapshot: SpecSnapshot) -> bool:
+        """Make ``snapshot`` the latest parsed contents of its document unless a
+        newer snapshot exists already. Returns whether it was stored.
+
+        """
+        if not snapshot.supersedes(current := self.snapshots.get(snapshot.uri)):
+            LOGGER.debug(
+                "Keeping version %s of %s instead of the older version %s",
+                current.version if current else None,
+                snapshot.uri,
+                snapshot.version,
+            )
+            return False
+
+        self.snapshots[snapshot.uri] = snapshot
+        return True
+
+    async def spec_for_expansion(self, snapshot: SpecSnapshot) -> Optional[Specfile]:
+        """Return the ``Specfile`` of ``snapshot`` for expanding macros.
+
+        It is parsed in the rpm executor when it is first needed and kept until
+        the document is parsed again. If rpm fails to parse the snapshot (e.g.
+        while the spec is edited), the last version of the document that rpm
+        could parse is used instead and the failure is kept as well.
+
+        """
+        uri = snapshot.uri
+        if (cached := self._expansion_specs.get(uri)) is not None and (
+            cached[0] is snapshot.sections
+        ):
+            return cached[1]
+
+        spec = await self.run_blocking(snapshot.sections.parse_spec)
+        if spec is None and (parsed := self._parsed_sections.get(uri)) is not None:
+            LOGGER.debug("Expanding macros in the last parsed version of %s", uri)
+            spec = (
+                cached[1]
+                if cached is not None and cached[0] is parsed
+                else await self.run_blocking(parsed.parse_spec)
+            )
+
+        self._expansion_specs[uri] = (snapshot.sections, spec)
+        return spec
+
+    async def spec_snapshot_from_cache_or_file(
+        self, text_document: Union[TextDocumentIdentifier, TextDocumentItem]
+    ) -> Optional[SpecSnapshot]:
+        """Return the latest snapshot of the document or parse the spec from
+        ``text_document`` in the rpm executor if there is none yet.
+
+        Open documents are scanned if they changed since their last snapshot.
+
+        """
+        if (
+            text_document.uri in self.workspace.text_documents
+            and self._spec_path_from_uri(text_document.uri)
+        ):
+            return await self.update_syntactic_layer(text_document.uri)
+
+        if snapshot := self.snapshots.get(text_document.uri):
+            return snapshot
+
+        sections = await self.run_blocking(self._load_spec_sections, text_document)
+        return self._store_spec_sections(text_document, sections)
+
+    def _load_spec_sections(
         self, text_document: Union[TextDocumentIdentifier, TextDocumentItem]
     ) -> Optional[SpecSections]:
-        if sections := self.spec_files.get((uri := text_document.uri), None):
-            return sections
+        sourcedir = self.spec_directory(text_document.uri)
+        if spec := self.spec_from_text_document(text_document):
+            return SpecSections.parse(spec, sourcedir=sourcedir)
+
+        # rpm cannot parse the spec, find at least its sections
+        if (
+            not (path := self._spec_path_from_uri(text_document.uri))
+            or (
+                text := getattr(text_document, "text", None)
+                or self.document_text(text_document.uri)
+            )
+            is None
+        ):
+            return None
+        return SpecSections.scan(
+            text,
+            os.path.basename(path),
+            sourcedir,
+            self._parsed_sections.get(text_document.uri),
+        )
 
-        if not (spec := self.spec_from_text_document(text_document)):
+    def _store_spec_sections(
+        self,
+        text_document: Union[TextDocumentIdentifier, TextDocumentItem],
+        sections: Optional[SpecSections],
+    ) -> Optional[SpecSnapshot]:
+        if sections is None:
             return None
 
-        self.spec_files[uri] = (sect := SpecSections.parse(spec))
-        return sect
+        snapshot = SpecSnapshot.parse(
+            uri := text_document.uri, getattr(text_document, "version", None), sections
+        )
+        # the document could have been parsed in the meantime
+        if not self.store_snapshot(snapshot):
+            return self.snapshots[uri]
 
-    def _spec_path_from_uri(self, uri: str) -> Optional[str]:
-        url = urlparse(uri)
-        path = unquote(url.path)
+        self.update_includes(uri, sections.text)
+        return snapshot
+
+    def update_macro_index(
+        self, uri: str, changes: Sequence[TextDocumentContentChangeEvent] = ()
+    ) -> MacroIndex:
+        """(Re)build the macro index of the open document with the given
+        ``uri`` unless the index for its current version exists already.
+
+        If the index of the previous version exists and the document was
+        changed by the single edit ``changes``, only the edited lines are
+        indexed again.
+
+        """
+        document = self.workspace.get_text_document(uri)
+        index = self.macro_indexes.get(uri)
+        if (
+            index is not None
+            and document.version is not None
+            and index.version == document.version
+        ):
+            return index
+
+        lines = document.source.splitlines()
+        if (
+            index is not None
+            and index.version is not None
+            and len(changes) == 1
+            and isinstance(change := changes[0], TextDocumentContentChangePartial)
+            # edits of the empty last line change the number of lines
+            and change.range.end.line < len(index.lines)
+        ):
+            start, end = change.range.start.line, change.range.end.line
+            # the edit spans as many lines in the new version as it has breaks
+            inserted = len((change.text + "x").splitlines())
+            index = index.replace_lines(
+                start, end + 1, lines[start : start + inserted], document.version
+            )
+
+        if index is None or len(index.lines) != len(lines):
+            index = MacroIndex.from_lines(lines, document.version)
+
+        self.macro_indexes[uri] = index
+        return index
+
+    def macro_index_from_cache_or_file(
+        self, text_document: Union[TextDocumentIdentifier, TextDocumentItem]
+    ) -> Optional[MacroIndex]:
+        if (index := self.macro_indexes.get((uri := text_document.uri))) is not None:
+            return index
+
+        if uri in self.open_documents:
+            return self.update_macro_index(uri)
+
+        if not (path := self._spec_path_from_uri(uri)):
+            return None
 
-        if url.scheme != "file" or not path.endswith(".spec"):
+        try:
+            with open(path) as spec_f:
+                self.macro_indexes[uri] = (index := MacroIndex.from_text(spec_f.read()))
+        except OSError as os_err:
+            LOGGER.debug("Failed to read spec %s, got %s", path, os_err)
             return None
 
-        if self._container_path:
-            return os.path.join(self._container_path, os.path.basename(path))
+        return index
+
+    def index_workspace_specs(self) -> asyncio.Task[None]:
+        """Add all spec files in the workspace folders to the macro index in the
+        background, unless this is running already.
+
+        Every run picks up the specs that were created since the last one.
+        Returns the task of the run.
+
+        """
+        if self._workspace_index_task is None or self._workspace_index_task.done():
+            self._workspace_index_task = asyncio.ensure_future(
+                self._index_workspace_specs()
+            )
+        return self._workspace_index_task
+
+    async def wait_for_workspace_index(self) -> None:
+        """Index the specs of the workspace and wait until all of them were
+        indexed at least once.
 
-        return path
+        """
+        task = self.index_workspace_specs()
+        if not self._workspace_indexed:
+            # a cancelled request must not cancel the indexing
+            await asyncio.shield(task)
+
+    async def _index_workspace_specs(self) -> None:
+        roots = [folder.uri for folder in self.workspace.folders.values()] or (
+            [self.workspace.root_uri] if self.workspace.root_uri else []
+        )
+        for root in roots:
+            if (url := urlparse(root)).scheme != "file":
+                continue
+
+            host_root = unquote(url.path)
+            container_root = self.path_mapper.container_directory(host_root)
+
+            # walking the tree and reading the specs must not block the loop
+            specs = [
+                (
+                    "file://"
+                    + quote(
+                        os.path.join(host_root, os.path.relpath(path, container_root))
+                    ),
+                    path,
+                )
+                for path in await asyncio.to_thread(list, spec_paths([container_root]))
+            ]
+            for start in range(0, len(specs), WORKSPACE_INDEX_CHUNK_SIZE):
+                new_specs = [
+                    (uri, path)
+                    for uri, path in specs[start : start + WORKSPACE_INDEX_CHUNK_SIZE]
+                    if uri not in self.macro_indexes
+                ]
+                for uri, index in await asyncio.to_thread(
+                    read_macro_indexes, new_specs
+                ):
+                    # the document could have been opened in the meantime
+                    self.macro_indexes.setdefault(uri, index)
+
+        self._workspace_indexed = True
+
+    @property
+    def supports_watched_files(self) -> bool:
+        """Whether the client can watch files for the server."""
+        return (
+            (workspace := self.client_capabilities.workspace) is not None
+            and (watched_files := workspace.did_change_watched_files) is not None
+            and bool(watched_files.dynamic_registration)
+        )
+
+    def register_file_watchers(self, watchers: list[FileSystemWatcher]) -> None:
+        self.client_register_capability(
+            RegistrationParams(
+                registrations=[
+                    Registration(
+                        id=str(uuid.uuid4()),
+                        method=WORKSPACE_DID_CHANGE_WATCHED_FILES,
+                        register_options=DidChangeWatchedFilesRegistrationOptions(
+                            watchers=watchers
+                        ),
+                    )
+                ]
+            )
+        )
+
+    def watch_files(self, paths: Iterable[str]) -> None:
+        """Ask the client to report changes of the files ``paths`` (in the
+        container), unless they are already watched.
+
+        """
+        if not self.supports_watched_files or not (
+            new_paths := [path for path in paths if path not in self._watched_files]
+        ):
+            return
+
+        self._watched_files.update(new_paths)
+        self.register_file_watchers(
+            [
+                FileSystemWatcher(
+                    glob_pattern=RelativePattern(
+                        base_uri=self.path_mapper.uri_from_path(os.path.dirname(path)),
+                        pattern=os.path.basename(path),
+                    )
+                )
+                for path in new_paths
+            ]
+        )
+
+    def refresh_diagnostics(self) -> None:
+        """Ask a client that pulls diagnostics to pull them again."""
+        if (
+            self.uses_pull_diagnostics
+            and (workspace := self.client_capabilities.workspace) is not None
+            and workspace.diagnostics is not None
+            and workspace.diagnostics.refresh_support
+        ):
+            self.workspace_diagnostic_refresh(None)
+
+    def forget_closed_spec(self, uri: str, deleted: bool = False) -> None:
+        """Drop everything that was read from the spec ``uri`` on disk and index
+        it again if the workspace is indexed and it still exists.
+
+        """
+        self.snapshots.pop(uri, None)
+        self._expansion_specs.pop(uri, None)
+        self._parsed_sections.pop(uri, None)
+        self.include_graph.remove(uri)
+        self.macro_indexes.pop(uri, None)
+        if self.index_workspace and not deleted:
+            self.macro_index_from_cache_or_file(TextDocumentIdentifier(uri=uri))
+
+    async def reload_macro_environment(self) -> None:
+        """Reload the macros from rpm's macro files and analyze the open
+        documents again in the new macro environment.
+
+        """
+
+        def reload() -> None:
+            rpm.reloadConfig()
+            self.shared.reload_macros()
+
+        await self.run_blocking(reload)
+        self._expansion_specs.clear()
+        self._parsed_sections.clear()
+
+        # the parsed specs of closed documents are not keyed by the macros
+        for uri in [
+            uri for uri in self.snapshots if uri not in self.workspace.text_documents
+        ]:
+            del self.snapshots[uri]
+        for uri in list(self.workspace.text_documents):
+            if self._spec_path_from_uri(uri):
+                await self.parse_open_document(uri)
+
+        self.refresh_diagnostics()
+
+    async def handle_changed_files(self, changes: Iterable[FileEvent]) -> None:
+        """Invalidate exactly what depends on the files that changed on disk: the
+        macro environment if a macro file changed, the parsed specs of closed
+        documents and the analysis of all specs including a changed file.
+
+        """
+        patterns = await self.run_blocking(macro_file_patterns)
+        changed_paths = set()
+
+        for change in changes:
+            if (path := self._path_from_uri(change.uri)) is None:
+                continue
+
+            changed_paths.add(path)
+            if any(
+                os.path.dirname(path) == directory
+                and fnmatch(os.path.basename(path), pattern)
+                for directory, pattern in patterns
+            ):
+                LOGGER.debug("Macro file %s changed, reloading the macros", path)
+                await self.reload_macro_environment()
+                return
+
+            # the editor buffer of open documents is newer than the disk
+            if (
+                self._spec_path_from_uri(change.uri)
+                and change.uri not in self.workspace.text_documents
+            ):
+                self.forget_closed_spec(
+                    change.uri, deleted=change.type == FileChangeType.Deleted
+                )
+
+        self.reparse_dependents(changed_paths)
+
+    def _path_from_uri(self, uri: str) -> Optional[str]:
+        if (url := urlparse(uri)).scheme != "file":
+            return None
+        return self.path_mapper.to_container(unquote(url.path))
+
+    def spec_directory(self, uri: str) -> Optional[str]:
+        """The directory of the spec ``uri`` in the container."""
+        if not (path := self._spec_path_from_uri(uri)):
+            return None
+        return os.path.dirname(path)
+
+    def reparse_dependents(self, changed_paths: Iterable[str]) -> None:
+        """Analyze all documents that include one of the files
+        ``changed_paths`` (directly or indirectly) again in the background.
+
+        """
+        dependents: list[str] = []
+        for path in changed_paths:
+            # the changed file can include different files now
+            if (
+                path in self.include_graph
+                and (including := self.include_graph.dependents(path))
+                and (spec_dir := self.spec_directory(including[-1]))
+            ):
+                self._read_includes_of(path, spec_dir)
+
+            dependents.extend(
+                node
+                for node in self.include_graph.dependents(path)
+                if node not in dependents
+                and (node in self.snapshots or node in self.workspace.text_documents)
+            )
+
+        if dependents:
+            LOGGER.debug("Analyzing %s again, as included files changed", dependents)
+            self.schedule_reparse(dependents)
+
+    def schedule_reparse(self, uris: Iterable[str]) -> None:
+        """Analyze the documents ``uris`` again one after another in the
+        background.
+
+        """
+        self._reparse_queue.extend(
+            uri for uri in uris if uri not in self._reparse_queue
+        )
+        if self._reparse_task is None or self._reparse_task.done():
+            self._reparse_task = asyncio.ensure_future(self._reparse_queued())
+
+    async def _reparse_queued(self) -> None:
+        while self._reparse_queue:
+            # the included files are part of the result id, so the open
+            # documents get new results & the results of the old contents are
+            # unused
+            if (uri := self._reparse_queue.pop(0)) in self.workspace.text_documents:
+                await self.parse_open_document(uri)
+            else:
+                self.forget_closed_spec(uri)
+
+        self.refresh_diagnostics()
+
+    def macro_occurrence_under_cursor(
+        self, text_document: TextDocumentIdentifier, position: Position
+    ) -> Optional[MacroOccurrence]:
+        """Find the macro (or the name of a ``%global``/``%define``) under
+        the cursor using the macro index of the document.
+
+        """
+        if not (index := self.macro_index_from_cache_or_file(text_document)):
+            return None
+
+        return index.occurrence_at(position.line, position.character)
+
+    def renamable_macro_under_cursor(
+        self, text_document: TextDocumentIdentifier, position: Position
+    ) -> Optional[MacroOccurrence]:
+        """Return the macro under the cursor if it is defined in the document
+        itself via ``%global`` or ``%define`` and can thus be renamed.
+
+        """
+        if (
+            occurrence := self.macro_occurrence_under_cursor(text_document, position)
+        ) is None or not (index := self.macro_indexes.get(text_document.uri)):
+            return None
+
+        return occurrence if index.definitions(occurrence.name) else None
+
+    async def current_sections(self, uri: str) -> SpecSections:
+        """The sections of the current version of the document ``uri``."""
+        while True:
+            snapshot = await self.update_syntactic_layer(uri)
+            # the document may have been changed while it was scanned
+            if snapshot.version == self.workspace.get_text_document(uri).version:
+                return snapshot.sections
+
+    async def full_semantic_tokens(self, uri: str) -> SemanticTokens:
+        """Tokenize the whole document with the given ``uri`` based on its macro
+        index and its sections and remember the result for subsequent delta
+        requests.
+
+        """
+        sections = await self.current_sections(uri)
+        index = self.update_macro_index(uri)
+        self.semantic_tokens[uri] = (
+            tokens := SemanticTokens(
+                data=encode_tokens(
+                    tokenize(
+                        self.workspace.get_text_document(uri).source.splitlines(),
+                        macro_lines=index.lines,
+                        sections=sections,
+                    )
+                ),
+                result_id=str(next(self._semantic_tokens_ids)),
+            )
+        )
+        return tokens
+
+    def _spec_path_from_uri(self, uri: str) -> Optional[str]:
+        return self.path_mapper.spec_path_from_uri(uri)
 
     def spec_from_text_document(
         self,
@@ -178,76 +1242,61 @@ class RpmSpecLanguageServer(LanguageServer):
                 LOGGER.debug("Failed to parse spec %s, got %s", path, rpm_exc)
                 return None
 
-        return spec_from_text(text, os.path.basename(path))
-
-    @overload
-    def get_macro_under_cursor(
-        self,
-        *,
-        spec: Specfile,
-        position: Position,
-        macros_dump: Optional[list[Macro]] = None,
-    ) -> Optional[Union[Macro, str]]: ...
+        return parse_spec_text(text, os.path.basename(path), os.path.dirname(path))[0]
 
-    @overload
     def get_macro_under_cursor(
         self,
         *,
         text_document: TextDocumentIdentifier,
         position: Position,
         macros_dump: Optional[list[Macro]] = None,
-    ) -> Optional[Union[Macro, str]]: ...
-
-    def get_macro_under_cursor(
-        self,
-        *,
-        spec: Optional[Specfile] = None,
-        text_document: Optional[TextDocumentIdentifier] = None,
-        position: Position,
-        macros_dump: Optional[list[Macro]] = None,
     ) -> Optional[Union[Macro, str]]:
-        """Find the macro in the text document or spec under the cursor. If the text
+        """Find the macro in the text document under the cursor. If the text
         document is not a spec or there is no macro under the cursor, then ``None``
         is returned. If the symbol under the cursor looks like a macro and it is
         present in ``macros_dump``, then the respective ``Macro`` object is
         returned. If the symbol under the cursor looks like a macro, but is not in
         ``macros_dump``, then the symbol is returned as a string.
 
-        If ``macros_dump`` is ``None``, then the system rpm macros are
-        loaded. Passing a list (even an empty list) ensures that no macros are
-        loaded.
+        The symbol is looked up in the macro index of the document, which is
+        built from the same snapshot of the editor buffer (or of the file on
+        disk) as the positions sent by the client. If ``macros_dump`` is
+        ``None``, then the macros of the shared macro table are used.
 
         """
-        if text_document is not None:
-            path = self._spec_path_from_uri(text_document.uri)
-            if not path:
-                return None
-            try:
-                spec = Specfile(path)
-            except RPMException as rpm_exc:
-                LOGGER.debug("Failed to parse spec %s, got %s", path, rpm_exc)
-                return None
-
-        assert spec
-
-        with spec.lines() as lines:
-            symbol = get_macro_string_at_position(
-                lines[position.line], position.character
+        if (
+            not self._spec_path_from_uri(text_document.uri)
+            or (
+                occurrence := self.macro_occurrence_under_cursor(
+                    text_document, position
+                )
             )
-            if not symbol:
-                return None
+            is None
+        ):
+            return None
+
+        symbol = occurrence.name
+        if macros_dump is None:
+            return self.shared.macros_by_name.get(symbol, symbol)
 
-            for macro in macros_dump if macros_dump is not None else Macros.dump():
-                if macro.name == symbol:
-                    return macro
+        for macro in macros_dump:
+            if macro.name == symbol:
+                return macro
 
-            return symbol
+        return symbol
 
 
 def create_rpm_lang_server(
     container_mount_path: Optional[str] = None,
+    shared: Optional[SharedCaches] = None,
+    protocol_cls: type[LanguageServerProtocol] = LanguageServerProtocol,
+    path_mappings: Iterable[PathMapping] = (),
+    stats: Optional[ServerStats] = None,
+    profile_dir: Optional[str] = None,
 ) -> RpmSpecLanguageServer:
-    rpm_spec_server = RpmSpecLanguageServer(container_mount_path)
+    rpm_spec_server = RpmSpecLanguageServer(
+        container_mount_path, shared, protocol_cls, path_mappings, stats, profile_dir
+    )
 
     @rpm_spec_server.feature(INITIALIZE)
     def capture_client_info(
@@ -256,16 +1305,58 @@ def create_rpm_lang_server(
         """Capture client info for VS Code"""
         server._client_info = params.client_info
 
-    def did_open_or_save(
+        if isinstance(opts := params.initialization_options, dict):
+            server.index_workspace = bool(opts.get("indexWorkspace", False))
+
+    @rpm_spec_server.feature(INITIALIZED)
+    async def watch_and_index_specs(
+        server: RpmSpecLanguageServer, params: InitializedParams
+    ) -> None:
+        if server.index_workspace:
+            server.index_workspace_specs()
+
+        if not server.supports_watched_files:
+            return
+
+        server.register_file_watchers(
+            [FileSystemWatcher(glob_pattern="**/*.spec")]
+            + [
+                FileSystemWatcher(
+                    glob_pattern=RelativePattern(
+                        base_uri=server.path_mapper.uri_from_path(directory),
+                        pattern=pattern,
+                    )
+                )
+                for directory, pattern in await server.run_blocking(macro_file_patterns)
+            ]
+        )
+
+    @rpm_spec_server.feature(WORKSPACE_DID_CHANGE_WATCHED_FILES)
+    async def did_change_watched_files(
+        server: RpmSpecLanguageServer, params: DidChangeWatchedFilesParams
+    ) -> None:
+        await server.handle_changed_files(params.changes)
+
+    async def did_open_or_save(
         server: RpmSpecLanguageServer,
         param: Union[DidOpenTextDocumentParams, DidSaveTextDocumentParams],
     ) -> None:
         LOGGER.debug("open or save event")
-        if not (spec := server.spec_from_text_document(param.text_document)):
+        server.update_macro_index((uri := param.text_document.uri))
+
+        # rpm reads included files from disk, so their dependents only change
+        # once they are saved
+        if isinstance(param, DidSaveTextDocumentParams) and (
+            path := server._path_from_uri(uri)
+        ):
+            server.reparse_dependents([path])
+
+        if not server._spec_path_from_uri(uri):
             return None
 
-        LOGGER.debug("Saving parsed spec for %s", param.text_document.uri)
-        server.spec_files[param.text_document.uri] = SpecSections.parse(spec)
+        server.cancel_semantic_analysis(uri)
+        if (task := server.start_semantic_analysis(uri)) is not None and await task:
+            LOGGER.debug("Saving parsed spec for %s", uri)
 
     rpm_spec_server.feature(TEXT_DOCUMENT_DID_OPEN)(did_open_or_save)
     rpm_spec_server.feature(TEXT_DOCUMENT_DID_SAVE)(did_open_or_save)
@@ -274,8 +1365,21 @@ def create_rpm_lang_server(
     def did_close(
         server: RpmSpecLanguageServer, param: DidCloseTextDocumentParams
     ) -> None:
-        if param.text_document.uri in server.spec_files:
-            del server.spec_files[param.text_document.uri]
+        server.snapshots.pop(param.text_document.uri, None)
+        server._expansion_specs.pop(param.text_document.uri, None)
+        server._parsed_sections.pop(param.text_document.uri, None)
+        server._syntactic_scans.pop(param.text_document.uri, None)
+        server.cancel_semantic_analysis(param.text_document.uri)
+
+        server.semantic_tokens.pop(param.text_document.uri, None)
+        server.include_graph.remove(param.text_document.uri)
+        server.diagnostics.clear(param.text_document.uri)
+
+        if param.text_document.uri in server.macro_indexes:
+            del server.macro_indexes[param.text_document.uri]
+            # the version on disk can differ from the closed buffer
+            if server.index_workspace:
+                server.macro_index_from_cache_or_file(param.text_document)
 
     @rpm_spec_server.feature(TEXT_DOCUMENT_DID_CHANGE)
     def did_change(
@@ -283,25 +1387,29 @@ def create_rpm_lang_server(
     ) -> None:
         LOGGER.debug("Text document %s changed", (uri := param.text_document.uri))
 
-        if spec := spec_from_text(
-            server.workspace.text_documents[uri].source, os.path.basename(uri)
-        ):
-            server.spec_files[uri] = SpecSections.parse(spec)
-            LOGGER.debug("Updated the spec for %s", uri)
+        server.update_macro_index(uri, param.content_changes)
+
+        if not server._spec_path_from_uri(uri):
+            return
+
+        # the sections are scanned once they are requested and rpm only parses
+        # the spec once the changes pause
+        server.schedule_semantic_analysis(uri)
 
     @rpm_spec_server.feature(
         TEXT_DOCUMENT_COMPLETION,
         CompletionOptions(trigger_characters=rpm_spec_server.trigger_characters),
     )
-    def complete_macro_name(
+    async def complete_macro_name(
         server: RpmSpecLanguageServer, params: CompletionParams
     ) -> CompletionList:
         if not (
-            spec_sections := server.spec_sections_from_cache_or_file(
+            snapshot := await server.spec_snapshot_from_cache_or_file(
                 text_document=params.text_document
             )
         ):
             return CompletionList(is_incomplete=False, items=[])
+        spec_sections = snapshot.sections
 
         trigger_char = (
             None if params.context is None else params.context.trigger_character
@@ -366,37 +1474,50 @@ def create_rpm_lang_server(
             )
 
     @rpm_spec_server.feature(TEXT_DOCUMENT_DOCUMENT_SYMBOL)
-    def spec_symbols(
+    async def spec_symbols(
         server: RpmSpecLanguageServer,
         param: DocumentSymbolParams,
     ) -> Optional[Union[list[DocumentSymbol], list[SymbolInformation]]]:
         if not (
-            spec_sections := server.spec_sections_from_cache_or_file(
+            snapshot := await server.spec_snapshot_from_cache_or_file(
                 text_document=param.text_document
             )
         ):
             return None
 
-        return spec_sections.to_document_symbols()
+        LOGGER.debug(
+            "Sending the symbols of version %s of %s", snapshot.version, snapshot.uri
+        )
+        return snapshot.sections.to_document_symbols()
 
-    @rpm_spec_server.feature(TEXT_DOCUMENT_DEFINITION)
-    def find_macro_definition(
-        server: RpmSpecLanguageServer,
-        param: DefinitionParams,
-    ) -> Optional[Union[Location, list[Location], list[LocationLink]]]:
-        # get the in memory spec if available
+    @rpm_spec_server.feature(TEXT_DOCUMENT_FOLDING_RANGE)
+    async def spec_folding_ranges(
+        server: RpmSpecLanguageServer, param: FoldingRangeParams
+    ) -> Optional[list[FoldingRange]]:
         if not (
-            spec_sections := server.spec_sections_from_cache_or_file(
-                param.text_document
+            snapshot := await server.spec_snapshot_from_cache_or_file(
+                text_document=param.text_document
             )
         ):
             return None
 
-        macro_under_cursor = server.get_macro_under_cursor(
-            spec=spec_sections.spec, position=param.position, macros_dump=server.macros
-        )
+        return snapshot.sections.folding_ranges
 
-        if not macro_under_cursor:
+    @rpm_spec_server.feature(TEXT_DOCUMENT_DEFINITION)
+    async def find_macro_definition(
+        server: RpmSpecLanguageServer,
+        param: DefinitionParams,
+    ) -> Optional[Union[Location, list[Location], list[LocationLink]]]:
+        # search the same text from which the macro index was built, i.e. the
+        # editor buffer if the document is open
+        if (
+            not (
+                macro_under_cursor := server.get_macro_under_cursor(
+                    text_document=param.text_document, position=param.position
+                )
+            )
+            or (spec_text := server.document_text(param.text_document.uri)) is None
+        ):
             return None
 
         macro_name = (
@@ -443,24 +1564,60 @@ def create_rpm_lang_server(
                 return []
             return [m]
 
-        define_matches, file_uri = [], None
+        def find_definition_in_macro_files() -> tuple[
+            list[re.Match[str]], Optional[str]
+        ]:
+            """Searches for the definition of the macro ``macro_under_cursor``
+            in the macro files of the installed packages and in the builtin
+            macro file of rpm (see below).
+
+            """
+            MACROS_DIR = rpm.expandMacro("%_rpmmacrodir")
+            ts = rpm.TransactionSet()
+
+            # search in packages
+            for pkg in ts.dbMatch("provides", f"rpm_macro({macro_name})"):
+                for f in rpm.files(pkg):
+                    if f.name.startswith(MACROS_DIR):
+                        with open(f.name) as macro_file_f:
+                            if define_matches := find_macro_in_macro_file(
+                                macro_file_f.read(-1)
+                            ):
+                                return define_matches, server.path_mapper.uri_from_path(
+                                    f.name
+                                )
+
+            # we didn't find a match
+            # => the macro can be from %_rpmconfigdir/macros (no provides
+            #    generated for it)
+            fname = rpm.expandMacro("%_rpmconfigdir") + "/macros"
+            with open(fname) as macro_file_f:
+                if define_matches := find_macro_in_macro_file(macro_file_f.read(-1)):
+                    return define_matches, server.path_mapper.uri_from_path(fname)
+
+            return [], None
+
+        define_matches: list[re.Match[str]] = []
+        file_uri: Optional[str] = None
 
         # macro is defined in the spec file
         if macro_level == MacroLevel.GLOBAL:
-            if not (
-                define_matches := find_macro_define_in_spec(str(spec_sections.spec))
-            ):
+            if not (define_matches := find_macro_define_in_spec(spec_text)):
                 return None
 
             file_uri = param.text_document.uri
 
         # macro is something like %version, %release, etc.
         elif macro_level == MacroLevel.SPEC:
-            if not (
-                define_matches := find_preamble_definition_in_spec(
-                    str(spec_sections.spec)
-                )
-            ):
+            # use the tag table of the parsed spec if it is up to date
+            if (
+                snapshot := server.snapshots.get(param.text_document.uri)
+            ) is not None and snapshot.matches(spec_text):
+                if (tag := snapshot.sections.tag(macro_name)) is None:
+                    return None
+                return [Location(uri=param.text_document.uri, range=tag.range)]
+
+            if not (define_matches := find_preamble_definition_in_spec(spec_text)):
                 return None
             file_uri = param.text_document.uri
 
@@ -476,30 +1633,10 @@ def create_rpm_lang_server(
         # builtin macros file of rpm (_should_ be in %_rpmconfigdir/macros) so
         # we retry the search in that file.
         elif macro_level == MacroLevel.MACROFILES:
-            MACROS_DIR = rpm.expandMacro("%_rpmmacrodir")
-            ts = rpm.TransactionSet()
-
-            # search in packages
-            for pkg in ts.dbMatch("provides", f"rpm_macro({macro_name})"):
-                for f in rpm.files(pkg):
-                    if f.name.startswith(MACROS_DIR):
-                        with open(f.name) as macro_file_f:
-                            if define_matches := find_macro_in_macro_file(
-                                macro_file_f.read(-1)
-                            ):
-                                file_uri = f"file://{f.name}"
-                                break
-
-            # we didn't find a match
-            # => the macro can be from %_rpmconfigdir/macros (no provides
-            #    generated for it)
-            if not define_matches:
-                fname = rpm.expandMacro("%_rpmconfigdir") + "/macros"
-                with open(fname) as macro_file_f:
-                    if define_matches := find_macro_in_macro_file(
-                        macro_file_f.read(-1)
-                    ):
-                        file_uri = f"file://{fname}"
+            # querying the rpm database & reading the macro files blocks
+            define_matches, file_uri = await server.run_blocking(
+                find_definition_in_macro_files
+            )
 
         if define_matches and file_uri:
             return [
@@ -522,22 +1659,275 @@ def create_rpm_lang_server(
 
         return None
 
-    @rpm_spec_server.feature(TEXT_DOCUMENT_HOVER)
-    def expand_macro(
-        server: RpmSpecLanguageServer, params: HoverParams
-    ) -> Optional[Hover]:
-        if spec_sections := server.spec_files.get(params.text_document.uri, None):
-            macro = server.get_macro_under_cursor(
-                spec=spec_sections.spec,
-                position=params.position,
-                macros_dump=server.macros,
+    @rpm_spec_server.feature(TEXT_DOCUMENT_REFERENCES)
+    async def find_macro_references(
+        server: RpmSpecLanguageServer, param: ReferenceParams
+    ) -> Optional[list[Location]]:
+        if not (
+            occurrence := server.macro_occurrence_under_cursor(
+                param.text_document, param.position
             )
+        ):
+            return None
+
+        if server.index_workspace:
+            await server.wait_for_workspace_index()
+            indexes = list(server.macro_indexes.items())
+        elif index := server.macro_index_from_cache_or_file(param.text_document):
+            indexes = [(param.text_document.uri, index)]
         else:
-            macro = server.get_macro_under_cursor(
-                text_document=params.text_document,
-                position=params.position,
-                macros_dump=server.macros,
+            return None
+
+        return [
+            Location(uri=uri, range=ref.range)
+            for uri, index in indexes
+            for ref in index.references(
+                occurrence.name,
+                include_definitions=param.context.include_declaration,
+            )
+        ]
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT)
+    def highlight_macro(
+        server: RpmSpecLanguageServer, param: DocumentHighlightParams
+    ) -> Optional[list[DocumentHighlight]]:
+        if not (
+            occurrence := server.macro_occurrence_under_cursor(
+                param.text_document, param.position
+            )
+        ) or not (index := server.macro_index_from_cache_or_file(param.text_document)):
+            return None
+
+        return [
+            DocumentHighlight(
+                range=ref.range,
+                kind=(
+                    DocumentHighlightKind.Write
+                    if ref.is_definition
+                    else DocumentHighlightKind.Read
+                ),
+            )
+            for ref in index.references(occurrence.name)
+        ]
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_PREPARE_RENAME)
+    def prepare_rename_macro(
+        server: RpmSpecLanguageServer, param: PrepareRenameParams
+    ) -> Optional[Range]:
+        if not (
+            occurrence := server.renamable_macro_under_cursor(
+                param.text_document, param.position
+            )
+        ):
+            return None
+
+        return occurrence.range
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_RENAME)
+    def rename_macro(
+        server: RpmSpecLanguageServer, param: RenameParams
+    ) -> Optional[WorkspaceEdit]:
+        if not (
+            occurrence := server.renamable_macro_under_cursor(
+                param.text_document, param.position
             )
+        ):
+            return None
+
+        if not is_valid_macro_name(param.new_name):
+            raise JsonRpcInvalidParams(
+                f"'{param.new_name}' is not a valid macro name: it must consist of "
+                "letters, digits and underscores and must not start with a digit"
+            )
+
+        index = server.macro_indexes[(uri := param.text_document.uri)]
+        return WorkspaceEdit(
+            changes={
+                uri: [
+                    TextEdit(range=ref.range, new_text=param.new_name)
+                    for ref in index.references(occurrence.name)
+                ]
+            }
+        )
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL, LEGEND)
+    async def semantic_tokens_full(
+        server: RpmSpecLanguageServer, params: SemanticTokensParams
+    ) -> SemanticTokens:
+        return await server.full_semantic_tokens(params.text_document.uri)
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA, LEGEND)
+    async def semantic_tokens_delta(
+        server: RpmSpecLanguageServer, params: SemanticTokensDeltaParams
+    ) -> Union[SemanticTokens, SemanticTokensDelta]:
+        previous = server.semantic_tokens.get((uri := params.text_document.uri))
+        tokens = await server.full_semantic_tokens(uri)
+
+        # the client refers to a result that we no longer know => send everything
+        if previous is None or previous.result_id != params.previous_result_id:
+            return tokens
+
+        return SemanticTokensDelta(
+            edits=semantic_tokens_edits(previous.data, tokens.data),
+            result_id=tokens.result_id,
+        )
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_SEMANTIC_TOKENS_RANGE, LEGEND)
+    async def semantic_tokens_range(
+        server: RpmSpecLanguageServer, params: SemanticTokensRangeParams
+    ) -> SemanticTokens:
+        sections = await server.current_sections((uri := params.text_document.uri))
+        lines = server.workspace.get_text_document(uri).source.splitlines()
+        index = server.update_macro_index(uri)
+        start, end = params.range.start, params.range.end
+
+        return SemanticTokens(
+            data=encode_tokens(
+                token
+                for token in tokenize(
+                    lines[start.line : end.line + 1], start.line, index.lines, sections
+                )
+                if (token.line, token.start + token.length)
+                > (start.line, start.character)
+                and (token.line, token.start) < (end.line, end.character)
+            )
+        )
+
+    @rpm_spec_server.feature(
+        TEXT_DOCUMENT_DIAGNOSTIC,
+        DiagnosticOptions(inter_file_dependencies=False, workspace_diagnostics=True),
+        tier=AnalysisTier.SEMANTIC,
+    )
+    async def pull_diagnostics(
+        server: RpmSpecLanguageServer, params: DocumentDiagnosticParams
+    ) -> DocumentDiagnosticReport:
+        if (text := server.document_text((uri := params.text_document.uri))) is None:
+            return RelatedFullDocumentDiagnosticReport(items=[])
+
+        includes = server.update_includes(uri, text)
+        file_name, sourcedir = os.path.basename(uri), server.spec_directory(uri)
+        if params.previous_result_id == (
+            result_id := server.diagnostics_result_id(
+                text, includes, file_name, sourcedir
+            )
+        ):
+            return RelatedUnchangedDocumentDiagnosticReport(result_id=result_id)
+
+        _, result = await server.analyze_text(text, file_name, includes, sourcedir)
+        return RelatedFullDocumentDiagnosticReport(
+            items=result.diagnostics, result_id=result_id
+        )
+
+    @rpm_spec_server.feature(WORKSPACE_DIAGNOSTIC)
+    async def pull_workspace_diagnostics(
+        server: RpmSpecLanguageServer, params: WorkspaceDiagnosticParams
+    ) -> WorkspaceDiagnosticReport:
+        previous_result_ids = {
+            prev.uri: prev.value for prev in params.previous_result_ids
+        }
+        if server.index_workspace:
+            await server.wait_for_workspace_index()
+
+        reports: list[WorkspaceDocumentDiagnosticReport] = []
+        for uri in list(server.macro_indexes):
+            if (
+                not server._spec_path_from_uri(uri)
+                or (text := server.document_text(uri)) is None
+            ):
+                continue
+
+            includes = server.update_includes(uri, text)
+            file_name, sourcedir = os.path.basename(uri), server.spec_directory(uri)
+            result_id = server.diagnostics_result_id(
+                text, includes, file_name, sourcedir
+            )
+            version = (
+                document.version
+                if (document := server.workspace.text_documents.get(uri))
+                else None
+            )
+            report: WorkspaceDocumentDiagnosticReport
+            if previous_result_ids.get(uri) == result_id:
+                report = WorkspaceUnchangedDocumentDiagnosticReport(
+                    uri=uri, version=version, result_id=result_id
+                )
+            else:
+                _, result = await server.analyze_text(
+                    text, file_name, includes, sourcedir
+                )
+                report = WorkspaceFullDocumentDiagnosticReport(
+                    uri=uri,
+                    version=version,
+                    items=result.diagnostics,
+                    result_id=result_id,
+                )
+
+            # stream every document as soon as it is done if the client wants it
+            if params.partial_result_token is not None:
+                server.protocol.notify(
+                    PROGRESS,
+                    ProgressParams(
+                        token=params.partial_result_token,
+                        value=WorkspaceDiagnosticReportPartialResult(items=[report]),
+                    ),
+                )
+            else:
+                reports.append(report)
+
+            # let other requests (e.g. cancellations) in between the documents
+            await asyncio.sleep(0)
+
+        return WorkspaceDiagnosticReport(items=reports)
+
+    @rpm_spec_server.feature(MEMORY_REQUEST)
+    def report_memory_usage(
+        server: RpmSpecLanguageServer, params: Any
+    ) -> dict[str, int]:
+        return {
+            "session": server.memory_usage(),
+            "shared": deep_sizeof(server.shared),
+            "openDocuments": len(server.workspace.text_documents),
+            "cachedParseResults": len(server.shared.parse_cache),
+        }
+
+    @rpm_spec_server.feature(STATS_REQUEST)
+    def report_stats(server: RpmSpecLanguageServer, params: Any) -> dict[str, Any]:
+        if server.stats is None:
+            return {"enabled": False}
+        return {"enabled": True, **server.stats.as_dict()}
+
+    @rpm_spec_server.command(PROFILE_COMMAND)
+    def start_profiling(
+        server: RpmSpecLanguageServer,
+        requests: Optional[int] = None,
+        seconds: Optional[float] = None,
+    ) -> dict[str, Any]:
+        server.profiler.start(requests, seconds)
+        return {"outputDirectory": server.profiler.output_dir}
+
+    @rpm_spec_server.command(STOP_PROFILING_COMMAND)
+    def stop_profiling(server: RpmSpecLanguageServer) -> list[str]:
+        return server.profiler.stop()
+
+    @rpm_spec_server.feature(SHUTDOWN)
+    def stop_pending_work(server: RpmSpecLanguageServer, params: Any) -> None:
+        server.cancel_pending_work()
+        if server.profiler.active:
+            server.profiler.stop()
+
+    # clients may exit without shutting down, which only ends this session
+    # in a multi-session server
+    @rpm_spec_server.feature(EXIT)
+    def cancel_work_on_exit(server: RpmSpecLanguageServer, params: Any) -> None:
+        server.cancel_pending_work()
+
+    @rpm_spec_server.feature(TEXT_DOCUMENT_HOVER, tier=AnalysisTier.SEMANTIC)
+    async def expand_macro(
+        server: RpmSpecLanguageServer, params: HoverParams
+    ) -> Optional[Hover]:
+        macro = server.get_macro_under_cursor(
+            text_document=params.text_document, position=params.position
+        )
 
         LOGGER.debug("Got macro '%s' at position %s", macro, params.position)
 
@@ -549,37 +1939,59 @@ def create_rpm_lang_server(
             if not macro.startswith("%"):
                 macro = f"%{macro}"
 
-            try:
-                if spec_sections:
-                    expanded = spec_sections.spec.expand(macro)
-                else:
-                    path = server._spec_path_from_uri(params.text_document.uri)
-                    if not path:
-                        return None
-                    spec = Specfile(path)
-                    expanded = spec.expand(macro)
-
-                LOGGER.debug("Expanded '%s' to '%s'", macro, expanded)
-                if expanded == macro:
-                    return None
-                return Hover(
-                    contents=MarkupContent(
-                        value=f"```bash\n{expanded}\n```", kind=MarkupKind.Markdown
-                    )
+            # the parsed spec is only loaded when a macro has to be expanded
+            if snapshot := server.snapshots.get(params.text_document.uri):
+                spec = await server.spec_for_expansion(snapshot)
+            elif server._spec_path_from_uri(params.text_document.uri):
+                spec = await server.run_blocking(
+                    server.spec_from_text_document, params.text_document
                 )
-            except RPMException:
+            else:
                 return None
 
+            def expand_in_spec(spec: Specfile, macro: str) -> Optional[str]:
+                try:
+                    return spec.expand(macro)
+                except RPMException:
+                    return None
+
+            expanded = (
+                None
+                if spec is None
+                else await server.run_blocking(expand_in_spec, spec, macro)
+            )
+
+            LOGGER.debug(
+                "Expanded '%s' to '%s' in version %s",
+                macro,
+                expanded,
+                snapshot.version if snapshot else None,
+            )
+            if expanded is None or expanded == macro:
+                return None
+            return Hover(
+                contents=MarkupContent(
+                    value=f"```bash\n{expanded}\n```", kind=MarkupKind.Markdown
+                )
+            )
+
         assert isinstance(macro, Macro)
         if macro.level == MacroLevel.BUILTIN:
             return Hover(contents="builtin")
 
-        try:
-            expanded_macro = Macros.expand(macro.body)
-            formatted_macro = f"```bash\n{expanded_macro}\n```"
-            contents = MarkupContent(kind=MarkupKind.Markdown, value=formatted_macro)
-            return Hover(contents)
-        except RPMException:
+        def expand_body(body: str) -> Optional[str]:
+            try:
+                return Macros.expand(body)
+            except RPMException:
+                return None
+
+        if (
+            expanded_macro := await server.run_blocking(expand_body, macro.body)
+        ) is None:
             return Hover(contents=macro.body)
 
+        formatted_macro = f"```bash\n{expanded_macro}\n```"
+        contents = MarkupContent(kind=MarkupKind.Markdown, value=formatted_macro)
+        return Hover(contents)
+
     return rpm_spec_server
@@ -0,0 +1,162 @@
+"""Serve multiple LSP clients over TCP from a single process.
+
+Every connection gets its own :py:class:`RpmSpecLanguageServer` with its own
+open documents, while the macro table, the tag & scriptlet documentation and
+the parse results are shared between all of them.
+
+"""
+
+import asyncio
+import os.path
+import tempfile
+from collections.abc import Generator, Iterable
+from itertools import count
+from threading import Event
+from typing import Any, Optional
+
+from lsprotocol.types import EXIT
+from pygls.io_ import run_async
+from pygls.protocol import LanguageServerProtocol, lsp_method
+
+from rpm_spec_language_server.logging import LOGGER
+from rpm_spec_language_server.paths import PathMapping
+from rpm_spec_language_server.server import (
+    RpmSpecLanguageServer,
+    create_rpm_lang_server,
+)
+from rpm_spec_language_server.shared import SharedCaches
+from rpm_spec_language_server.stats import ServerStats
+
+
+class SessionProtocol(LanguageServerProtocol):
+    """Protocol of one of many client sessions: the exit notification only ends
+    this session and not the whole process.
+
+    """
+
+    @lsp_method(EXIT)
+    def lsp_exit(self, *args: Any) -> Generator[Any, Any, None]:
+        if (user_handler := self.fm.features.get(EXIT)) is not None:
+            yield user_handler, args, None
+
+        self._server.shutdown()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class SessionManager:
+    """Keeps track of all active sessions and the caches that they share."""
+
+    def __init__(
+        self,
+        container_mount_path: Optional[str] = None,
+        path_mappings: Iterable[PathMapping] = (),
+        stats: Optional[ServerStats] = None,
+        shared: Optional[SharedCaches] = None,
+        profile_dir: Optional[str] = None,
+        profile_requests: Optional[int] = None,
+        profile_seconds: Optional[float] = None,
+    ) -> None:
+        self.shared = shared or SharedCaches()
+        #: statistics that are collected over all sessions
+        self.stats = stats
+        self.sessions: dict[int, RpmSpecLanguageServer] = {}
+        self._container_mount_path = container_mount_path
+        self._path_mappings = list(path_mappings)
+        self._session_ids = count(1)
+        self._profile_dir = profile_dir
+        #: every session profiles this many of its first requests or its first
+        #: seconds
+        self._profile_requests = profile_requests
+        self._profile_seconds = profile_seconds
+
+    def memory_usage(self) -> dict[int, int]:
+        """Approximate memory usage in bytes of every active session."""
+        return {
+            session_id: session.memory_usage()
+            for session_id, session in self.sessions.items()
+        }
+
+    async def serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        session_id = next(self._session_ids)
+        server = create_rpm_lang_server(
+            self._container_mount_path,
+            shared=self.shared,
+            protocol_cls=SessionProtocol,
+            path_mappings=self._path_mappings,
+            stats=self.stats,
+            # the profiles of concurrent sessions must not overwrite each other
+            profile_dir=os.path.join(
+                self._profile_dir or tempfile.gettempdir(),
+                f"rpm_lsp_session-{session_id}",
+            ),
+        )
+        if self._profile_requests or self._profile_seconds:
+            server.profiler.start(self._profile_requests, self._profile_seconds)
+        # shutdown() sets this event and thereby ends the message loop
+        server._stop_event = stop_event = Event()
+        server.protocol.set_writer(writer)  # type: ignore[arg-type]
+
+        self.sessions[session_id] = server
+        LOGGER.info(
+            "Session %d connected, %d session(s) active", session_id, len(self.sessions)
+        )
+
+        try:
+            await run_async(
+                stop_event=stop_event,
+                reader=reader,
+                protocol=server.protocol,
+                logger=LOGGER,
+                error_handler=server.report_server_error,
+            )
+        finally:
+            LOGGER.info(
+                "Session %d ended, it used ~%d bytes",
+                session_id,
+                server.memory_usage(),
+            )
+            del self.sessions[session_id]
+            writer.close()
+
+
+def start_multi_session_tcp(
+    host: str,
+    port: int,
+    container_mount_path: Optional[str] = None,
+    path_mappings: Iterable[PathMapping] = (),
+    stats: Optional[ServerStats] = None,
+    shared: Optional[SharedCaches] = None,
+    profile_dir: Optional[str] = None,
+    profile_requests: Optional[int] = None,
+    profile_seconds: Optional[float] = None,
+) -> None:
+    """Launch a TCP server on ``host:port`` that serves every connection as a
+    separate session.
+
+    """
+    manager = SessionManager(
+        container_mount_path,
+        path_mappings,
+        stats,
+        shared,
+        profile_dir,
+        profile_requests,
+        profile_seconds,
+    )
+
+    async def tcp_server() -> None:
+        server = await asyncio.start_server(manager.serve_connection, host, port)
+        LOGGER.info(
+            "Serving sessions on %s",
+            ", ".join(str(sock.getsockname()) for sock in server.sockets),
+        )
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(tcp_server())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
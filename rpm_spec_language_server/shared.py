@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import FunctionType, ModuleType
+from typing import Any, Optional
+
+from lsprotocol.types import Diagnostic
+from specfile.macros import Macro, Macros
+
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.extract_docs import (
+    AutoCompleteDoc,
+    create_autocompletion_documentation_from_spec_md,
+    retrieve_spec_md,
+)
+from rpm_spec_language_server.persistent_cache import PersistentParseCache
+from rpm_spec_language_server.util import macro_environment_fingerprint
+
+#: default number of parse results that are kept in memory
+PARSE_CACHE_SIZE = 128
+
+#: number of threads that run blocking calls into rpm, librpm keeps the macro
+#: context in global state, so they must not run concurrently
+RPM_WORKERS = 1
+
+
+@dataclass(frozen=True)
+class ParseResult:
+    """The outcome of analyzing the contents of a spec."""
+
+    #: the sections of the spec, they are found by scanning its text if rpm
+    #: failed to parse it
+    sections: Optional[SpecSections]
+
+    diagnostics: list[Diagnostic]
+
+    #: whether rpm parsed the spec
+    parsed: bool = False
+
+
+class ParseCache:
+    """Least recently used cache of parse results, keyed by the hash of the spec
+    contents and the macro environment.
+
+    """
+
+    def __init__(
+        self,
+        max_size: int = PARSE_CACHE_SIZE,
+        persistent: Optional[PersistentParseCache] = None,
+    ) -> None:
+        self.max_size = max_size
+        #: results that are not in memory are looked up in here
+        self.persistent = persistent
+        self._results: OrderedDict[str, ParseResult] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        #: hits that were served from the persistent cache
+        self.persistent_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key: str) -> Optional[ParseResult]:
+        """Look ``key`` up in memory and then in the persistent cache, which
+        blocks while the database is read.
+
+        """
+        if key in self._results or self.persistent is None:
+            return self._lookup(key, None)
+        return self._lookup(key, self.persistent.get(key))
+
+    async def get_async(self, key: str) -> Optional[ParseResult]:
+        """Like :py:meth:`get`, but the persistent cache is read in a thread, so
+        that the event loop is not blocked by the database or the unpickling.
+
+        """
+        if key in self._results or self.persistent is None:
+            return self._lookup(key, None)
+        return self._lookup(key, await asyncio.to_thread(self.persistent.get, key))
+
+    def _lookup(self, key: str, stored: Any) -> Optional[ParseResult]:
+        # the result may have been put into memory while the persistent cache
+        # was read
+        if (result := self._results.get(key)) is None:
+            if not isinstance(stored, ParseResult):
+                self.misses += 1
+                return None
+
+            self.persistent_hits += 1
+            self._insert(key, result := stored)
+
+        self.hits += 1
+        self._results.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: ParseResult) -> None:
+        self._insert(key, result)
+        if self.persistent is not None:
+            self.persistent.put_in_background(key, result)
+
+    def _insert(self, key: str, result: ParseResult) -> None:
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        self._results.clear()
+
+    def values(self) -> list[ParseResult]:
+        return list(self._results.values())
+
+
+class SharedCaches:
+    """Everything that does not depend on a client session and that can thus be
+    shared by all sessions served from the same process: the macro table, the
+    documentation of tags & scriptlets, the parse results and the executor for
+    blocking calls into rpm.
+
+    """
+
+    def __init__(
+        self,
+        parse_cache_size: int = PARSE_CACHE_SIZE,
+        persistent_cache: Optional[PersistentParseCache] = None,
+        rpm_workers: int = RPM_WORKERS,
+    ) -> None:
+        self.auto_complete_data: AutoCompleteDoc = (
+            create_autocompletion_documentation_from_spec_md(retrieve_spec_md() or "")
+        )
+        self.parse_cache = ParseCache(parse_cache_size, persistent_cache)
+        self.macros: list[Macro] = []
+        self.macros_by_name: dict[str, Macro] = {}
+        self.macro_fingerprint = ""
+        self.reload_macros()
+
+        #: runs the parsing and expanding of specs off the event loop(s)
+        self.rpm_executor = ThreadPoolExecutor(
+            max_workers=rpm_workers, thread_name_prefix="rpm"
+        )
+
+    def reload_macros(self) -> None:
+        """Reload the macro table from rpm.
+
+        Cached parse results are keyed by the macro environment, so they become
+        unreachable if it changed.
+
+        """
+        macros = Macros.dump()
+        macros_by_name: dict[str, Macro] = {}
+        # the same lookup as a linear search: the first macro of a name wins
+        for macro in macros:
+            macros_by_name.setdefault(macro.name, macro)
+
+        # the macros are reloaded in the rpm executor while sessions are served,
+        # so replace the whole table at once
+        self.macros, self.macros_by_name, self.macro_fingerprint = (
+            macros,
+            macros_by_name,
+            macro_environment_fingerprint(macros),
+        )
+
+
+def deep_sizeof(obj: Any, exclude: Iterable[Any] = ()) -> int:
+    """Approximate the memory used by ``obj`` and everything that it references.
+
+    Modules, classes, functions and the objects in ``exclude`` (and everything
+    only reachable through them) are not counted.
+
+    """
+    seen = {id(excluded) for excluded in exclude}
+    size = 0
+    pending = [obj]
+
+    while pending:
+        if id(cur := pending.pop()) in seen or isinstance(
+            cur, (type, ModuleType, FunctionType)
+        ):
+            continue
+        seen.add(id(cur))
+        size += sys.getsizeof(cur)
+
+        if isinstance(cur, dict):
+            pending.extend(cur.keys())
+            pending.extend(cur.values())
+        elif isinstance(cur, (list, tuple, set, frozenset)):
+            pending.extend(cur)
+        elif not isinstance(cur, (str, bytes, int, float)):
+            if hasattr(cur, "__dict__"):
+                pending.append(vars(cur))
+            slots = getattr(type(cur), "__slots__", ())
+            for slot in (slots,) if isinstance(slots, str) else slots:
+                if hasattr(cur, slot):
+                    pending.append(getattr(cur, slot))
+
+    return size
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.util import content_hash
+
+
+@dataclass(frozen=True)
+class SpecSnapshot:
+    """The parsed contents of the document ``uri`` at a specific version."""
+
+    uri: str
+
+    #: the version of the open document in the editor or ``None`` if the spec
+    #: was read from disk
+    version: Optional[int]
+
+    #: the hash of the contents from which ``sections`` were parsed
+    content_hash: str
+
+    sections: SpecSections
+
+    @staticmethod
+    def parse(uri: str, version: Optional[int], sections: SpecSections) -> SpecSnapshot:
+        return SpecSnapshot(
+            uri=uri,
+            version=version,
+            content_hash=content_hash(sections.text),
+            sections=sections,
+        )
+
+    def supersedes(self, other: Optional[SpecSnapshot]) -> bool:
+        """Whether this snapshot may replace the snapshot ``other`` of the same
+        document.
+
+        Snapshots of older versions never replace newer ones and the contents of
+        a spec on disk never replace the contents of the editor buffer.
+
+        """
+        if other is None:
+            return True
+        if self.version is None:
+            return other.version is None
+        return other.version is None or self.version >= other.version
+
+    def matches(self, text: str) -> bool:
+        """Whether this snapshot was parsed from the contents ``text``."""
+        return self.content_hash == content_hash(text)
@@ -0,0 +1,320 @@
+"""Optional instrumentation of the LSP handlers.
+
+If enabled, every handler that is registered on the server is wrapped so that
+its latency is recorded and the size of its response is taken from the data
+that is written to the client. If disabled, the handlers are registered
+unchanged and thus there is no overhead at all.
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Iterable
+from typing import Any, Callable, Protocol
+
+from pygls.protocol import JsonRPCProtocol
+
+#: upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+#: default interval in seconds in which the Prometheus text file is written
+STATS_WRITE_INTERVAL = 15.0
+
+_METRIC_PREFIX = "rpm_spec_language_server"
+
+
+class Histogram:
+    """Histogram with fixed buckets that also keeps track of the sum and the
+    number of observations.
+
+    """
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        #: observations per bucket, the last entry counts everything that does
+        #: not fit into any bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile as the upper bound of the bucket that
+        contains it (``inf`` if it is larger than all buckets).
+
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if (seen := seen + count) >= rank:
+                return bound
+        return float("inf")
+
+
+class HandlerStats:
+    """Latencies and response sizes of a single LSP method."""
+
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.errors = 0
+        self.response_bytes = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.latency.count,
+            "errors": self.errors,
+            "totalSeconds": self.latency.sum,
+            "p50Seconds": self.latency.quantile(0.5),
+            "p95Seconds": self.latency.quantile(0.95),
+            "buckets": dict(
+                zip(
+                    [str(bound) for bound in self.latency.buckets] + ["+Inf"],
+                    self.latency.counts,
+                )
+            ),
+            "responseBytes": self.response_bytes,
+        }
+
+
+class CacheCounters(Protocol):
+    hits: int
+    misses: int
+
+
+class ServerStats:
+    """Statistics of all instrumented handlers and the tracked caches."""
+
+    def __init__(self) -> None:
+        self.handlers: dict[str, HandlerStats] = {}
+        self.caches: dict[str, CacheCounters] = {}
+        self.started = time.monotonic()
+
+    def track_cache(self, name: str, cache: CacheCounters) -> None:
+        self.caches[name] = cache
+
+    def observe(
+        self, method: str, duration: float, response_bytes: int, failed: bool
+    ) -> None:
+        if (handler := self.handlers.get(method)) is None:
+            handler = self.handlers[method] = HandlerStats()
+
+        handler.latency.observe(duration)
+        handler.response_bytes += response_bytes
+        handler.errors += failed
+
+    def measure_responses(self, protocol: JsonRPCProtocol) -> None:
+        """Add the size of the responses that ``protocol`` writes to the client
+        to the statistics of the handlers that answered the requests.
+
+        """
+        handle_request, send_data, set_writer = (
+            protocol._handle_request,
+            protocol._send_data,
+            protocol.set_writer,
+        )
+        # method of every request that was not answered yet by its id
+        methods: dict[Any, str] = {}
+        writer = _CountingWriter(protocol.writer)
+
+        def measuring_handle_request(
+            msg_id: Any, method_name: str, params: Any
+        ) -> None:
+            methods[msg_id] = method_name
+            handle_request(msg_id, method_name, params)
+
+        def measuring_send_data(data: Any) -> None:
+            # requests & notifications of the server have a method as well
+            if (
+                hasattr(data, "method")
+                or (method := methods.pop(getattr(data, "id", None), None)) is None
+            ):
+                send_data(data)
+                return
+
+            written = writer.written
+            send_data(data)
+            if (handler := self.handlers.get(method)) is not None:
+                handler.response_bytes += writer.written - written
+
+        def measuring_set_writer(new_writer: Any, include_headers: bool = True) -> None:
+            writer.writer = new_writer
+            set_writer(writer, include_headers)
+
+        if protocol.writer is not None:
+            protocol.writer = writer
+        protocol._handle_request = measuring_handle_request  # type: ignore[method-assign]
+        protocol._send_data = measuring_send_data  # type: ignore[method-assign]
+        protocol.set_writer = measuring_set_writer  # type: ignore[method-assign,assignment]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "uptimeSeconds": time.monotonic() - self.started,
+            "handlers": {
+                method: handler.as_dict()
+                for method, handler in sorted(list(self.handlers.items()))
+            },
+            "caches": {
+                name: {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "hitRate": (
+                        cache.hits / total
+                        if (total := cache.hits + cache.misses)
+                        else 0.0
+                    ),
+                }
+                for name, cache in sorted(list(self.caches.items()))
+            },
+        }
+
+    def prometheus_text(self) -> str:
+        """Render the statistics in the Prometheus text exposition format."""
+        latency = f"{_METRIC_PREFIX}_request_duration_seconds"
+        lines = [
+            f"# HELP {latency} Time spent in the LSP handlers.",
+            f"# TYPE {latency} histogram",
+        ]
+        handlers = sorted(list(self.handlers.items()))
+
+        for method, handler in handlers:
+            cumulative = 0
+            for bound, count in zip(
+                [str(bound) for bound in handler.latency.buckets] + ["+Inf"],
+                handler.latency.counts,
+            ):
+                cumulative += count
+                lines.append(
+                    f'{latency}_bucket{{method="{method}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{latency}_sum{{method="{method}"}} {handler.latency.sum}')
+            lines.append(f'{latency}_count{{method="{method}"}} {cumulative}')
+
+        for metric, help_text, attr in (
+            ("response_bytes_total", "Size of the LSP responses.", "response_bytes"),
+            ("request_errors_total", "Failed LSP requests.", "errors"),
+        ):
+            lines.append(f"# HELP {_METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {_METRIC_PREFIX}_{metric} counter")
+            lines.extend(
+                f'{_METRIC_PREFIX}_{metric}{{method="{method}"}} '
+                f"{getattr(handler, attr)}"
+                for method, handler in handlers
+            )
+
+        for kind in ("hits", "misses"):
+            metric = f"{_METRIC_PREFIX}_cache_{kind}_total"
+            lines.append(f"# HELP {metric} Cache {kind}.")
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(
+                f'{metric}{{cache="{name}"}} {getattr(cache, kind)}'
+                for name, cache in sorted(list(self.caches.items()))
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_file(self, path: str) -> None:
+        """Atomically replace ``path`` with the current statistics."""
+        with open(tmp_path := f"{path}.tmp", "w") as stats_file:
+            stats_file.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def start_prometheus_writer(
+        self, path: str, interval: float = STATS_WRITE_INTERVAL
+    ) -> threading.Event:
+        """Write the statistics to ``path`` every ``interval`` seconds in a
+        background thread until the returned event is set.
+
+        """
+        stop = threading.Event()
+
+        def write_periodically() -> None:
+            while not stop.wait(interval):
+                try:
+                    self.write_prometheus_file(path)
+                except OSError:
+                    pass
+
+        threading.Thread(
+            target=write_periodically, name="stats-writer", daemon=True
+        ).start()
+        return stop
+
+
+class _CountingWriter:
+    """Passes the data on to ``writer`` and counts the written bytes."""
+
+    def __init__(self, writer: Any) -> None:
+        self.writer = writer
+        self.written = 0
+
+    def write(self, data: bytes) -> Any:
+        self.written += len(data)
+        return self.writer.write(data)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.writer, name)
+
+
+def instrument(
+    handler: Callable[..., Any], method: str, stats: ServerStats
+) -> Callable[..., Any]:
+    """Wrap ``handler`` so that every call of it is recorded as ``method`` in
+    ``stats``. The size of its responses is recorded by
+    :py:meth:`ServerStats.measure_responses`.
+
+    """
+
+    def record(start: float, failed: bool) -> None:
+        stats.observe(method, time.perf_counter() - start, 0, failed)
+
+    if asyncio.iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def instrumented_coroutine(*args: Any, **kwargs: Any) -> Any:
+            start, failed = time.perf_counter(), True
+            try:
+                result = await handler(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                record(start, failed)
+
+        return instrumented_coroutine
+
+    @functools.wraps(handler)
+    def instrumented(*args: Any, **kwargs: Any) -> Any:
+        start, failed = time.perf_counter(), True
+        try:
+            result = handler(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            record(start, failed)
+
+    return instrumented
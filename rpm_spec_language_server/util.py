@@ -1,3 +1,5 @@
+import hashlib
+from collections.abc import Iterable
 from functools import reduce
 from re import Match
 from tempfile import TemporaryDirectory
@@ -5,6 +7,7 @@ from typing import Optional
 
 from lsprotocol.types import Position
 from specfile.exceptions import RPMException
+from specfile.macros import Macro
 from specfile.specfile import Specfile
 
 from rpm_spec_language_server.logging import LOGGER
@@ -30,14 +33,19 @@ def position_from_match(re_match: Match[str]) -> Position:
     return Position(line=line_count_before_match, character=character_pos)
 
 
-def spec_from_text(
-    spec_contents: str, file_name: Optional[str] = None
-) -> Optional[Specfile]:
+def parse_spec_text(
+    spec_contents: str,
+    file_name: Optional[str] = None,
+    sourcedir: Optional[str] = None,
+) -> tuple[Optional[Specfile], Optional[RPMException]]:
     """Load a specfile with the supplied contents and return a ``Specfile``
-    instance or ``None`` if the spec cannot be parsed.
+    instance and ``None`` or ``None`` and the ``RPMException`` if the spec
+    cannot be parsed.
 
     The optional ``file_name`` parameter can be used to set the file name of the
-    temporary spec that is used for parsing.
+    temporary spec that is used for parsing. ``sourcedir`` is the directory in
+    which the sources and the included files are looked up (defaults to the
+    temporary directory).
 
     """
     with TemporaryDirectory() as tmp_dir:
@@ -47,7 +55,36 @@ def spec_from_text(
             tmp_spec.write(spec_contents)
 
         try:
-            return Specfile(path)
+            return Specfile(path, sourcedir=sourcedir), None
         except RPMException as rpm_exc:
             LOGGER.debug("Failed to parse spec, got %s", rpm_exc)
-            return None
+            return None, rpm_exc
+
+
+def spec_from_text(
+    spec_contents: str, file_name: Optional[str] = None
+) -> Optional[Specfile]:
+    """Load a specfile with the supplied contents and return a ``Specfile``
+    instance or ``None`` if the spec cannot be parsed.
+
+    The optional ``file_name`` parameter can be used to set the file name of the
+    temporary spec that is used for parsing.
+
+    """
+    return parse_spec_text(spec_contents, file_name)[0]
+
+
+def content_hash(text: str) -> str:
+    """Return a stable hash of ``text``."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def macro_environment_fingerprint(macros: Iterable[Macro]) -> str:
+    """Return a stable hash of the macro definitions ``macros``, so that results
+    depending on the macro environment can be invalidated if it changes.
+
+    """
+    digest = hashlib.sha256()
+    for macro in sorted(macros, key=lambda m: m.name):
+        digest.update(f"{macro.name}\0{macro.options}\0{macro.body}\0".encode())
+    return digest.hexdigest()
@@ -0,0 +1,63 @@
+import os
+
+from benchmarks.corpus import CORPUS, SpecShape, generate_spec
+from benchmarks.latency import compare_results
+from benchmarks.load import rss_of
+
+
+def test_generated_specs_are_deterministic() -> None:
+    shape = SpecShape(subpackages=3, changelog_entries=20)
+
+    assert generate_spec(shape, seed=1) == generate_spec(shape, seed=1)
+    assert generate_spec(shape, seed=1) != generate_spec(shape, seed=2)
+
+
+def test_generated_spec_shape() -> None:
+    spec = generate_spec(
+        SpecShape(
+            subpackages=3,
+            scriptlets=2,
+            globals=4,
+            conditionals=2,
+            conditional_depth=3,
+            files=5,
+            changelog_entries=7,
+        )
+    )
+    lines = spec.splitlines()
+
+    assert sum(line.startswith("%package") for line in lines) == 3
+    assert sum(line.startswith("echo %{g_") for line in lines) == 2 * 4
+    assert sum(line.startswith("%global") for line in lines) == 4
+    assert sum(line.startswith("%if") for line in lines) == 2 * 3
+    assert sum(line.startswith("%endif") for line in lines) == 2 * 3
+    assert sum(line.startswith("%{_datadir}/") for line in lines) == 4 * 5
+    assert sum(line.startswith("* ") for line in lines) == 7
+    assert lines[lines.index("%changelog") + 1].startswith("* Mon Jan 01 2024 ")
+
+
+def test_huge_spec_size() -> None:
+    assert 50_000 < len(CORPUS["huge"].splitlines()) <= 100_000
+
+
+def test_compare_results() -> None:
+    def results(hover: float, completion: float) -> dict:
+        return {
+            "benchmarks": {
+                "small": {"hover": {"median": hover}},
+                "large": {"completion": {"median": completion}},
+            }
+        }
+
+    assert compare_results(results(1.0, 1.0), results(1.1, 0.5)) == []
+    assert compare_results(results(1.0, 1.0), results(1.5, 0.5)) == [
+        ("small", "hover", 0.5)
+    ]
+    assert compare_results(results(1.0, 1.0), results(1.1, 0.5), threshold=0.05) == [
+        ("small", "hover", 0.10000000000000009)
+    ]
+    assert compare_results({"benchmarks": {}}, results(5.0, 5.0)) == []
+
+
+def test_rss_of() -> None:
+    assert (rss_of(os.getpid()) or 0) > 0
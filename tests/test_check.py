@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+import pytest
+from rpm_spec_language_server.check import (
+    EXIT_FAILED,
+    EXIT_NO_SPECS,
+    EXIT_OK,
+    check_spec,
+    main,
+    spec_paths,
+)
+
+from tests.data import NOTMUCH_SPEC
+
+
+def test_spec_paths(tmp_path: Path) -> None:
+    (tmp_path / "b").mkdir()
+    for name in ("b/b.spec", "a.spec", "README.md"):
+        (tmp_path / name).write_text("")
+
+    assert list(spec_paths([str(tmp_path), "other.spec"])) == [
+        str(tmp_path / "a.spec"),
+        str(tmp_path / "b" / "b.spec"),
+        "other.spec",
+    ]
+
+
+def test_check_spec(tmp_path: Path) -> None:
+    (path := tmp_path / "notmuch.spec").write_text(NOTMUCH_SPEC)
+
+    record = check_spec(str(path))
+    assert record["ok"] and record["parsed"]
+    assert record["path"] == str(path)
+    assert record["sections"][0]["name"] == "package"
+    assert {"name": "Name", "line": 19} in record["tags"]
+
+
+def test_check_broken_spec(tmp_path: Path) -> None:
+    (path := tmp_path / "broken.spec").write_text("Name: broken\n%if 1\n")
+
+    record = check_spec(str(path))
+    assert not record["ok"]
+    assert record["diagnostics"][0]["severity"] == 1
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_check_main(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str], jobs: str
+) -> None:
+    (tmp_path / "notmuch.spec").write_text(NOTMUCH_SPEC)
+    assert main(["--jobs", jobs, str(tmp_path)]) == EXIT_OK
+
+    (tmp_path / "broken.spec").write_text("Name: broken\n%endif\n")
+    assert main(["--jobs", jobs, str(tmp_path)]) == EXIT_FAILED
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert sorted((r["path"], r["ok"]) for r in records[1:]) == [
+        (str(tmp_path / "broken.spec"), False),
+        (str(tmp_path / "notmuch.spec"), True),
+    ]
+
+
+def test_check_without_specs(tmp_path: Path) -> None:
+    assert main([str(tmp_path)]) == EXIT_NO_SPECS
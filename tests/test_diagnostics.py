@@ -0,0 +1,79 @@
+from lsprotocol.types import (
+    Diagnostic,
+    DiagnosticSeverity,
+    Position,
+    PublishDiagnosticsParams,
+    Range,
+)
+from rpm_spec_language_server.diagnostics import (
+    DiagnosticsPublisher,
+    diagnostics_from_rpm_exception,
+    spec_diagnostics,
+    unbalanced_conditionals,
+)
+from specfile.exceptions import RPMException
+
+_SPEC_LINES = ["Name: foo", "Foo: bar", "%if 0%{?suse_version}", "%endif"]
+
+
+def test_diagnostics_from_rpm_exception() -> None:
+    assert diagnostics_from_rpm_exception(
+        RPMException(
+            stderr=[
+                b"warning: bogus date in %changelog\n",
+                b"error: /tmp/tmpabc/foo.spec: line 2: Unknown tag: Foo: bar\n",
+            ]
+        ),
+        _SPEC_LINES,
+    ) == [
+        Diagnostic(
+            range=Range(Position(0, 0), Position(0, 9)),
+            message="bogus date in %changelog",
+            severity=DiagnosticSeverity.Warning,
+            source="rpm",
+        ),
+        Diagnostic(
+            range=Range(Position(1, 0), Position(1, 8)),
+            message="Unknown tag: Foo: bar",
+            severity=DiagnosticSeverity.Error,
+            source="rpm",
+        ),
+    ]
+
+
+def test_unbalanced_conditionals() -> None:
+    assert unbalanced_conditionals(_SPEC_LINES) == []
+    assert unbalanced_conditionals(["%endif", "%ifarch x86_64"]) == [
+        Diagnostic(
+            range=Range(Position(0, 0), Position(0, 6)),
+            message="%endif without a matching %if",
+            severity=DiagnosticSeverity.Error,
+            source="rpm",
+        ),
+        Diagnostic(
+            range=Range(Position(1, 0), Position(1, 14)),
+            message="Unclosed %ifarch x86_64",
+            severity=DiagnosticSeverity.Error,
+            source="rpm",
+        ),
+    ]
+
+
+def test_publisher_only_sends_changes() -> None:
+    published: list[PublishDiagnosticsParams] = []
+    publisher = DiagnosticsPublisher(published.append)
+
+    diagnostics = spec_diagnostics("%if 1\n")
+    assert len(diagnostics) == 1
+
+    publisher.schedule("file:///foo.spec", diagnostics, 1)
+    publisher.schedule("file:///foo.spec", spec_diagnostics("%if 1\n"), 2)
+    assert published == [
+        PublishDiagnosticsParams(
+            uri="file:///foo.spec", diagnostics=diagnostics, version=1
+        )
+    ]
+
+    publisher.clear("file:///foo.spec")
+    publisher.clear("file:///foo.spec")
+    assert len(published) == 2 and published[1].diagnostics == []
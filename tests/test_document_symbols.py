@@ -1,7 +1,18 @@
+import pickle
 from pathlib import Path
 
-from lsprotocol.types import DocumentSymbol, Position, Range, SymbolKind
-from rpm_spec_language_server.document_symbols import SpecSections
+from lsprotocol.types import (
+    DocumentSymbol,
+    FoldingRange,
+    FoldingRangeKind,
+    Position,
+    Range,
+    SymbolKind,
+)
+from rpm_spec_language_server.document_symbols import (
+    SpecSections,
+    conditional_folding_ranges,
+)
 from specfile.specfile import Specfile
 
 from .data import NOTMUCH_SPEC
@@ -30,3 +41,141 @@ def test_simple_spec_document_symbols(tmp_path: Path) -> None:
         range=Range(p := Position(84, 0), Position(88, 0)),
         selection_range=Range(p, Position(85, 0)),
     )
+
+
+def test_conditional_folding_ranges() -> None:
+    assert conditional_folding_ranges(
+        """%if 0%{?suse_version}
+BuildRequires: foo
+%ifarch x86_64
+BuildRequires: bar
+%endif
+%else
+BuildRequires: baz
+%endif
+%endif
+""".splitlines()
+    ) == [
+        FoldingRange(0, 4, kind=FoldingRangeKind.Region),
+        FoldingRange(2, 4, kind=FoldingRangeKind.Region),
+        FoldingRange(5, 7, kind=FoldingRangeKind.Region),
+    ]
+
+
+def test_spec_folding_ranges(tmp_path: Path) -> None:
+    with open((spec_path := tmp_path / "notmuch.spec"), "w") as spec:
+        spec.write(NOTMUCH_SPEC)
+
+    folding_ranges = SpecSections.parse(Specfile(str(spec_path))).folding_ranges
+
+    # %package and %description
+    assert FoldingRange(0, 73, kind=FoldingRangeKind.Region) in folding_ranges
+    assert FoldingRange(74, 83, kind=FoldingRangeKind.Region) in folding_ranges
+    # %if 0%{?is_opensuse} … %else … %endif
+    assert FoldingRange(47, 48, kind=FoldingRangeKind.Region) in folding_ranges
+    assert FoldingRange(49, 51, kind=FoldingRangeKind.Region) in folding_ranges
+
+
+def test_spec_sections_tags_and_lookup(tmp_path: Path) -> None:
+    with open((spec_path := tmp_path / "notmuch.spec"), "w") as spec:
+        spec.write(NOTMUCH_SPEC)
+
+    sections = SpecSections.parse(Specfile(str(spec_path)), NOTMUCH_SPEC)
+
+    assert sections.text == NOTMUCH_SPEC
+    assert sections.file_name == "notmuch.spec"
+
+    assert (name := sections.tag("name")) and name.range == Range(
+        Position(19, 0), Position(19, 23)
+    )
+    assert (version := sections.tag("VERSION")) and version.line == 20
+    assert sections.tag("does-not-exist") is None
+    # tags of subpackages are in the table as well
+    assert any(tag.line == 85 and tag.name == "Summary" for tag in sections.tags)
+
+    assert (sect := sections.section_under_cursor(Position(74, 3)))
+    assert sect.name == "description"
+    assert (sect := sections.section_under_cursor(Position(87, 0)))
+    assert sect.name == "package notmuch-devel"
+    assert sections.section_under_cursor(Position(100_000, 0)) is None
+
+
+def test_spec_sections_are_picklable(tmp_path: Path) -> None:
+    with open((spec_path := tmp_path / "notmuch.spec"), "w") as spec:
+        spec.write(NOTMUCH_SPEC)
+
+    sections = SpecSections.parse(Specfile(str(spec_path)), sourcedir=str(tmp_path))
+
+    unpickled = pickle.loads(pickle.dumps(sections))
+
+    assert unpickled == sections
+    assert unpickled.sourcedir == str(tmp_path)
+    # the Specfile is parsed again from the text of the spec
+    assert (spec := unpickled.parse_spec()) and spec.expand("%{name}") == "notmuch"
+    assert unpickled.to_document_symbols() == sections.to_document_symbols()
+    assert unpickled.section_under_cursor(Position(80, 0)) == (
+        sections.section_under_cursor(Position(80, 0))
+    )
+
+
+def test_scanned_sections_match_the_parsed_ones(tmp_path: Path) -> None:
+    with open((spec_path := tmp_path / "notmuch.spec"), "w") as spec:
+        spec.write(NOTMUCH_SPEC)
+
+    parsed = SpecSections.parse(Specfile(str(spec_path)), NOTMUCH_SPEC)
+    scanned = SpecSections.scan(NOTMUCH_SPEC, "notmuch.spec")
+
+    assert scanned.sections == parsed.sections
+    assert scanned.sections[2].name == "package notmuch-devel"
+    assert scanned.tags == parsed.tags
+    assert scanned.text == NOTMUCH_SPEC and scanned.file_name == "notmuch.spec"
+
+
+def test_scanned_sections_keep_the_expanded_name(tmp_path: Path) -> None:
+    text = "%global srcname notmuch\n" + NOTMUCH_SPEC.replace(
+        "Name:           notmuch", "Name: %{srcname}", 1
+    )
+    with open((spec_path := tmp_path / "notmuch.spec"), "w") as spec:
+        spec.write(text)
+
+    parsed = SpecSections.parse(Specfile(str(spec_path)), text)
+    assert parsed.sections[2].name == "package notmuch-devel"
+
+    # without a parse of the spec, the name is taken as it is written
+    scanned = SpecSections.scan(text, "notmuch.spec")
+    assert scanned.sections[2].name == "package %{srcname}-devel"
+
+    # while the spec is edited, the name of the last parse is kept
+    edited = text.replace("%package        doc", "%if\n%package        doc", 1)
+    scanned = SpecSections.scan(edited, "notmuch.spec", parsed=parsed)
+    assert scanned.sections[2].name == "package notmuch-devel"
+
+    renamed = edited.replace("Name: %{srcname}", "Name: %{srcname}2", 1)
+    scanned = SpecSections.scan(renamed, "notmuch.spec", parsed=parsed)
+    assert scanned.sections[2].name == "package %{srcname}2-devel"
+
+
+def test_scan_spec_that_rpm_cannot_parse() -> None:
+    sections = SpecSections.scan(
+        """Name:    hello
+%global long_macro \\
+%files
+
+%if 0%{?suse_version}
+%package -n libhello
+Summary: the library
+
+%description -n libhello
+%prep
+%files \\
+"""
+    )
+
+    assert [(s.name, s.starting_line, s.ending_line) for s in sections.sections] == [
+        ("package", 0, 5),
+        ("package libhello", 5, 8),
+        ("description libhello", 8, 9),
+        ("prep", 9, 11),
+    ]
+    assert (tag := sections.tag("summary")) and tag.line == 6
+    assert sections.section_under_cursor(Position(6, 2)) == sections.sections[1]
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from rpm_spec_language_server.includes import (
+    IncludeGraph,
+    include_stamp,
+    included_files,
+)
+
+
+def test_included_files() -> None:
+    assert included_files(
+        """Name: foo
+%include %{_sourcedir}/common.inc
+  %include  ../shared/macros.inc
+%include /usr/share/foo/bar.inc
+%include %{SOURCE1}
+%include %_sourcedir/common.inc
+echo %include
+""",
+        "/src/foo",
+    ) == [
+        "/src/foo/common.inc",
+        "/src/shared/macros.inc",
+        "/usr/share/foo/bar.inc",
+    ]
+
+
+def test_include_stamp_changes_with_the_file(tmp_path: Path) -> None:
+    (included := tmp_path / "common.inc").write_text("%global foo 1\n")
+    stamp = include_stamp([str(included)])
+    assert stamp == include_stamp([str(included)])
+
+    included.write_text("%global foo 10\n")
+    assert include_stamp([str(included)]) != stamp
+
+    included.unlink()
+    assert include_stamp([str(included)]) == f"{included}\0missing"
+    assert include_stamp([]) == ""
+
+
+def test_include_graph() -> None:
+    graph = IncludeGraph()
+    graph.set_includes("a.spec", ["b.inc"])
+    graph.set_includes("b.inc", ["c.inc"])
+    graph.set_includes("d.spec", ["c.inc", "b.inc"])
+    graph.set_includes("c.inc", [])
+
+    assert graph.transitive_includes("a.spec") == ["b.inc", "c.inc"]
+    assert graph.transitive_includes("d.spec") == ["c.inc", "b.inc"]
+
+    # everything comes after the files that it includes
+    assert (dependents := graph.dependents("c.inc"))[0] == "b.inc"
+    assert sorted(dependents[1:]) == ["a.spec", "d.spec"]
+    assert graph.dependents("a.spec") == []
+
+    graph.remove("d.spec")
+    assert "d.spec" not in graph
+    assert graph.dependents("c.inc") == ["b.inc", "a.spec"]
+
+
+def test_include_graph_with_cycles() -> None:
+    graph = IncludeGraph()
+    graph.set_includes("a.inc", ["b.inc"])
+    graph.set_includes("b.inc", ["a.inc"])
+
+    assert graph.transitive_includes("a.inc") == ["b.inc"]
+    assert graph.dependents("a.inc") == ["b.inc"]
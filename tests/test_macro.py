@@ -5,7 +5,15 @@ from urllib.parse import quote
 import pytest
 from lsprotocol.types import Position, TextDocumentIdentifier
 from rpm_spec_language_server.macros import (
+    LineMacroTokens,
+    MacroIndex,
+    MacroOccurrence,
+    MacroToken,
+    MacroTokenKind,
     get_macro_string_at_position,
+    is_valid_macro_name,
+    macro_occurrences_in_line,
+    tokenize_macros,
 )
 from rpm_spec_language_server.server import create_rpm_lang_server
 from specfile.macros import Macro, MacroLevel
@@ -24,6 +32,10 @@ from tests.data import NOTMUCH_SPEC
         ("echo 'foo' %dnl %{buildroot}", 24, None),
         ("%if %{?suse_version}", 7, "suse_version"),
         ("%if %{!?fedora}", 6, "fedora"),
+        ("%if %{!?fedora:%{?suse_version} foo}", 20, "suse_version"),
+        ("%if %{!?fedora:%{?suse_version} foo}", 33, "fedora"),
+        ("%(echo %{name}) %{version}", 2, None),
+        ("%global foo bar", 9, "foo"),
     ],
 )
 def test_macro_at_position(
@@ -32,6 +44,136 @@ def test_macro_at_position(
     assert get_macro_string_at_position(line, character) == macro_string
 
 
+@pytest.mark.parametrize(
+    "line,occurrences",
+    [
+        (
+            "Version: %{epoch}:%{version}",
+            [
+                MacroOccurrence("epoch", 0, 11, 16),
+                MacroOccurrence("version", 0, 20, 27),
+            ],
+        ),
+        ("%%deactivated", []),
+        ("echo 'foo' %dnl %{buildroot}", []),
+        (
+            "%if %{!?fedora:%{?suse_version}}",
+            [
+                MacroOccurrence("if", 0, 1, 3),
+                MacroOccurrence("fedora", 0, 8, 14),
+                MacroOccurrence("suse_version", 0, 18, 30),
+            ],
+        ),
+        (
+            "%global script hello-world.sh",
+            [
+                MacroOccurrence("global", 0, 1, 7),
+                MacroOccurrence("script", 0, 8, 14, is_definition=True),
+            ],
+        ),
+        (
+            "%undefine script",
+            [
+                MacroOccurrence("undefine", 0, 1, 9),
+                MacroOccurrence("script", 0, 10, 16),
+            ],
+        ),
+        (
+            "%if %{defined with_x} && %{undefined:with_y}",
+            [
+                MacroOccurrence("if", 0, 1, 3),
+                MacroOccurrence("defined", 0, 6, 13),
+                MacroOccurrence("with_x", 0, 14, 20),
+                MacroOccurrence("undefined", 0, 27, 36),
+                MacroOccurrence("with_y", 0, 37, 43),
+            ],
+        ),
+    ],
+)
+def test_macro_occurrences_in_line(
+    line: str, occurrences: list[MacroOccurrence]
+) -> None:
+    assert macro_occurrences_in_line(line, 0) == occurrences
+
+
+def test_tokenize_macros() -> None:
+    assert tokenize_macros("100%% %{?foo:%bar} %dnl %baz", 2) == [
+        MacroToken(MacroTokenKind.ESCAPE, 3, 5),
+        MacroToken(MacroTokenKind.MACRO, 6, 18, MacroOccurrence("foo", 2, 9, 12)),
+        MacroToken(MacroTokenKind.MACRO, 13, 17, MacroOccurrence("bar", 2, 14, 17)),
+        MacroToken(MacroTokenKind.COMMENT, 19, 28),
+    ]
+
+
+def test_line_macro_tokens() -> None:
+    line_tokens = LineMacroTokens.from_line(
+        (line := "%{!?a:%{?b:%c} x} %d " + "y" * 1000), 0
+    )
+
+    assert line_tokens.parents == (-1, 0, 1, -1)
+    assert [
+        token.occurrence.name if token and token.occurrence else None
+        for token in map(line_tokens.token_at, (0, 7, 12, 15, 17, 19, 100))
+    ] == ["a", "b", "c", "a", "a", "d", None]
+    assert line_tokens.token_at(len(line)) is None
+    assert LineMacroTokens.from_line("no macros").token_at(3) is None
+
+
+def test_macro_index() -> None:
+    index = MacroIndex.from_text(
+        """%define libversion 5
+Requires: libnotmuch%{libversion} = %version
+%files -n libnotmuch%libversion
+""",
+        version=3,
+    )
+
+    assert index.version == 3
+    assert index.definitions("libversion") == [
+        MacroOccurrence("libversion", 0, 8, 18, is_definition=True)
+    ]
+    assert index.references("libversion", include_definitions=False) == [
+        MacroOccurrence("libversion", 1, 22, 32),
+        MacroOccurrence("libversion", 2, 21, 31),
+    ]
+    assert index.occurrence_at(1, 43) == MacroOccurrence("version", 1, 37, 44)
+    assert index.occurrence_at(1, 3) is None
+    assert index.occurrence_at(1, 20) == MacroOccurrence("libversion", 1, 22, 32)
+    assert index.occurrence_at(5, 0) is None
+    # %define is a keyword and not a use of a macro
+    assert index.occurrence_at(0, 3) == MacroOccurrence("define", 0, 1, 7)
+    assert index.references("define") == []
+
+
+def test_replace_lines_of_the_macro_index() -> None:
+    old = "Name: foo\nVersion: %{ver}\n%build\nmake %{?_smp_mflags}\n"
+    new = "Name: foo\nVersion: 1\n%global ver 1\n%build\nmake %{?_smp_mflags}\n"
+
+    index = MacroIndex.from_text(old, 1).replace_lines(
+        1, 2, new.splitlines()[1:3], version=2
+    )
+    assert index == MacroIndex.from_text(new, 2)
+    assert index.definitions("ver") == [MacroOccurrence("ver", 2, 8, 11, True)]
+    assert index.occurrence_at(4, 8) == MacroOccurrence("_smp_mflags", 4, 8, 19)
+
+
+def test_macro_index_shares_the_tokens_of_equal_lines() -> None:
+    index = MacroIndex.from_text(
+        "%build\nmake %{?_smp_mflags}\n\nmake %{?_smp_mflags}\n"
+    )
+    assert index.lines[1] is index.lines[3]
+    assert [o.line for o in index.references("_smp_mflags")] == [1, 3]
+    assert index.occurrence_at(3, 8) == MacroOccurrence("_smp_mflags", 3, 8, 19)
+
+
+@pytest.mark.parametrize(
+    "name,valid",
+    [("foo", True), ("_foo_1", True), ("", False), ("1foo", False), ("foo-bar", False)],
+)
+def test_is_valid_macro_name(name: str, valid: bool) -> None:
+    assert is_valid_macro_name(name) == valid
+
+
 def test_get_macro_under_cursor_with_special_path(tmp_path: Path):
     """Regression test that we can have characters like `:` in the uri path
     (which get quoted).
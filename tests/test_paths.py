@@ -0,0 +1,86 @@
+import pytest
+from rpm_spec_language_server.paths import PathMapper, PathMapping
+
+
+def test_parse_mapping() -> None:
+    assert PathMapping.parse("/home/me/pkgs/=/pkgs") == PathMapping(
+        "/home/me/pkgs", "/pkgs"
+    )
+
+
+@pytest.mark.parametrize("mapping", ["/home/me/pkgs", "=/pkgs", "/home/me/pkgs="])
+def test_parse_invalid_mapping(mapping: str) -> None:
+    with pytest.raises(ValueError):
+        PathMapping.parse(mapping)
+
+
+def test_identity_mapper() -> None:
+    mapper = PathMapper()
+
+    assert mapper.is_identity
+    assert mapper.to_container("/src/foo/foo.spec") == "/src/foo/foo.spec"
+    assert mapper.spec_path_from_uri("file:///src/foo/foo.spec") == (
+        "/src/foo/foo.spec"
+    )
+    assert mapper.spec_path_from_uri("file:///src/foo/foo.changes") is None
+    assert mapper.spec_path_from_uri("untitled:foo.spec") is None
+
+
+def test_longest_prefix_wins() -> None:
+    mapper = PathMapper(
+        [
+            PathMapping("/home/me", "/home"),
+            PathMapping("/home/me/pkgs", "/pkgs"),
+        ]
+    )
+
+    assert mapper.to_container("/home/me/pkgs/foo/foo.spec") == "/pkgs/foo/foo.spec"
+    assert mapper.to_container("/home/me/other/bar.spec") == "/home/other/bar.spec"
+    # only whole path components are matched
+    assert mapper.to_container("/home/meh/baz.spec") == "/home/meh/baz.spec"
+
+
+def test_to_host() -> None:
+    mapper = PathMapper([PathMapping("/home/me/pkgs", "/pkgs")])
+
+    assert mapper.to_host("/pkgs/foo/foo.spec") == "/home/me/pkgs/foo/foo.spec"
+    assert mapper.to_host("/usr/lib/rpm/macros") == "/usr/lib/rpm/macros"
+    assert mapper.uri_from_path("/pkgs/foo bar/foo.spec") == (
+        "file:///home/me/pkgs/foo%20bar/foo.spec"
+    )
+
+
+def test_legacy_mount_path() -> None:
+    mapper = PathMapper(legacy_mount_path="/src")
+
+    assert not mapper.is_identity
+    assert mapper.to_container("/home/me/foo/foo.spec") == "/src/foo.spec"
+    assert mapper.container_directory("/home/me/foo") == "/src"
+
+
+def test_mappings_take_precedence_over_legacy_mount_path() -> None:
+    mapper = PathMapper([PathMapping("/home/me/pkgs", "/pkgs")], "/src")
+
+    assert mapper.to_container("/home/me/pkgs/foo/foo.spec") == "/pkgs/foo/foo.spec"
+    assert mapper.to_container("/tmp/bar.spec") == "/src/bar.spec"
+    assert mapper.container_directory("/home/me/pkgs") == "/pkgs"
+
+
+def test_resolved_uris_are_cached() -> None:
+    mapper = PathMapper([PathMapping("/home/me/pkgs", "/pkgs")])
+    uri = "file:///home/me/pkgs/foo/foo.spec"
+
+    assert mapper.spec_path_from_uri(uri) == "/pkgs/foo/foo.spec"
+    assert mapper._resolved == {uri: "/pkgs/foo/foo.spec"}
+
+
+def test_least_recently_resolved_uris_are_dropped() -> None:
+    mapper = PathMapper(cache_size=2)
+    first, second, third = (f"file:///pkgs/{name}.spec" for name in "abc")
+
+    mapper.spec_path_from_uri(first)
+    mapper.spec_path_from_uri(second)
+    mapper.spec_path_from_uri(first)
+    assert mapper.spec_path_from_uri(third) == "/pkgs/c.spec"
+
+    assert list(mapper._resolved) == [first, third]
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+from rpm_spec_language_server import persistent_cache
+from rpm_spec_language_server.persistent_cache import (
+    PersistentParseCache,
+    default_cache_path,
+)
+
+
+def test_default_cache_path(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", "/var/cache/me")
+    assert default_cache_path() == (
+        "/var/cache/me/rpm-spec-language-server/parse-cache.sqlite"
+    )
+
+
+def test_persistent_cache_survives_restarts(tmp_path: Path) -> None:
+    cache = PersistentParseCache(str(path := tmp_path / "cache" / "parse.sqlite"))
+    cache.put("a", {"sections": [1, 2, 3]})
+    assert cache.get("a") == {"sections": [1, 2, 3]}
+    assert cache.get("b") is None
+    cache.close()
+
+    cache = PersistentParseCache(str(path))
+    assert cache.get("a") == {"sections": [1, 2, 3]}
+    assert len(cache) == 1
+
+
+def test_entries_are_written_in_the_background(tmp_path: Path) -> None:
+    cache = PersistentParseCache(str(tmp_path / "parse.sqlite"))
+    for key in "abc":
+        cache.put_in_background(key, key * 10)
+    cache.flush()
+
+    assert len(cache) == 3 and cache.get("b") == "b" * 10
+
+    cache.close()
+    # writes after closing the cache are dropped
+    cache.put_in_background("d", "d")
+
+
+def test_persistent_cache_is_dropped_on_version_change(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    PersistentParseCache(str(path := tmp_path / "parse.sqlite")).put("a", "result")
+
+    monkeypatch.setattr(persistent_cache, "_cache_version", lambda: "0.0.0-other")
+    assert PersistentParseCache(str(path)).get("a") is None
+
+
+def test_persistent_cache_pruning(tmp_path: Path) -> None:
+    cache = PersistentParseCache(str(tmp_path / "parse.sqlite"))
+    for key in "abc":
+        cache.put(key, key * 1000)
+
+    # only the most recently used entry fits
+    cache.max_size = len(cache._db.execute("SELECT value FROM results").fetchone()[0])
+    with cache._db:
+        cache._db.execute("UPDATE results SET accessed = 1 WHERE key != 'b'")
+    cache.prune()
+    assert len(cache) == 1 and cache.get("b") == "b" * 1000
+
+    cache.max_age = 0
+    cache.prune()
+    assert len(cache) == 0
+
+
+def test_unreadable_entries_are_dropped(tmp_path: Path) -> None:
+    cache = PersistentParseCache(str(tmp_path / "parse.sqlite"))
+    with cache._db:
+        cache._db.execute(
+            "INSERT INTO results VALUES ('broken', x'00', 1, 1e12)",
+        )
+
+    assert cache.get("broken") is None
+    assert len(cache) == 0
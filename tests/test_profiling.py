@@ -0,0 +1,82 @@
+import asyncio
+import os
+import pstats
+from pathlib import Path
+
+from lsprotocol.types import SHUTDOWN
+from rpm_spec_language_server.profiling import HandlerProfiler
+
+
+def hover(params: int) -> int:
+    return sum(range(params))
+
+
+async def workspace_diagnostics(params: int) -> int:
+    await asyncio.sleep(0)
+    return params
+
+
+def test_profile_next_requests(tmp_path: Path) -> None:
+    handlers = {"textDocument/hover": hover, SHUTDOWN: hover}
+    profiler = HandlerProfiler(handlers, str(tmp_path))
+
+    profiler.start(requests=2)
+    assert profiler.active
+    assert handlers["textDocument/hover"] is not hover
+    assert handlers[SHUTDOWN] is hover
+
+    assert handlers["textDocument/hover"](10) == 45
+    assert profiler.active
+    assert handlers["textDocument/hover"](10) == 45
+
+    assert not profiler.active
+    assert handlers["textDocument/hover"] is hover
+
+    (profile,) = os.listdir(tmp_path)
+    assert profile.endswith("-textDocument_hover.prof")
+    assert pstats.Stats(str(tmp_path / profile)).total_calls > 0
+
+
+def test_profile_coroutines(tmp_path: Path) -> None:
+    handlers = {"workspace/diagnostic": workspace_diagnostics}
+    profiler = HandlerProfiler(handlers, str(tmp_path))
+
+    profiler.start()
+    assert asyncio.iscoroutinefunction(handlers["workspace/diagnostic"])
+    assert asyncio.run(handlers["workspace/diagnostic"](3)) == 3
+    assert profiler.active
+
+    (path,) = profiler.stop()
+    assert handlers["workspace/diagnostic"] is workspace_diagnostics
+    assert path.endswith("-workspace_diagnostic.prof")
+
+
+def blocking_call(params: int) -> int:
+    return sum(range(params))
+
+
+def test_profile_calls_in_other_threads(tmp_path: Path) -> None:
+    async def definition(params: int) -> int:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, profiler.in_thread(blocking_call), params
+        )
+
+    handlers = {"textDocument/definition": definition}
+    profiler = HandlerProfiler(handlers, str(tmp_path))
+
+    assert profiler.in_thread(blocking_call) is blocking_call
+    profiler.start(requests=1)
+    assert asyncio.run(handlers["textDocument/definition"](10)) == 45
+    assert not profiler.active
+
+    (profile,) = os.listdir(tmp_path)
+    stats = pstats.Stats(str(tmp_path / profile))
+    assert "blocking_call" in stats.get_stats_profile().func_profiles
+
+
+def test_stop_without_requests(tmp_path: Path) -> None:
+    profiler = HandlerProfiler({"textDocument/hover": hover}, str(tmp_path))
+
+    profiler.start(seconds=60)
+    assert profiler.stop() == []
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,74 @@
+import io
+
+from lsprotocol.types import TEXT_DOCUMENT_HOVER
+from pygls.lsp.server import LanguageServer
+from rpm_spec_language_server.recording import (
+    FROM_CLIENT,
+    FROM_SERVER,
+    SessionRecorder,
+    read_recording,
+)
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.data = b""
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def close(self) -> None:
+        pass
+
+
+def test_record_session() -> None:
+    protocol = LanguageServer("test", "v1").protocol
+    protocol.set_writer(writer := _Writer())
+    SessionRecorder(recording := io.StringIO()).attach(protocol)
+
+    request = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": TEXT_DOCUMENT_HOVER,
+        "params": {
+            "textDocument": {"uri": "file:///foo.spec"},
+            "position": {"line": 0, "character": 0},
+        },
+    }
+    assert protocol.structure_message(request).method == TEXT_DOCUMENT_HOVER
+    protocol._send_data({"jsonrpc": "2.0", "id": 1, "result": None})
+
+    recording.seek(0)
+    (t_request, d_request, m_request), (t_response, d_response, m_response) = list(
+        read_recording(recording)
+    )
+
+    assert (d_request, m_request) == (FROM_CLIENT, request)
+    assert (d_response, m_response) == (
+        FROM_SERVER,
+        {"jsonrpc": "2.0", "id": 1, "result": None},
+    )
+    assert 0 <= t_request <= t_response
+    assert writer.data.endswith(b'{"jsonrpc": "2.0", "id": 1, "result": null}')
+
+
+def test_nested_objects_are_not_recorded() -> None:
+    protocol = LanguageServer("test", "v1").protocol
+    SessionRecorder(recording := io.StringIO()).attach(protocol)
+
+    protocol.structure_message({"line": 0, "character": 0})
+
+    assert recording.getvalue() == ""
+
+
+def test_close_the_recording() -> None:
+    protocol = LanguageServer("test", "v1").protocol
+    protocol.set_writer(_Writer())
+    recorder = SessionRecorder(recording := io.StringIO())
+    recorder.attach(protocol)
+
+    recorder.close()
+    assert recording.closed
+
+    # messages after the end of the session are not recorded
+    protocol._send_data({"jsonrpc": "2.0", "id": 1, "result": None})
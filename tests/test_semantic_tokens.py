@@ -0,0 +1,132 @@
+import pytest
+from lsprotocol.types import SemanticTokensEdit
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.macros import MacroIndex
+from rpm_spec_language_server.semantic_tokens import (
+    SemanticToken,
+    TokenModifier,
+    TokenType,
+    encode_tokens,
+    semantic_tokens_edits,
+    tokenize,
+    tokenize_line,
+)
+
+_SPEC = """Name:           foo
+Requires(post): %{name}
+# a comment
+%global bar 1
+%if %{with tests}
+%description -n %{name}
+  %endif
+"""
+
+
+@pytest.mark.parametrize(
+    "line,tokens",
+    [
+        ("Name:           foo", [SemanticToken(0, 0, 4, TokenType.TAG)]),
+        (
+            "Requires(post): %{name}",
+            [
+                SemanticToken(0, 0, 8, TokenType.TAG),
+                SemanticToken(0, 18, 4, TokenType.MACRO),
+            ],
+        ),
+        ("  # a comment", [SemanticToken(0, 2, 11, TokenType.COMMENT)]),
+        (
+            "%global bar 1",
+            [
+                SemanticToken(0, 0, 7, TokenType.KEYWORD),
+                SemanticToken(0, 8, 3, TokenType.MACRO, TokenModifier.DEFINITION),
+            ],
+        ),
+        (
+            "%if %{with tests}",
+            [
+                SemanticToken(0, 0, 3, TokenType.KEYWORD),
+                SemanticToken(0, 6, 4, TokenType.MACRO),
+            ],
+        ),
+        (
+            "%description -n %{name}",
+            [
+                SemanticToken(0, 0, 12, TokenType.SECTION),
+                SemanticToken(0, 18, 4, TokenType.MACRO),
+            ],
+        ),
+        ("  %endif", [SemanticToken(0, 2, 6, TokenType.KEYWORD)]),
+        (
+            "echo 100%% %{name} %dnl %{foo}",
+            [
+                SemanticToken(0, 13, 4, TokenType.MACRO),
+                SemanticToken(0, 19, 11, TokenType.COMMENT),
+            ],
+        ),
+        ("Note: this is not a tag", []),
+    ],
+)
+def test_tokenize_line(line: str, tokens: list[SemanticToken]) -> None:
+    assert tokenize_line(line, 0) == tokens
+
+
+def test_encode_tokens() -> None:
+    assert encode_tokens(tokenize(_SPEC.splitlines()[:2])) == [
+        # Name
+        *(0, 0, 4, TokenType.TAG, 0),
+        # Requires
+        *(1, 0, 8, TokenType.TAG, 0),
+        # %{name}
+        *(0, 18, 4, TokenType.MACRO, 0),
+    ]
+
+
+def test_tokenize_with_the_macro_index() -> None:
+    lines = _SPEC.splitlines()
+    macro_lines = MacroIndex.from_text(_SPEC).lines
+
+    assert list(tokenize(lines, macro_lines=macro_lines)) == list(tokenize(lines))
+    assert list(tokenize(lines[3:5], 3, macro_lines)) == list(tokenize(lines[3:5], 3))
+
+
+def test_tags_are_only_highlighted_where_rpm_reads_them() -> None:
+    text = """Name: foo
+%description
+License: see COPYING
+%package devel
+License: MIT
+%files devel
+"""
+    lines, sections = text.splitlines(), SpecSections.scan(text)
+
+    assert [
+        token.line
+        for token in tokenize(lines, sections=sections)
+        if token.token_type == TokenType.TAG
+    ] == [0, 4]
+    assert [
+        token.line
+        for token in tokenize(lines[2:5], 2, sections=sections)
+        if token.token_type == TokenType.TAG
+    ] == [4]
+
+
+def test_semantic_tokens_edits() -> None:
+    old = encode_tokens(tokenize(_SPEC.splitlines()))
+
+    assert semantic_tokens_edits(old, old) == []
+
+    new = encode_tokens(tokenize(_SPEC.replace("bar", "foobar").splitlines()))
+    assert semantic_tokens_edits(old, new) == [
+        SemanticTokensEdit(
+            start=25,
+            delete_count=5,
+            data=[0, 8, 6, TokenType.MACRO, TokenModifier.DEFINITION],
+        )
+    ]
+
+    new = encode_tokens(tokenize(("\n" + _SPEC).splitlines()))
+    # only the first token moves, everything else is relative to it
+    assert semantic_tokens_edits(old, new) == [
+        SemanticTokensEdit(start=0, delete_count=5, data=[1, 0, 4, TokenType.TAG, 0])
+    ]
@@ -1,5 +1,7 @@
+import asyncio
 import re
 from os import getenv
+from pathlib import Path
 from time import sleep
 from typing import Callable, Optional, cast
 
@@ -7,32 +9,72 @@ import pytest
 from lsprotocol.types import (
     TEXT_DOCUMENT_COMPLETION,
     TEXT_DOCUMENT_DEFINITION,
+    TEXT_DOCUMENT_DIAGNOSTIC,
     TEXT_DOCUMENT_DID_CHANGE,
     TEXT_DOCUMENT_DID_CLOSE,
     TEXT_DOCUMENT_DID_OPEN,
+    TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT,
     TEXT_DOCUMENT_HOVER,
+    TEXT_DOCUMENT_PREPARE_RENAME,
+    TEXT_DOCUMENT_PUBLISH_DIAGNOSTICS,
+    TEXT_DOCUMENT_REFERENCES,
+    TEXT_DOCUMENT_RENAME,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA,
+    WORKSPACE_DIAGNOSTIC,
+    WORKSPACE_DID_CHANGE_WATCHED_FILES,
     CompletionContext,
     CompletionList,
     CompletionParams,
     CompletionTriggerKind,
     DefinitionParams,
     DidChangeTextDocumentParams,
+    DidChangeWatchedFilesParams,
     DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
+    DocumentDiagnosticParams,
+    DocumentHighlight,
+    DocumentHighlightKind,
+    DocumentHighlightParams,
+    FileChangeType,
+    FileEvent,
     Hover,
     HoverParams,
     Location,
     MarkupContent,
     MarkupKind,
     Position,
+    PrepareRenameParams,
+    PreviousResultId,
+    PublishDiagnosticsParams,
     Range,
+    ReferenceContext,
+    ReferenceParams,
+    RelatedFullDocumentDiagnosticReport,
+    RelatedUnchangedDocumentDiagnosticReport,
+    RenameParams,
+    SemanticTokens,
+    SemanticTokensDelta,
+    SemanticTokensDeltaParams,
+    SemanticTokensParams,
     TextDocumentContentChangeWholeDocument,
     TextDocumentIdentifier,
     TextDocumentItem,
+    TextEdit,
     VersionedTextDocumentIdentifier,
+    WorkspaceDiagnosticParams,
+    WorkspaceEdit,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
 )
+from pygls.exceptions import JsonRpcInvalidParams
 from pygls.lsp.server import LanguageServer
-from rpm_spec_language_server.server import RpmSpecLanguageServer
+from pygls.workspace import Workspace
+from rpm_spec_language_server.server import (
+    AnalysisTier,
+    RpmSpecLanguageServer,
+    create_rpm_lang_server,
+)
 
 from .conftest import CLIENT_SERVER_T
 
@@ -92,9 +134,10 @@ def test_in_memory_spec_sections(client_server: CLIENT_SERVER_T) -> None:
     sleep(_SLEEP_TIMEOUT)
 
     assert (
-        server.spec_files
-        and (uri := f"file://{path}") in server.spec_files
-        and str(server.spec_files[uri].spec) == _HELLO_SPEC
+        server.snapshots
+        and (uri := f"file://{path}") in server.snapshots
+        and server.snapshots[uri].sections.text == _HELLO_SPEC
+        and server.snapshots[uri].version == 0
     )
 
     client.protocol.notify(
@@ -118,7 +161,8 @@ def test_in_memory_spec_sections(client_server: CLIENT_SERVER_T) -> None:
     )
     sleep(_SLEEP_TIMEOUT)
 
-    assert str(server.spec_files[uri].spec) == new_content
+    assert server.snapshots[uri].sections.text == new_content
+    assert server.snapshots[uri].version == 1
 
     client.protocol.notify(
         TEXT_DOCUMENT_DID_CLOSE,
@@ -126,7 +170,7 @@ def test_in_memory_spec_sections(client_server: CLIENT_SERVER_T) -> None:
     )
     sleep(_SLEEP_TIMEOUT)
 
-    assert uri not in server.spec_files
+    assert uri not in server.snapshots
 
 
 _RPM_MACROS_FILE = "/usr/lib/rpm/macros"
@@ -146,6 +190,64 @@ with open(_RPM_MACROS_FILE, "r") as macros_file:
 assert bindir_define_line > 0, f"Could not find %_bindir in {_RPM_MACROS_FILE}"
 
 
+def test_burst_of_changes_keeps_the_latest_parse(
+    client_server: CLIENT_SERVER_T,
+) -> None:
+    client, server = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    # the specs are parsed in the background, a parse finishing after a newer
+    # change must not replace the result of the newer version
+    for version in range(1, 6):
+        client.protocol.notify(
+            TEXT_DOCUMENT_DID_CHANGE,
+            DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(
+                    version=version, uri=(uri := f"file://{path}")
+                ),
+                content_changes=[
+                    TextDocumentContentChangeWholeDocument(
+                        f"{_HELLO_SPEC}# revision {version}\n"
+                    )
+                ],
+            ),
+        )
+    sleep(_SLEEP_TIMEOUT)
+
+    assert (snapshot := server.snapshots[uri]).version == 5
+    assert snapshot.sections.text == f"{_HELLO_SPEC}# revision 5\n"
+
+
+def test_sections_of_specs_that_rpm_cannot_parse(
+    client_server: CLIENT_SERVER_T,
+) -> None:
+    client, server = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    client.protocol.notify(
+        TEXT_DOCUMENT_DID_CHANGE,
+        DidChangeTextDocumentParams(
+            text_document=VersionedTextDocumentIdentifier(
+                version=1, uri=(uri := f"file://{path}")
+            ),
+            content_changes=[
+                TextDocumentContentChangeWholeDocument(
+                    broken := f"%if 1\n\n\n{_HELLO_SPEC}"
+                )
+            ],
+        ),
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    # the sections follow the edit although the %if is not closed
+    assert (snapshot := server.snapshots[uri]).version == 1
+    assert snapshot.sections.text == broken
+    assert (description := snapshot.sections.sections[1]).name == "description"
+    assert description.starting_line == 9
+
+
 @pytest.mark.parametrize(
     "cursor_position,expected_ranges,defined_in_uri",
     [
@@ -417,3 +519,508 @@ def test_hover(
         )
     else:
         assert resp is None
+
+
+def test_hover_waits_for_the_semantic_analysis(
+    client_server: CLIENT_SERVER_T,
+) -> None:
+    client, server = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    assert server.feature_tiers[TEXT_DOCUMENT_HOVER] == AnalysisTier.SEMANTIC
+    assert server.feature_tiers[TEXT_DOCUMENT_COMPLETION] == AnalysisTier.SYNTACTIC
+
+    client.protocol.notify(
+        TEXT_DOCUMENT_DID_CHANGE,
+        DidChangeTextDocumentParams(
+            text_document=VersionedTextDocumentIdentifier(
+                version=1, uri=(uri := f"file://{path}")
+            ),
+            content_changes=[
+                TextDocumentContentChangeWholeDocument(
+                    text := _HELLO_SPEC.replace(
+                        "%global script hello-world.sh", "%global script bye.sh"
+                    )
+                )
+            ],
+        ),
+    )
+    # rpm analyzes the change only after a pause or once a feature needs it
+    resp = client.protocol.send_request(
+        TEXT_DOCUMENT_HOVER,
+        HoverParams(
+            text_document=TextDocumentIdentifier(uri=uri),
+            position=Position(line=15, character=9),
+        ),
+    ).result()
+
+    assert resp == Hover(
+        contents=MarkupContent(value="```bash\nbye.sh\n```", kind=MarkupKind.Markdown)
+    )
+    assert server.shared.parse_cache.get(
+        server.diagnostics_result_id(text, (), "hello_world.spec", "/home/me/specs")
+    )
+    assert server.snapshots[uri].version == 1
+
+
+def test_hover_and_definition_use_the_editor_buffer(
+    client_server: CLIENT_SERVER_T,
+) -> None:
+    """The positions of hover & definition requests refer to the current editor
+    buffer, even if it cannot be parsed and the last parsed spec is stale.
+
+    """
+    client, _ = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    # the unterminated %if breaks the parsing of the spec
+    client.protocol.notify(
+        TEXT_DOCUMENT_DID_CHANGE,
+        DidChangeTextDocumentParams(
+            text_document=VersionedTextDocumentIdentifier(
+                version=1, uri=(uri := f"file://{path}")
+            ),
+            content_changes=[
+                TextDocumentContentChangeWholeDocument(text="%if 1\n\n" + _HELLO_SPEC)
+            ],
+        ),
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    # %{version} in %build
+    position = Position(line=19, character=44)
+    hover = client.protocol.send_request(
+        TEXT_DOCUMENT_HOVER,
+        HoverParams(text_document=TextDocumentIdentifier(uri=uri), position=position),
+    ).result()
+    assert hover == Hover(
+        contents=MarkupContent(value="```bash\n1\n```", kind=MarkupKind.Markdown)
+    )
+
+    definition = client.protocol.send_request(
+        TEXT_DOCUMENT_DEFINITION,
+        DefinitionParams(
+            text_document=TextDocumentIdentifier(uri=uri), position=position
+        ),
+    ).result()
+    assert definition == [
+        Location(
+            uri=uri,
+            range=Range(
+                start=Position(line=3, character=0),
+                end=Position(line=3, character=13),
+            ),
+        )
+    ]
+
+
+@pytest.mark.parametrize("include_declaration", [True, False])
+def test_find_references(
+    client_server: CLIENT_SERVER_T, include_declaration: bool
+) -> None:
+    client, _ = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    resp = client.protocol.send_request(
+        TEXT_DOCUMENT_REFERENCES,
+        ReferenceParams(
+            text_document=TextDocumentIdentifier(uri=(uri := f"file://{path}")),
+            # position of %script in %build
+            position=Position(line=15, character=9),
+            context=ReferenceContext(include_declaration=include_declaration),
+        ),
+    ).result()
+
+    assert resp == (
+        [Location(uri, Range(Position(9, 8), Position(9, 14)))]
+        if include_declaration
+        else []
+    ) + [
+        Location(uri, Range(Position(10, 25), Position(10, 31))),
+        Location(uri, Range(Position(15, 7), Position(15, 13))),
+    ]
+
+
+def test_cancel_pending_work() -> None:
+    server = create_rpm_lang_server()
+    server.protocol._workspace = Workspace(None)
+    for path in (first := "/specs/first.spec", second := "/specs/second.spec"):
+        server.workspace.put_text_document(
+            TextDocumentItem(
+                uri=f"file://{path}", language_id="rpmspec", version=0, text=_HELLO_SPEC
+            )
+        )
+
+    async def schedule_and_cancel() -> None:
+        server.schedule_semantic_analysis(f"file://{first}")
+        assert (task := server.start_semantic_analysis(f"file://{second}"))
+
+        server.cancel_pending_work()
+        assert not server._semantic_timers and not server._semantic_tasks
+
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    asyncio.run(schedule_and_cancel())
+
+
+def test_find_references_in_the_workspace(
+    client_server: CLIENT_SERVER_T, tmp_path: Path
+) -> None:
+    client, server = client_server
+    server.protocol._workspace = Workspace(f"file://{tmp_path}")
+    server.index_workspace = True
+
+    (tmp_path / "common.spec").write_text("%global common 1\n")
+    open_spec_file(
+        client, (path := str(tmp_path / "hello_world.spec")), "Version: %{common}\n"
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    def find_references() -> list[Location]:
+        return client.protocol.send_request(
+            TEXT_DOCUMENT_REFERENCES,
+            ReferenceParams(
+                text_document=TextDocumentIdentifier(uri=f"file://{path}"),
+                position=Position(line=0, character=13),
+                context=ReferenceContext(include_declaration=True),
+            ),
+        ).result()
+
+    # the first request waits until the workspace is indexed
+    assert sorted(location.uri for location in find_references()) == [
+        f"file://{tmp_path}/common.spec",
+        f"file://{path}",
+    ]
+
+    # specs that were created later are picked up in the background
+    (tmp_path / "later.spec").write_text("Release: %common\n")
+    find_references()
+    sleep(_SLEEP_TIMEOUT)
+    assert f"file://{tmp_path}/later.spec" in [
+        location.uri for location in find_references()
+    ]
+
+
+def test_document_highlight(client_server: CLIENT_SERVER_T) -> None:
+    client, _ = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    resp = client.protocol.send_request(
+        TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT,
+        DocumentHighlightParams(
+            text_document=TextDocumentIdentifier(uri=f"file://{path}"),
+            # position of dest in the %define
+            position=Position(line=10, character=9),
+        ),
+    ).result()
+
+    assert resp == [
+        DocumentHighlight(
+            Range(Position(10, 8), Position(10, 12)), DocumentHighlightKind.Write
+        ),
+        DocumentHighlight(
+            Range(Position(22, 44), Position(22, 48)), DocumentHighlightKind.Read
+        ),
+    ]
+
+
+@pytest.mark.parametrize(
+    "position,expected_range",
+    [
+        # %script in %build
+        (Position(line=15, character=9), Range(Position(15, 7), Position(15, 13))),
+        # %{_bindir} is not defined in the spec
+        (Position(line=21, character=27), None),
+        # %{name} is a preamble tag and not a %global
+        (Position(line=17, character=34), None),
+    ],
+)
+def test_prepare_rename(
+    client_server: CLIENT_SERVER_T, position: Position, expected_range: Optional[Range]
+) -> None:
+    client, _ = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    resp = client.protocol.send_request(
+        TEXT_DOCUMENT_PREPARE_RENAME,
+        PrepareRenameParams(
+            text_document=TextDocumentIdentifier(uri=f"file://{path}"),
+            position=position,
+        ),
+    ).result()
+
+    assert resp == expected_range
+
+
+def test_rename(client_server: CLIENT_SERVER_T) -> None:
+    client, _ = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    resp = client.protocol.send_request(
+        TEXT_DOCUMENT_RENAME,
+        RenameParams(
+            text_document=TextDocumentIdentifier(uri=(uri := f"file://{path}")),
+            # script in the %global
+            position=Position(line=9, character=10),
+            new_name="launcher",
+        ),
+    ).result()
+
+    assert resp == WorkspaceEdit(
+        changes={
+            uri: [
+                TextEdit(Range(Position(9, 8), Position(9, 14)), "launcher"),
+                TextEdit(Range(Position(10, 25), Position(10, 31)), "launcher"),
+                TextEdit(Range(Position(15, 7), Position(15, 13)), "launcher"),
+            ]
+        }
+    )
+
+
+def test_rename_covers_all_uses(client_server: CLIENT_SERVER_T) -> None:
+    client, _ = client_server
+    open_spec_file(
+        client,
+        (path := "/home/me/specs/hello_world.spec"),
+        "%global with_x 1\n"
+        "%if %{defined with_x} && 0%{?with_x}\n"
+        "%endif\n"
+        "%undefine with_x\n",
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    def rename(new_name: str) -> WorkspaceEdit:
+        return client.protocol.send_request(
+            TEXT_DOCUMENT_RENAME,
+            RenameParams(
+                text_document=TextDocumentIdentifier(uri=f"file://{path}"),
+                position=Position(line=0, character=10),
+                new_name=new_name,
+            ),
+        ).result()
+
+    assert [edit.range for edit in rename("with_y").changes[f"file://{path}"]] == [
+        Range(Position(0, 8), Position(0, 14)),
+        Range(Position(1, 14), Position(1, 20)),
+        Range(Position(1, 29), Position(1, 35)),
+        Range(Position(3, 10), Position(3, 16)),
+    ]
+
+    with pytest.raises(JsonRpcInvalidParams, match="not a valid macro name"):
+        rename("with-y")
+
+
+def test_semantic_tokens_delta(client_server: CLIENT_SERVER_T) -> None:
+    client, _ = client_server
+    open_spec_file(client, (path := "/home/me/specs/hello_world.spec"), _HELLO_SPEC)
+    sleep(_SLEEP_TIMEOUT)
+
+    full = client.protocol.send_request(
+        TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
+        SemanticTokensParams(
+            text_document=TextDocumentIdentifier(uri=(uri := f"file://{path}"))
+        ),
+    ).result()
+    assert isinstance(full, SemanticTokens) and full.data and full.result_id
+
+    client.protocol.notify(
+        TEXT_DOCUMENT_DID_CHANGE,
+        DidChangeTextDocumentParams(
+            text_document=VersionedTextDocumentIdentifier(version=1, uri=uri),
+            content_changes=[
+                TextDocumentContentChangeWholeDocument(
+                    text=_HELLO_SPEC.replace("%script", "%{script}")
+                )
+            ],
+        ),
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    delta = client.protocol.send_request(
+        TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA,
+        SemanticTokensDeltaParams(
+            text_document=TextDocumentIdentifier(uri=uri),
+            previous_result_id=full.result_id,
+        ),
+    ).result()
+    assert isinstance(delta, SemanticTokensDelta) and len(delta.edits) == 1
+
+    # the delta must only replace the span of the changed tokens
+    edit = delta.edits[0]
+    assert 0 < edit.start and edit.start + edit.delete_count < len(full.data)
+
+    new_full = client.protocol.send_request(
+        TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
+        SemanticTokensParams(text_document=TextDocumentIdentifier(uri=uri)),
+    ).result()
+    assert (
+        full.data[: edit.start]
+        + (edit.data or [])
+        + full.data[edit.start + edit.delete_count :]
+        == new_full.data
+    )
+
+
+def test_publish_diagnostics(client_server: CLIENT_SERVER_T) -> None:
+    client, _ = client_server
+    published: list[PublishDiagnosticsParams] = []
+
+    @client.feature(TEXT_DOCUMENT_PUBLISH_DIAGNOSTICS)
+    def _diagnostics(params: PublishDiagnosticsParams) -> None:
+        published.append(params)
+
+    open_spec_file(
+        client,
+        (path := "/home/me/specs/hello_world.spec"),
+        _HELLO_SPEC.replace("%build", "%if 0\n%build"),
+    )
+    sleep(_SLEEP_TIMEOUT + 0.5)
+
+    assert len(published) == 1 and published[0].uri == (uri := f"file://{path}")
+    assert any(
+        d.message == "Unclosed %if 0" and d.range.start.line == 14
+        for d in published[0].diagnostics
+    )
+
+    # fix the spec via a burst of changes => only the final state is published
+    for version in range(1, 4):
+        client.protocol.notify(
+            TEXT_DOCUMENT_DID_CHANGE,
+            DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(version=version, uri=uri),
+                content_changes=[TextDocumentContentChangeWholeDocument(_HELLO_SPEC)],
+            ),
+        )
+    sleep(_SLEEP_TIMEOUT + 0.5)
+
+    assert len(published) == 2
+    assert published[1].diagnostics == [] and published[1].version == 3
+
+
+def test_pull_diagnostics(client_server: CLIENT_SERVER_T) -> None:
+    client, _ = client_server
+    open_spec_file(
+        client,
+        (path := "/home/me/specs/hello_world.spec"),
+        _HELLO_SPEC.replace("%build", "%if 0\n%build"),
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    report = client.protocol.send_request(
+        TEXT_DOCUMENT_DIAGNOSTIC,
+        DocumentDiagnosticParams(
+            text_document=TextDocumentIdentifier(uri=(uri := f"file://{path}"))
+        ),
+    ).result()
+    assert isinstance(report, RelatedFullDocumentDiagnosticReport)
+    assert report.result_id and report.items
+
+    unchanged = client.protocol.send_request(
+        TEXT_DOCUMENT_DIAGNOSTIC,
+        DocumentDiagnosticParams(
+            text_document=TextDocumentIdentifier(uri=uri),
+            previous_result_id=report.result_id,
+        ),
+    ).result()
+    assert unchanged == RelatedUnchangedDocumentDiagnosticReport(
+        result_id=report.result_id
+    )
+
+    workspace_report = client.protocol.send_request(
+        WORKSPACE_DIAGNOSTIC,
+        WorkspaceDiagnosticParams(
+            previous_result_ids=[PreviousResultId(uri=uri, value=report.result_id)]
+        ),
+    ).result()
+    assert workspace_report.items == [
+        WorkspaceUnchangedDocumentDiagnosticReport(
+            uri=uri, version=0, result_id=report.result_id
+        )
+    ]
+
+    workspace_report = client.protocol.send_request(
+        WORKSPACE_DIAGNOSTIC, WorkspaceDiagnosticParams(previous_result_ids=[])
+    ).result()
+    assert workspace_report.items == [
+        WorkspaceFullDocumentDiagnosticReport(
+            uri=uri, version=0, items=report.items, result_id=report.result_id
+        )
+    ]
+
+
+def test_changed_included_file_invalidates_the_spec(
+    client_server: CLIENT_SERVER_T, tmp_path: Path
+) -> None:
+    client, server = client_server
+    (included := tmp_path / "common.inc").write_text("%global common 1\n")
+    spec = f"%include {included}\n{_HELLO_SPEC}"
+    open_spec_file(client, (path := str(tmp_path / "hello_world.spec")), spec)
+    sleep(_SLEEP_TIMEOUT)
+
+    assert server.include_graph.includes(uri := f"file://{path}") == (str(included),)
+    result_id = server.diagnostics_result_id(
+        spec,
+        server.include_graph.transitive_includes(uri),
+        "hello_world.spec",
+        str(tmp_path),
+    )
+
+    included.write_text("%global common 10\n%global other 2\n")
+    client.protocol.notify(
+        WORKSPACE_DID_CHANGE_WATCHED_FILES,
+        DidChangeWatchedFilesParams(
+            changes=[FileEvent(uri=f"file://{included}", type=FileChangeType.Changed)]
+        ),
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    # the spec has been analyzed again with the new contents of the include
+    assert (
+        new_result_id := server.diagnostics_result_id(
+            spec,
+            server.include_graph.transitive_includes(uri),
+            "hello_world.spec",
+            str(tmp_path),
+        )
+    ) != result_id
+    assert server.shared.parse_cache.get(new_result_id)
+
+
+def test_nested_include_reparses_the_dependents(
+    client_server: CLIENT_SERVER_T, tmp_path: Path
+) -> None:
+    client, server = client_server
+    (nested := tmp_path / "nested.inc").write_text("%global nested 1\n")
+    (included := tmp_path / "common.inc").write_text(f"%include {nested}\n")
+    spec = f"%include {included}\n{_HELLO_SPEC}"
+    open_spec_file(client, (path := str(tmp_path / "hello_world.spec")), spec)
+    sleep(_SLEEP_TIMEOUT)
+
+    uri = f"file://{path}"
+    assert server.include_graph.transitive_includes(uri) == [
+        str(included),
+        str(nested),
+    ]
+    assert server.include_graph.dependents(str(nested)) == [str(included), uri]
+
+    nested.write_text("%global nested 10\n")
+    client.protocol.notify(
+        WORKSPACE_DID_CHANGE_WATCHED_FILES,
+        DidChangeWatchedFilesParams(
+            changes=[FileEvent(uri=f"file://{nested}", type=FileChangeType.Changed)]
+        ),
+    )
+    sleep(_SLEEP_TIMEOUT)
+
+    assert server.shared.parse_cache.get(
+        server.diagnostics_result_id(
+            spec, [str(included), str(nested)], "hello_world.spec", str(tmp_path)
+        )
+    )
@@ -0,0 +1,91 @@
+import asyncio
+from pathlib import Path
+
+from rpm_spec_language_server.persistent_cache import PersistentParseCache
+from rpm_spec_language_server.server import create_rpm_lang_server
+from rpm_spec_language_server.shared import (
+    ParseCache,
+    ParseResult,
+    SharedCaches,
+    deep_sizeof,
+)
+
+from .data import NOTMUCH_SPEC
+
+
+def test_parse_cache_evicts_least_recently_used() -> None:
+    cache = ParseCache(max_size=2)
+    results = [ParseResult(sections=None, diagnostics=[]) for _ in range(3)]
+
+    cache.put("a", results[0])
+    cache.put("b", results[1])
+    assert cache.get("a") is results[0]
+
+    cache.put("c", results[2])
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is results[0] and cache.get("c") is results[2]
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_parse_cache_falls_back_to_the_persistent_cache(tmp_path: Path) -> None:
+    persistent = PersistentParseCache(str(tmp_path / "parse.sqlite"))
+    ParseCache(persistent=persistent).put("a", ParseResult(None, []))
+    persistent.flush()
+
+    cache = ParseCache(persistent=persistent)
+    assert cache.get("a") == ParseResult(None, [])
+    assert cache.get("b") is None
+    assert (cache.hits, cache.persistent_hits, cache.misses) == (1, 1, 1)
+    assert len(cache) == 1
+
+
+def test_parse_cache_reads_the_persistent_cache_in_a_thread(tmp_path: Path) -> None:
+    persistent = PersistentParseCache(str(tmp_path / "parse.sqlite"))
+    ParseCache(persistent=persistent).put("a", ParseResult(None, []))
+    persistent.flush()
+
+    cache = ParseCache(persistent=persistent)
+    assert asyncio.run(cache.get_async("a")) == ParseResult(None, [])
+    assert asyncio.run(cache.get_async("a")) == ParseResult(None, [])
+    assert asyncio.run(cache.get_async("b")) is None
+    assert (cache.hits, cache.persistent_hits, cache.misses) == (2, 1, 1)
+
+
+def test_deep_sizeof() -> None:
+    shared_list = ["x" * 1000]
+    assert deep_sizeof({"a": shared_list}) > 1000
+    assert deep_sizeof({"a": shared_list}, exclude=[shared_list]) < 1000
+
+
+def test_sessions_share_caches() -> None:
+    shared = SharedCaches()
+    first = create_rpm_lang_server(shared=shared)
+    second = create_rpm_lang_server(shared=shared)
+
+    assert first.macros is second.macros
+    assert first.auto_complete_data is second.auto_complete_data
+
+    result_id, result = asyncio.run(first.analyze_text(NOTMUCH_SPEC, "notmuch.spec"))
+    assert result.sections and result.parsed
+    assert asyncio.run(second.analyze_text(NOTMUCH_SPEC, "notmuch.spec")) == (
+        result_id,
+        result,
+    )
+    assert shared.parse_cache.hits == 1
+
+
+def test_specs_are_cached_per_file_name_and_sourcedir(tmp_path: Path) -> None:
+    shared = SharedCaches()
+    server = create_rpm_lang_server(shared=shared)
+
+    result_ids = {
+        asyncio.run(server.analyze_text(NOTMUCH_SPEC, file_name, (), sourcedir))[0]
+        for file_name, sourcedir in (
+            ("notmuch.spec", None),
+            ("other.spec", None),
+            ("notmuch.spec", str(tmp_path)),
+        )
+    }
+    assert len(result_ids) == 3
+    assert shared.parse_cache.hits == 0
@@ -0,0 +1,28 @@
+from typing import Optional
+
+from rpm_spec_language_server.document_symbols import SpecSections
+from rpm_spec_language_server.snapshots import SpecSnapshot
+
+_URI = "file:///specs/foo.spec"
+
+
+def _snapshot(version: Optional[int], text: str = "Name: foo\n") -> SpecSnapshot:
+    return SpecSnapshot.parse(_URI, version, SpecSections(sections=(), text=text))
+
+
+def test_newer_versions_supersede_older_ones() -> None:
+    assert _snapshot(2).supersedes(_snapshot(1))
+    assert _snapshot(2).supersedes(_snapshot(2))
+    assert not _snapshot(1).supersedes(_snapshot(2))
+    assert _snapshot(1).supersedes(None)
+
+
+def test_the_spec_on_disk_never_replaces_the_editor_buffer() -> None:
+    assert not _snapshot(None).supersedes(_snapshot(0))
+    assert _snapshot(0).supersedes(_snapshot(None))
+    assert _snapshot(None).supersedes(_snapshot(None))
+
+
+def test_snapshot_matches_its_contents() -> None:
+    assert (snapshot := _snapshot(1, "Name: foo\n")).matches("Name: foo\n")
+    assert not snapshot.matches("Name: bar\n")
@@ -0,0 +1,128 @@
+import asyncio
+
+from lsprotocol.types import Position, Range
+from pygls.lsp.server import LanguageServer
+from pygls.protocol import JsonRPCRequestMessage
+from rpm_spec_language_server.server import create_rpm_lang_server
+from rpm_spec_language_server.shared import ParseCache
+from rpm_spec_language_server.stats import Histogram, ServerStats, instrument
+
+
+def test_histogram() -> None:
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == 2.65
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_instrument_sync_handler() -> None:
+    stats = ServerStats()
+
+    def handler(server: object, params: int) -> Range:
+        return Range(start=Position(0, 0), end=Position(0, params))
+
+    instrumented = instrument(handler, "test/sync", stats)
+
+    assert instrumented(None, 5) == handler(None, 5)
+    assert instrumented.__wrapped__ is handler  # type: ignore[attr-defined]
+
+    handler_stats = stats.handlers["test/sync"]
+    assert handler_stats.latency.count == 1
+    assert handler_stats.errors == 0
+
+
+class BytesWriter:
+    def __init__(self) -> None:
+        self.data = b""
+
+    def close(self) -> None:
+        pass
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+
+def test_measure_the_written_responses() -> None:
+    stats = ServerStats()
+    server = LanguageServer("test", "v1")
+
+    def handler(server: object, params: object) -> list[str]:
+        return ["x" * 100]
+
+    server.feature("test/sizes")(instrument(handler, "test/sizes", stats))
+    stats.measure_responses(server.protocol)
+    server.protocol.set_writer(writer := BytesWriter())
+
+    server.protocol.notify("test/notification", None)
+    assert writer.data and stats.handlers == {}
+
+    writer.data = b""
+    server.protocol.handle_message(
+        JsonRPCRequestMessage(id=1, method="test/sizes", params=None, jsonrpc="2.0")
+    )
+    assert b"x" * 100 in writer.data
+    assert stats.handlers["test/sizes"].response_bytes == len(writer.data)
+
+
+def test_instrument_async_handler_records_errors() -> None:
+    stats = ServerStats()
+
+    async def handler(server: object, params: int) -> None:
+        raise ValueError(params)
+
+    instrumented = instrument(handler, "test/async", stats)
+    assert asyncio.iscoroutinefunction(instrumented)
+
+    try:
+        asyncio.run(instrumented(None, 1))
+    except ValueError:
+        pass
+
+    assert stats.handlers["test/async"].latency.count == 1
+    assert stats.handlers["test/async"].errors == 1
+
+
+def test_stats_report_cache_hit_rate() -> None:
+    stats = ServerStats()
+    stats.track_cache("parse", cache := ParseCache())
+    cache.get("foo")
+    cache.hits += 3
+
+    assert stats.as_dict()["caches"] == {
+        "parse": {"hits": 3, "misses": 1, "hitRate": 0.75}
+    }
+
+
+def test_prometheus_text() -> None:
+    stats = ServerStats()
+    stats.observe("textDocument/hover", 0.002, 100, failed=False)
+    stats.track_cache("parse", ParseCache())
+
+    text = stats.prometheus_text()
+    duration = "rpm_spec_language_server_request_duration_seconds"
+    hover = 'method="textDocument/hover"'
+
+    assert f'{duration}_bucket{{{hover},le="0.0025"}} 1' in text
+    assert f"{duration}_count{{{hover}}} 1" in text
+    assert f"rpm_spec_language_server_response_bytes_total{{{hover}}} 100" in text
+    assert 'rpm_spec_language_server_cache_misses_total{cache="parse"} 0' in text
+
+
+def test_handlers_are_not_wrapped_without_stats() -> None:
+    plain = create_rpm_lang_server()
+    assert not any(
+        hasattr(getattr(f, "func", f), "__wrapped__")
+        for f in plain.protocol.fm.features.values()
+    )
+
+    instrumented = create_rpm_lang_server(stats=ServerStats())
+    assert all(
+        hasattr(getattr(f, "func", f), "__wrapped__")
+        for f in instrumented.protocol.fm.features.values()
+    )
@@ -5,7 +5,11 @@ from urllib.parse import quote
 import pytest
 from lsprotocol.types import Position, TextDocumentIdentifier
 from rpm_spec_language_server.server import create_rpm_lang_server
-from rpm_spec_language_server.util import position_from_match
+from rpm_spec_language_server.util import (
+    macro_environment_fingerprint,
+    position_from_match,
+)
+from specfile.macros import Macro, MacroLevel
 
 from tests.data import NOTMUCH_SPEC
 
@@ -66,3 +70,15 @@ def test_spec_from_text_with_special_path(tmp_path: Path) -> None:
 
     assert spec
     assert spec.name == "notmuch"
+
+
+def test_macro_environment_fingerprint() -> None:
+    foo = Macro("foo", None, "1", MacroLevel.MACROFILES, False)
+    bar = Macro("bar", None, "2", MacroLevel.MACROFILES, True)
+
+    assert macro_environment_fingerprint([foo, bar]) == macro_environment_fingerprint(
+        [bar, foo]
+    )
+    assert macro_environment_fingerprint([foo]) != macro_environment_fingerprint(
+        [Macro("foo", None, "2", MacroLevel.MACROFILES, False)]
+    )